@@ -0,0 +1,146 @@
+import argparse
+import csv
+import datetime
+import json
+import random
+import sys
+from constants import INSERT_COLUMNS
+
+# Reproducible synthetic ledger for testing and benchmarking.
+# Run from the repository root, e.g.:
+#   python -m InsertTestData.generate --rows 1000000                # bulk insert into cigars.db
+#   python -m InsertTestData.generate --rows 50000 --output big.csv # or write an import file
+
+# brand -> (country, lines), listed roughly from most to least reviewed, picked with a Zipf-like weighting
+BRANDS = {
+    'Padron': ('Nicaragua', ['1964 Anniversary', '1926 Serie', 'Family Reserve', 'Damaso']),
+    'Arturo Fuente': ('Dominican Republic', ['Hemingway', 'Opus X', 'Don Carlos', 'Rosado Sungrown']),
+    'Oliva': ('Nicaragua', ['Serie V', 'Serie V Melanio', 'Serie O', 'Master Blends 3']),
+    'My Father': ('Nicaragua', ['Le Bijou 1922', 'The Judge', 'Flor de las Antillas']),
+    'Davidoff': ('Dominican Republic', ['Winston Churchill', 'Millennium', 'Nicaragua', 'Grand Cru']),
+    'Drew Estate': ('Nicaragua', ['Liga Privada No 9', 'Undercrown', 'Herrera Esteli']),
+    'Cohiba': ('Dominican Republic', ['Red Dot', 'Blue', 'Riviera']),
+    'Rocky Patel': ('Honduras', ['Decade', 'Vintage 1990', 'Edge']),
+    'Perdomo': ('Nicaragua', ['Reserve 10th Anniversary', 'Double Aged', 'Habano Bourbon Barrel Aged']),
+    'Tatuaje': ('Nicaragua', ['Havana VI', 'Black Label', 'Reserva']),
+    'Plasencia': ('Nicaragua', ['Alma Fuerte', 'Reserva Original', 'Cosecha 146']),
+    'La Flor Dominicana': ('Dominican Republic', ['Double Ligero', 'Andalusian Bull', 'Air Bender']),
+    'Alec Bradley': ('Honduras', ['Prensado', 'Black Market', 'Magic Toast']),
+    'Camacho': ('Honduras', ['Corojo', 'Connecticut', 'Triple Maduro']),
+    'Montecristo': ('Dominican Republic', ['White Series', 'Platinum', 'Espada']),
+    'Aging Room': ('Dominican Republic', ['Quattro Nicaragua', 'Bin No 1']),
+}
+
+# vitola -> (ring gauges, weight)
+VITOLAS = {
+    'Robusto': ([50, 52], 30),
+    'Toro': ([50, 52, 54], 28),
+    'Churchill': ([47, 48, 50], 8),
+    'Corona': ([42, 44], 8),
+    'Gordo': ([58, 60], 9),
+    'Belicoso': ([52, 54], 6),
+    'Torpedo': ([52], 5),
+    'Lancero': ([38, 40], 3),
+    'Petit Corona': ([40, 42], 3),
+}
+
+WRAPPERS = [('Habano', 25), ('Maduro', 20), ('Connecticut', 15), ('Corojo', 10), ('Sumatra', 8),
+            ('Cameroon', 7), ('San Andres', 8), ('Candela', 2), ('Ecuador Habano', 5)]
+FILLERS = ['Nicaragua', 'Dominican Republic', 'Honduras', 'Nicaragua Dominican Republic', 'Peru Nicaragua']
+HUMIDORS = [('Office', 40), ('Home Desktop', 30), ('Tupperdor', 20), ('Travel Case', 10)]
+TAGS = [('maduro', 18), ('box-press', 10), ('full-body', 15), ('medium-body', 20), ('mild', 8),
+        ('limited', 5), ('gift', 6), ('aged', 7), ('peppery', 9), ('smooth', 12), ('value', 10)]
+NOTES_WORDS = ['cedar', 'leather', 'cocoa', 'coffee', 'pepper', 'earth', 'cream', 'nutty', 'sweet',
+               'spice', 'toast', 'espresso', 'caramel', 'hay', 'floral', 'citrus', 'draw', 'burn',
+               'even', 'razor', 'sharp', 'finish', 'long', 'smooth', 'bold', 'balanced', 'retrohale']
+# ratings lean towards 3 and 4 like a real ledger does
+RATINGS = [(1, 3), (2, 8), (3, 30), (4, 42), (5, 17)]
+
+FIRST_DATE = datetime.date(2015, 1, 1)
+LAST_DATE = datetime.date(2025, 12, 31)
+
+
+def _weights(pairs):
+    return [value for value, _ in pairs], [weight for _, weight in pairs]
+
+def GenerateReviews(count, seed=0):
+    """
+    Yield count synthetic reviews as 14-value tuples in INSERT_QUERY column order.
+
+    The same seed always produces the same ledger, and every row passes validate.validate_record.
+
+    Args:
+        count (int): number of reviews to generate
+        seed (int): random seed
+    """
+    rng = random.Random(seed)
+    brands = list(BRANDS)
+    brand_weights = [1 / rank for rank in range(1, len(brands) + 1)]
+    vitolas = list(VITOLAS)
+    vitola_weights = [VITOLAS[vitola][1] for vitola in vitolas]
+    wrappers, wrapper_weights = _weights(WRAPPERS)
+    humidors, humidor_weights = _weights(HUMIDORS)
+    tags, tag_weights = _weights(TAGS)
+    ratings, rating_weights = _weights(RATINGS)
+    day_span = (LAST_DATE - FIRST_DATE).days
+
+    for _ in range(count):
+        brand = rng.choices(brands, brand_weights)[0]
+        country, lines = BRANDS[brand]
+        vitola = rng.choices(vitolas, vitola_weights)[0]
+        rating = rng.choices(ratings, rating_weights)[0]
+        # prices are roughly log-normal around $12, pricier cigars tend to score a little higher
+        price_cents = int(rng.lognormvariate(7.1 + 0.05 * rating, 0.45)) if rng.random() < 0.9 else None
+        review_tags = sorted(set(rng.choices(tags, tag_weights, k=rng.randint(0, 3))))
+        notes = " ".join(rng.choice(NOTES_WORDS) for _ in range(rng.randint(4, 24))) if rng.random() < 0.85 else None
+
+        yield (
+            brand,
+            rng.choice(lines),
+            vitola,
+            rng.choice(VITOLAS[vitola][0]),
+            country,
+            rng.choices(wrappers, wrapper_weights)[0],
+            rng.choice([None, country]),
+            rng.choice([None] + FILLERS),
+            (FIRST_DATE + datetime.timedelta(days=rng.randint(0, day_span))).isoformat(),
+            rating,
+            notes,
+            price_cents,
+            rng.choices(humidors, humidor_weights)[0] if rng.random() < 0.95 else None,
+            ",".join(review_tags) or None,
+        )
+
+def WriteReviews(path, count, seed=0):
+    """Write count synthetic reviews to a CSV or JSONL file that importer.py can load."""
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for row in GenerateReviews(count, seed):
+                output.write(json.dumps(dict(zip(INSERT_COLUMNS, row))) + "\n")
+        else:
+            writer = csv.writer(output)
+            writer.writerow(INSERT_COLUMNS)
+            writer.writerows(GenerateReviews(count, seed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic cigar ledger.")
+    parser.add_argument("--rows", type=int, default=10000, help="number of reviews to generate")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--output", help="write a .csv or .jsonl file instead of inserting into the database")
+    parser.add_argument("--database", help="database file to insert into (defaults to DATABASE_NAME)")
+    args = parser.parse_args()
+
+    if args.output:
+        WriteReviews(args.output, args.rows, args.seed)
+        print(f"Wrote {args.rows} synthetic reviews to {args.output}.")
+        sys.exit(0)
+
+    import db
+    if args.database:
+        db.UseDatabase(args.database)
+    db.InitializeDatabase()
+    try:
+        db.BulkAddCigarReviews(GenerateReviews(args.rows, args.seed))
+    finally:
+        db.CloseDatabaseConnection()
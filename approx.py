@@ -0,0 +1,394 @@
+import hashlib
+import json
+import math
+import random
+import time
+import db
+from constants import (APPROX_SAMPLE_SIZE, APPROX_QUANTILES, APPROX_DISTINCT_COLUMNS, HLL_PRECISION, APPROX_CONFIDENCE_Z,
+                       APPROX_SKETCH_STALE_FRACTION, ALL_COLUMNS, FETCH_PAGE_SIZE, SUMMARY_DIMENSIONS)
+from query import CompileReviewFilters
+
+# Approximate analytics for quick overviews of very large ledgers, e.g.
+#   stats = approx.ApproximateStats()
+#   stats['rating_mean']          -> (4.02, 0.02)       estimate and 95% margin of error
+#   stats['distinct']['brand']    -> (118, 4)
+#
+# Rating and price statistics are computed from a uniform random sample of the reviews instead of every row.
+# Without filters the sample is drawn by probing random ids (a primary key seek each), so its cost depends on
+# the sample size and not on the size of the ledger. With filters the matching reviews are streamed once and
+# a reservoir keeps a uniform sample of them. Distinct counts avoid a pass over the whole ledger too: brand and
+# country are read exactly from their trigger maintained summary tables, other columns such as line from a
+# HyperLogLog sketch stored in review_sketches that is built once and then only reads the review_changes written
+# since (LedgerSketch). With filters the matching reviews are read for the reservoir anyway, so sketches of them
+# are filled in that same pass. Sketches hold fixed size registers however many distinct values there are, and
+# sketches of separate passes (other filters, other ledgers) can be merged into the count of their union.
+# ExactStats computes the same numbers exactly for comparison.
+
+
+class HyperLogLog:
+    """Fixed-memory distinct count estimate, with a relative standard error of 1.04 / sqrt(2**precision)."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def Add(self, value):
+        # a stable 64 bit hash, so sketches built in different processes can be merged
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def Merge(self, other):
+        """Fold another sketch of the same precision into this one (the union of both value sets)."""
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged")
+        self.registers = bytearray(max(mine, theirs) for mine, theirs in zip(self.registers, other.registers))
+
+    def Count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        empty = self.registers.count(0)
+        # the raw estimate is biased for small sets, linear counting over the empty registers is exact-ish there
+        if estimate <= 2.5 * m and empty:
+            estimate = m * math.log(m / empty)
+        return round(estimate)
+
+
+def _ProbeSample(cursor, size, columns, rng):
+    # probe random ids until size existing reviews are found, deleted ids are simply missed and redrawn
+    cursor.execute("SELECT MIN(id), MAX(id) FROM cigar_reviews")
+    low, high = cursor.fetchone()
+    if low is None:
+        return []
+    select_sql = f"SELECT {', '.join(columns)} FROM cigar_reviews"
+    if high - low + 1 <= size:
+        cursor.execute(select_sql)
+        return cursor.fetchall()
+    select_sql += " WHERE id IN (SELECT value FROM json_each(?))"
+
+    sample = []
+    tried = set()
+    span = high - low + 1
+    density = 1.0
+    while len(sample) < size and len(tried) < span:
+        wanted = min(span - len(tried), math.ceil((size - len(sample)) / density * 1.1))
+        ids = set()
+        while len(ids) < wanted:
+            id = rng.randint(low, high)
+            if id not in tried:
+                ids.add(id)
+        tried.update(ids)
+        cursor.execute(select_sql, (json.dumps(list(ids)),))
+        found = cursor.fetchall()
+        sample.extend(found)
+        # re-estimate how many ids are still in use, so a ledger with many deletions takes few rounds
+        density = max(len(sample) / len(tried), 0.01)
+    rng.shuffle(sample)
+    return sample[:size]
+
+def SampleReviews(size=APPROX_SAMPLE_SIZE, columns=None, filters=None, seed=None):
+    """
+    Return a uniform random sample of reviews.
+
+    Args:
+        size (int): number of reviews to sample, every review when fewer match
+        columns (list): column names to select in that order, all columns when None
+        filters (dict): optional Query Reviews filters, see query.py
+        seed (int): makes the sample repeatable
+
+    Returns:
+        tuple: (rows, population) where population is the number of reviews the sample was drawn from,
+               None when it was not counted (unfiltered samples do not scan the ledger)
+    """
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    columns = db._ProjectedColumns(columns)
+    rng = random.Random(seed)
+    where_sql, _ = CompileReviewFilters(filters)
+    if where_sql == "1":
+        with db.Transaction() as cursor:
+            return _ProbeSample(cursor, size, columns, rng), None
+
+    return _Reservoir(size, columns, filters, rng)[:2]
+
+def _AddPage(sketches, rows, offset):
+    # adding a value twice never changes a sketch, so each page is de-duplicated before hashing
+    for index, sketch in enumerate(sketches.values(), start=offset):
+        values = {row[index] for row in rows}
+        values.discard(None)
+        values.discard('')
+        for value in {value.casefold() if isinstance(value, str) else value for value in values}:
+            sketch.Add(value)
+
+def _Reservoir(size, columns, filters, rng, sketch_columns=(), precision=HLL_PRECISION):
+    # reservoir sampling (Algorithm R): after n rows every one of them is in the reservoir with probability size / n,
+    # the same pass can fill sketches of sketch_columns so filtered overviews read the matching reviews only once
+    reservoir = []
+    population = 0
+    sketches = {column: HyperLogLog(precision) for column in sketch_columns}
+    width = len(columns)
+    for page in db.FetchCigarReviewPages(page_size=FETCH_PAGE_SIZE, columns=list(columns) + list(sketch_columns), filters=filters):
+        if sketches:
+            _AddPage(sketches, page, width)
+        for row in page:
+            population += 1
+            if len(reservoir) < size:
+                reservoir.append(row[:width])
+            else:
+                slot = rng.randrange(population)
+                if slot < size:
+                    reservoir[slot] = row[:width]
+    return reservoir, population, sketches
+
+def _CheckColumns(columns):
+    unknown = [column for column in columns if column not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown cigar_reviews column(s): {', '.join(unknown)}")
+
+def SketchDistinct(columns=APPROX_DISTINCT_COLUMNS, filters=None, precision=HLL_PRECISION):
+    """
+    Stream the values of some columns into one HyperLogLog sketch per column.
+
+    The reviews are read once in pages, whatever the number of columns, and only the sketches and the current
+    page are held in memory. Values are compared case-insensitively like the filters.
+
+    Args:
+        columns (list): cigar_reviews columns to sketch
+        filters (dict): optional Query Reviews filters, see query.py
+        precision (int): sketch precision, 2**precision one byte registers per column
+
+    Returns:
+        dict: column name to its HyperLogLog sketch
+    """
+    _CheckColumns(columns)
+    where_sql, params = CompileReviewFilters(filters)
+    sketches = {column: HyperLogLog(precision) for column in columns}
+    with db.Transaction() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM cigar_reviews WHERE {where_sql}", params)
+        while True:
+            rows = cursor.fetchmany(FETCH_PAGE_SIZE)
+            if not rows:
+                break
+            _AddPage(sketches, rows, 0)
+    return sketches
+
+def LedgerSketch(column, precision=HLL_PRECISION, stale_fraction=APPROX_SKETCH_STALE_FRACTION):
+    """
+    Return the stored sketch of one column over the whole ledger, brought up to date from the change log.
+
+    The first call builds it with a SketchDistinct pass and stores it in review_sketches, later calls only
+    read the review_changes written since. A sketch cannot forget a value, so deletes and edits of the column
+    are counted as stale (each may have removed one distinct value) and the sketch is rebuilt once they pass
+    stale_fraction of the reviews, or when the changes it needs have been pruned.
+
+    Args:
+        column (str): cigar_reviews column
+        precision (int): sketch precision, a stored sketch of another precision is rebuilt
+        stale_fraction (float): share of the reviews that may be stale before a rebuild
+
+    Returns:
+        tuple: (sketch, stale) where stale bounds how far the sketch may overcount
+    """
+    _CheckColumns([column])
+    with db.Transaction() as cursor:
+        current_seq = db._ChangeSequence(cursor)
+        cursor.execute("SELECT precision, registers, last_seq, stale FROM review_sketches WHERE name = ?", (column,))
+        stored = cursor.fetchone()
+        sketch = None
+        if stored is not None and stored[0] == precision and stored[2] <= current_seq:
+            sketch, stale = HyperLogLog(precision), stored[3]
+            sketch.registers = bytearray(stored[1])
+            last_seq = stored[2]
+            if current_seq > last_seq:
+                cursor.execute("SELECT MIN(seq) FROM review_changes")
+                first_seq = cursor.fetchone()[0]
+                if first_seq is None or first_seq > last_seq + 1:
+                    # PruneReviewChanges removed changes the sketch never saw
+                    sketch = None
+            if sketch is not None:
+                cursor.execute(f"""SELECT review_changes.operation, review_changes.changed_columns, cigar_reviews.{column}
+                    FROM review_changes LEFT JOIN cigar_reviews ON cigar_reviews.id = review_changes.review_id
+                    WHERE review_changes.seq > ?""", (last_seq,))
+                while True:
+                    changes = cursor.fetchmany(FETCH_PAGE_SIZE)
+                    if not changes:
+                        break
+                    edited = [change for change in changes
+                              if change[0] == 'update' and column in (change[1] or '').split(',')]
+                    stale += len(edited) + sum(1 for change in changes if change[0] == 'delete')
+                    _AddPage({column: sketch}, [change[2:] for change in changes if change[0] == 'insert'] + [change[2:] for change in edited], 0)
+                cursor.execute(f"SELECT COALESCE(SUM(review_count), 0) FROM {SUMMARY_DIMENSIONS[0]}_summary")
+                if stale > cursor.fetchone()[0] * stale_fraction:
+                    sketch = None
+
+        if sketch is None:
+            print(f"Building the {column} sketch...")
+            sketch, stale = SketchDistinct([column], precision=precision)[column], 0
+        cursor.execute("INSERT OR REPLACE INTO review_sketches (name, precision, registers, last_seq, stale) VALUES (?, ?, ?, ?, ?)",
+                       (column, precision, bytes(sketch.registers), current_seq, stale))
+    return sketch, stale
+
+def _SummaryDistinct(dimension):
+    # the trigger maintained summary tables hold one row per distinct value ('' for none), exact in O(groups)
+    with db.Transaction() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {dimension}_summary WHERE {dimension} <> ''")
+        return cursor.fetchone()[0]
+
+def _Population(filters):
+    # the summary tables hold the exact review count in O(brands) rows, so only filtered counts scan
+    where_sql, params = CompileReviewFilters(filters)
+    with db.Transaction() as cursor:
+        if where_sql == "1":
+            cursor.execute(f"SELECT COALESCE(SUM(review_count), 0) FROM {SUMMARY_DIMENSIONS[0]}_summary")
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM cigar_reviews WHERE {where_sql}", params)
+        return cursor.fetchone()[0]
+
+def _Mean(values, population, z):
+    # mean with a margin of error, narrowed by the finite population correction as the sample approaches the whole
+    n = len(values)
+    if n == 0:
+        return None
+    mean = sum(values) / n
+    if n < 2 or population is None or n >= population:
+        return (round(mean, 3), 0.0 if population is not None and n >= population else None)
+    variance = sum((value - mean) ** 2 for value in values) / (n - 1)
+    correction = (population - n) / (population - 1)
+    return (round(mean, 3), round(z * math.sqrt(variance / n * correction), 3))
+
+def _Quantiles(values, quantiles, z):
+    # each quantile with a distribution-free confidence interval from the binomial order statistics
+    values = sorted(values)
+    n = len(values)
+    result = {}
+    for q in quantiles:
+        if n == 0:
+            result[q] = None
+            continue
+        spread = z * math.sqrt(n * q * (1 - q))
+        low = max(0, math.floor(n * q - spread) - 1)
+        high = min(n - 1, math.ceil(n * q + spread) - 1)
+        result[q] = (values[min(n - 1, max(0, math.ceil(n * q) - 1))], (values[low], values[high]))
+    return result
+
+def ApproximateStats(sample_size=APPROX_SAMPLE_SIZE, filters=None, seed=None, quantiles=APPROX_QUANTILES,
+                     distinct_columns=APPROX_DISTINCT_COLUMNS, z=APPROX_CONFIDENCE_Z):
+    """
+    Estimate the headline statistics of the ledger from a sample, the summary tables and sketches.
+
+    Every estimate comes with its error bound at the confidence given by z (95% by default).
+
+    Args:
+        sample_size (int): number of reviews sampled for the rating and price statistics
+        filters (dict): optional Query Reviews filters, see query.py
+        seed (int): makes the sample repeatable
+        quantiles (list): quantiles of rating and price to estimate, e.g. [0.5, 0.9]
+        distinct_columns (list): columns whose distinct values are counted, exactly from a summary table when
+                                 unfiltered and with a sketch otherwise
+        z (float): z score of the error bounds
+
+    Returns:
+        dict: reviews, sample_size, rating_mean and price_mean as (estimate, margin),
+              rating_histogram as {rating: (share, margin)}, rating_quantiles and price_quantiles as
+              {q: (estimate, (low, high))}, distinct as {column: (estimate, margin)} and seconds
+    """
+    print(f"Estimating review statistics from a sample of {sample_size}...")
+    start = time.perf_counter()
+    _CheckColumns(distinct_columns)
+    where_sql, _ = CompileReviewFilters(filters)
+    distinct = {}
+    if where_sql == "1":
+        rows, population = SampleReviews(sample_size, columns=['rating', 'price_cents'], seed=seed)
+        population = _Population(filters)
+        for column in distinct_columns:
+            if column in SUMMARY_DIMENSIONS:
+                distinct[column] = (_SummaryDistinct(column), 0)
+            else:
+                sketch, stale = LedgerSketch(column)
+                estimate = sketch.Count()
+                distinct[column] = (estimate, math.ceil(z * sketch.relative_error * estimate) + stale)
+    else:
+        # the matching reviews have to be read to sample them anyway, so the sketches are filled in the same pass
+        if sample_size < 1:
+            raise ValueError("size must be at least 1")
+        rows, population, sketches = _Reservoir(sample_size, ['rating', 'price_cents'], filters, random.Random(seed),
+                                                sketch_columns=distinct_columns)
+        for column, sketch in sketches.items():
+            estimate = sketch.Count()
+            distinct[column] = (estimate, math.ceil(z * sketch.relative_error * estimate))
+    n = len(rows)
+    correction = (population - n) / (population - 1) if population > 1 else 0.0
+
+    ratings = [rating for rating, _ in rows if rating is not None]
+    prices = [price for _, price in rows if price is not None and price != '']
+    histogram = {}
+    for rating in sorted(set(ratings)):
+        share = ratings.count(rating) / len(ratings)
+        histogram[rating] = (round(share, 4), round(z * math.sqrt(share * (1 - share) / len(ratings) * correction), 4))
+
+    stats = {
+        'reviews': population,
+        'sample_size': n,
+        'rating_mean': _Mean(ratings, population, z),
+        'rating_histogram': histogram,
+        'rating_quantiles': _Quantiles(ratings, quantiles, z),
+        'price_mean': _Mean(prices, round(population * len(prices) / n) if n else None, z),
+        'price_quantiles': _Quantiles(prices, quantiles, z),
+        'distinct': distinct,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    print(f"Estimated review statistics in {stats['seconds']}s.")
+    return stats
+
+def ExactStats(filters=None, quantiles=APPROX_QUANTILES, distinct_columns=APPROX_DISTINCT_COLUMNS):
+    """The numbers ApproximateStats estimates, computed exactly from every review (same keys, no error bounds)."""
+    print("Computing exact review statistics...")
+    start = time.perf_counter()
+    where_sql, params = CompileReviewFilters(filters)
+    with db.Transaction() as cursor:
+        cursor.execute(f"SELECT rating, COUNT(*) FROM cigar_reviews WHERE {where_sql} GROUP BY rating ORDER BY rating", params)
+        counts = dict(cursor.fetchall())
+        cursor.execute(f"SELECT AVG(price_cents) FROM cigar_reviews WHERE NULLIF(price_cents, '') IS NOT NULL AND ({where_sql})", params)
+        price_mean = cursor.fetchone()[0]
+        distinct = {}
+        for column in distinct_columns:
+            cursor.execute(f"SELECT COUNT(DISTINCT NULLIF({column}, '') COLLATE NOCASE) FROM cigar_reviews WHERE {where_sql}", params)
+            distinct[column] = cursor.fetchone()[0]
+
+        def quantile(expression, q):
+            # nearest-rank quantile via an ORDER BY on an indexed expression, the same definition _Quantiles uses
+            cursor.execute(f"SELECT COUNT(*) FROM cigar_reviews WHERE {expression} IS NOT NULL AND ({where_sql})", params)
+            total = cursor.fetchone()[0]
+            if total == 0:
+                return None
+            cursor.execute(f"SELECT {expression} FROM cigar_reviews WHERE {expression} IS NOT NULL AND ({where_sql}) "
+                           f"ORDER BY {expression} LIMIT 1 OFFSET ?", (*params, max(0, math.ceil(total * q) - 1)))
+            return cursor.fetchone()[0]
+
+        rating_quantiles = {q: quantile('rating', q) for q in quantiles}
+        # an unpriced review is stored as '', NULLIF drops it and matches the idx_cigar_reviews_price expression
+        price_quantiles = {q: quantile("NULLIF(price_cents, '')", q) for q in quantiles}
+
+    reviews = sum(counts.values())
+    stats = {
+        'reviews': reviews,
+        'rating_mean': round(sum(rating * count for rating, count in counts.items()) / reviews, 3) if reviews else None,
+        'rating_histogram': {rating: round(count / reviews, 4) for rating, count in counts.items()},
+        'rating_quantiles': rating_quantiles,
+        'price_mean': round(price_mean, 3) if price_mean is not None else None,
+        'price_quantiles': price_quantiles,
+        'distinct': distinct,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    print(f"Computed exact review statistics in {stats['seconds']}s.")
+    return stats
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import db
+
+# asyncio façade over db.py for embedding the ledger in async services, e.g.
+#
+#   record = await async_db.FetchCigarReviewById(3)
+#   async for page in async_db.FetchCigarReviewPages(page_size=1000):
+#       ...
+#
+# Every call runs the matching db.py function on a small dedicated thread pool, so the event loop never waits
+# on SQLite. Each worker thread gets its own pooled connection from db.GetDatabaseConnection, and with WAL
+# journaling the workers can read concurrently. At most max_pending calls are queued or running at once,
+# callers beyond that wait (without blocking the loop) until a slot frees up.
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 64
+
+
+class DatabaseExecutor:
+    """Thread pool with a bounded number of in-flight calls, shared by all event loops in the process."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be at least 1")
+        self.workers = workers
+        self.max_pending = max_pending
+        # the worker threads are remembered so Shutdown can close the pooled connection each one opened
+        self._threads = set()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="myleafledger-db",
+                                        initializer=self._RegisterWorker)
+        # asyncio semaphores belong to one event loop, so one is created per loop that uses the executor
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _RegisterWorker(self):
+        with self._lock:
+            self._threads.add(threading.get_ident())
+
+    def _Semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+    async def Run(self, function, *args, **kwargs):
+        """Run function(*args, **kwargs) on a worker thread and return its result."""
+        async with self._Semaphore():
+            return await asyncio.get_running_loop().run_in_executor(self._pool, lambda: function(*args, **kwargs))
+
+    def Shutdown(self):
+        """Wait for the running calls to finish, stop the worker threads and close their connections."""
+        self._pool.shutdown(wait=True)
+        # the workers have exited, so their connections can be closed from here
+        with self._lock:
+            threads, self._threads = self._threads, set()
+        for thread_id in threads:
+            db.CloseThreadConnection(thread_id)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def GetExecutor():
+    """Return the shared executor, creating it with the default sizes on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DatabaseExecutor()
+        return _executor
+
+def ConfigureExecutor(workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+    """Replace the shared executor, e.g. to size it for a service; the old one finishes its work first."""
+    global _executor
+    with _executor_lock:
+        previous, _executor = _executor, DatabaseExecutor(workers, max_pending)
+    if previous is not None:
+        previous.Shutdown()
+    return _executor
+
+
+async def InitializeDatabase():
+    return await GetExecutor().Run(db.InitializeDatabase)
+
+async def AddCigarReview(brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags):
+    return await GetExecutor().Run(db.AddCigarReview, brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags)
+
+async def FetchCigarReviewById(id, columns=None, as_records=False):
+    return await GetExecutor().Run(db.FetchCigarReviewById, id, columns, as_records)
+
+async def FetchAllCigarReviews(columns=None, as_records=False):
+    return await GetExecutor().Run(db.FetchAllCigarReviews, columns, as_records)
+
+async def UpdateCigarReview(id, brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags):
+    return await GetExecutor().Run(db.UpdateCigarReview, id, brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags)
+
+async def PatchCigarReview(id, changes, expected_updated_at=None):
+    return await GetExecutor().Run(db.PatchCigarReview, id, changes, expected_updated_at)
+
+async def BulkUpdateCigarReviews(filters, changes, dry_run=False):
+    return await GetExecutor().Run(db.BulkUpdateCigarReviews, filters, changes, dry_run)
+
+async def BulkDeleteCigarReviews(filters, dry_run=False):
+    return await GetExecutor().Run(db.BulkDeleteCigarReviews, filters, dry_run)
+
+async def DeleteCigarReview(id):
+    return await GetExecutor().Run(db.DeleteCigarReview, id)
+
+async def FetchCigarReviewPages(page_size=db.FETCH_PAGE_SIZE, columns=None, after_id=0, filters=None, as_records=False):
+    """
+    Async version of db.FetchCigarReviewPages, each page is fetched on a worker thread.
+
+    Every page is its own keyset query, so pages may be fetched by different workers and
+    the loop only ever holds one page in memory.
+    """
+    pages = db.FetchCigarReviewPages(page_size=page_size, columns=columns, after_id=after_id, filters=filters, as_records=as_records)
+    executor = GetExecutor()
+    try:
+        while True:
+            # next() with a default so the end of the generator does not raise StopIteration into the future
+            page = await executor.Run(next, pages, None)
+            if page is None:
+                return
+            yield page
+    finally:
+        pages.close()
+
+async def CloseDatabaseConnection():
+    """Finish the queued calls, stop the worker threads and close every pooled connection."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        await asyncio.get_running_loop().run_in_executor(None, executor.Shutdown)
+    db.CloseDatabaseConnection()
@@ -0,0 +1,141 @@
+import argparse
+import os
+import sqlite3
+import time
+import db
+from constants import BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP
+
+# Online backup and restore of the ledger with sqlite3's backup API, e.g.
+#   python backup.py backup cigars-2026-10-18.db
+#   python backup.py verify cigars-2026-10-18.db
+#   python backup.py restore cigars-2026-10-18.db
+#
+# The copy is made pages_per_step pages at a time with a short sleep in between, so the CLI (or anything
+# else using the ledger) keeps working while a large database is snapshotted. If another connection writes
+# during the copy SQLite restarts it, the snapshot is always of one consistent state.
+
+
+def _Progress(label):
+    def progress(status, remaining, total):
+        print(f"{label}: {total - remaining} of {total} pages copied...")
+    return progress
+
+def VerifyBackup(path):
+    """
+    Check that a backup file is an intact MyLeafLedger database.
+
+    Args:
+        path (str): the backup to check, opened read-only
+
+    Returns:
+        dict: ok, integrity (the PRAGMA integrity_check messages), schema_version and reviews
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        integrity = [row[0] for row in connection.execute("PRAGMA integrity_check")]
+        schema_version = connection.execute("PRAGMA user_version").fetchone()[0]
+        has_reviews = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cigar_reviews'").fetchone()
+        reviews = connection.execute("SELECT COUNT(*) FROM cigar_reviews").fetchone()[0] if has_reviews else None
+    except sqlite3.DatabaseError as e:
+        # not a database at all, or too damaged to read the header
+        return {'ok': False, 'integrity': [str(e)], 'schema_version': None, 'reviews': None}
+    finally:
+        connection.close()
+
+    ok = integrity == ['ok'] and reviews is not None and schema_version <= db.SCHEMA_VERSION
+    return {'ok': ok, 'integrity': integrity, 'schema_version': schema_version, 'reviews': reviews}
+
+def BackupDatabase(path, pages_per_step=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP, verify=True):
+    """
+    Snapshot the current database into path while it stays in use.
+
+    The copy is written next to path and only moved into place once it is complete (and verified),
+    so an interrupted backup never leaves a half written file under the final name.
+
+    Args:
+        path (str): the backup file to write, replaced if it exists
+        pages_per_step (int): database pages copied per step, -1 copies everything in one step
+        sleep (float): seconds to pause between steps
+        verify (bool): run VerifyBackup on the copy before keeping it
+
+    Returns:
+        dict: path, bytes, seconds and the VerifyBackup result (None when verify is False)
+    """
+    print(f"Backing up {db.DATABASE_NAME} to {path}...")
+    start = time.perf_counter()
+    partial_path = f"{path}.partial"
+    target = sqlite3.connect(partial_path)
+    try:
+        db.GetDatabaseConnection().backup(target, pages=pages_per_step, progress=_Progress("Backup"), sleep=sleep)
+        # fold the copy back into a single file so the backup can be moved around on its own
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+
+    verification = VerifyBackup(partial_path) if verify else None
+    if verification is not None and not verification['ok']:
+        os.remove(partial_path)
+        raise RuntimeError(f"Backup failed verification: {'; '.join(verification['integrity'])}")
+    os.replace(partial_path, path)
+
+    report = {'path': path, 'bytes': os.path.getsize(path), 'seconds': round(time.perf_counter() - start, 3),
+              'verification': verification}
+    print(f"Backup completed ({report['bytes']} bytes) in {report['seconds']}s.")
+    return report
+
+def RestoreDatabase(path, pages_per_step=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP):
+    """
+    Replace the contents of the current database with a verified backup.
+
+    The backup is copied into the live database through the backup API, so other connections see
+    the restored ledger on their next read. Older backups are then migrated to the current schema.
+
+    Args:
+        path (str): a file written by BackupDatabase
+        pages_per_step (int): database pages copied per step, -1 copies everything in one step
+        sleep (float): seconds to pause between steps
+
+    Returns:
+        dict: the VerifyBackup result for the restored file
+    """
+    verification = VerifyBackup(path)
+    if not verification['ok']:
+        raise ValueError(f"Refusing to restore {path}: {'; '.join(verification['integrity'])}")
+
+    print(f"Restoring {db.DATABASE_NAME} from {path}...")
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        source.backup(db.GetDatabaseConnection(), pages=pages_per_step, progress=_Progress("Restore"), sleep=sleep)
+    finally:
+        source.close()
+    db.ClearReviewCache()
+    db.ClearRollupCache()
+    db.InitializeDatabase()
+    print(f"Restored {verification['reviews']} cigar reviews.")
+    return verification
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up, verify or restore the cigar review ledger while it is in use.")
+    parser.add_argument("command", choices=['backup', 'verify', 'restore'])
+    parser.add_argument("path", help="the backup file")
+    parser.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="pages copied per step, -1 for all at once")
+    parser.add_argument("--sleep", type=float, default=BACKUP_STEP_SLEEP, help="seconds to pause between steps")
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        result = VerifyBackup(args.path)
+        print(f"{args.path}: {'OK' if result['ok'] else 'FAILED'}, schema version {result['schema_version']}, "
+              f"{result['reviews']} reviews, integrity: {'; '.join(result['integrity'])}")
+        raise SystemExit(0 if result['ok'] else 1)
+
+    db.InitializeDatabase()
+    try:
+        if args.command == 'backup':
+            BackupDatabase(args.path, pages_per_step=args.pages, sleep=args.sleep)
+        else:
+            RestoreDatabase(args.path, pages_per_step=args.pages, sleep=args.sleep)
+    finally:
+        db.CloseDatabaseConnection()
@@ -0,0 +1,401 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import approx
+import async_db
+import db
+import exporter
+import renderer
+import validate
+import writer
+from InsertTestData.generate import GenerateReviews
+
+# Benchmarks for MyLeafLedger, each one returns a list of result dicts that are printed as JSON lines
+# so runs can be saved and compared, e.g. python benchmark.py --scales 1000,100000 --output bench_output.txt
+
+# scales used when --scales is not given
+DEFAULT_SCALES = [1000, 10000, 100000]
+
+# number of calls timed for the single row operations (add, fetch by id, update, delete)
+SINGLE_CALLS = 200
+
+# rendering runs at roughly 2000 rows/sec (tabulate) and 600 rows/sec (rich), so by default the
+# report benchmarks are skipped above this scale, use --all-reports to time them anyway
+REPORT_MAX_SCALE = 10000
+
+# concurrent callers and requests per level for the async_db throughput benchmark
+ASYNC_CONCURRENCY = [1, 4, 16, 64]
+ASYNC_REQUESTS = 2000
+
+# concurrent producer threads and total writes per level for the write queue benchmark
+WRITE_PRODUCERS = [1, 4, 16, 64]
+WRITE_REQUESTS = 2000
+
+
+def _Timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def _Result(benchmark, rows, seconds, **extra):
+    return {'benchmark': benchmark, 'rows': rows, 'seconds': round(seconds, 6),
+            'rows_per_second': round(rows / seconds) if seconds > 0 else None, **extra}
+
+def _Latencies(benchmark, scale, function, arguments):
+    # time every call separately so mean and p95 latency can be reported
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return _Result(benchmark, len(latencies), sum(latencies), scale=scale, calls=len(latencies),
+                   mean_ms=round(1000 * sum(latencies) / len(latencies), 4),
+                   p95_ms=round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 4))
+
+def _Scan(benchmark, scale, function):
+    # time one call that returns a row count, a list of rows or a generator of pages (consumed inside the timing)
+    start = time.perf_counter()
+    result = function()
+    if isinstance(result, int):
+        rows = result
+    elif isinstance(result, list):
+        rows = len(result)
+    else:
+        rows = sum(len(page) for page in result)
+    return _Result(benchmark, rows, time.perf_counter() - start, scale=scale, calls=1)
+
+def _Memory(benchmark, scale, function):
+    # peak bytes allocated while building a result that is held in memory, plus what is still held afterwards
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return _Result(benchmark, len(result), seconds, scale=scale, calls=1, held_bytes=held, peak_bytes=peak,
+                   bytes_per_row=round(held / len(result)) if result else None)
+
+def RunMetadata(seed):
+    """One line describing the run so results from different machines and versions can be told apart."""
+    return {'run': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(), 'seed': seed}
+
+def _SampleRecords(rows):
+    # a repeating mix of valid and invalid records so both the accept and reject paths are timed
+    good = {'brand': 'Padron', 'line': '1964 Anniversary', 'vitola': 'Toro', 'ring_gauge': '50',
+            'country': 'Nicaragua', 'wrapper': 'Maduro', 'binder': 'Nicaragua', 'filler': 'Nicaragua',
+            'date_smoked': '2024-02-29', 'rating': '5', 'notes': 'Cedar and cocoa with a long finish',
+            'price_cents': '1500', 'humidor': 'Office', 'tags': 'maduro,box-press'}
+    bad = dict(good, date_smoked='2024-02-30', rating='9')
+    return [bad if i % 10 == 0 else good for i in range(rows)]
+
+def BenchmarkValidation(rows=100000):
+    """Compare per-record validation, column batch validation and the old uncompiled per-call regex approach."""
+    records = _SampleRecords(rows)
+
+    def per_record():
+        for record in records:
+            validate.validate_record(record)
+
+    def uncompiled_dates():
+        # what is_valid_date used to do: re.match on a raw pattern string plus strptime on every call
+        for record in records:
+            if re.match(r'^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$', record['date_smoked']):
+                try:
+                    datetime.datetime.strptime(record["date_smoked"], "%Y-%m-%d")
+                except ValueError:
+                    pass
+
+    def compiled_dates():
+        for record in records:
+            validate.is_valid_date(record['date_smoked'])
+
+    return [
+        _Result('validate_record', rows, _Timed(per_record)),
+        _Result('validate_batch', rows, _Timed(validate.validate_batch, records)),
+        _Result('is_valid_date_uncompiled_strptime', rows, _Timed(uncompiled_dates)),
+        _Result('is_valid_date', rows, _Timed(compiled_dates)),
+    ]
+
+def BenchmarkDatabase(scale, seed=0, single_calls=SINGLE_CALLS, reports=None):
+    """
+    Time every db.py operation and the report paths against a fresh synthetic ledger of scale rows.
+
+    The ledger is built in a temporary database with GenerateReviews(scale, seed), so runs are repeatable.
+    The progress messages db.py prints are discarded while timing. reports decides whether the
+    rendering benchmarks run, by default only when scale is at most REPORT_MAX_SCALE.
+    """
+    if reports is None:
+        reports = scale <= REPORT_MAX_SCALE
+    rng = random.Random(seed)
+    previous_database = db.DATABASE_NAME
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        db.UseDatabase(os.path.join(tmp_dir, 'benchmark.db'))
+        try:
+            db.InitializeDatabase()
+            results.append(_Scan('bulk_insert', scale, lambda: db.BulkAddCigarReviews(GenerateReviews(scale, seed))))
+
+            new_rows = list(GenerateReviews(single_calls, seed + 1))
+            ids = [(rng.randint(1, scale),) for _ in range(single_calls)]
+            results.append(_Latencies('add', scale, db.AddCigarReview, new_rows))
+            db.ClearReviewCache()
+            results.append(_Latencies('fetch_by_id', scale, db.FetchCigarReviewById, ids))
+            # a handful of hot reviews looked up over and over, as the edit and delete menus and scripts do
+            hot_ids = [(rng.choice(ids[:20])[0],) for _ in range(single_calls)]
+            db.ClearReviewCache()
+            hits = db.ReviewCacheStats()['hits']
+            results.append(dict(_Latencies('fetch_by_id_hot', scale, db.FetchCigarReviewById, hot_ids),
+                                hit_rate=round((db.ReviewCacheStats()['hits'] - hits) / single_calls, 4)))
+            results.append(_Latencies('update', scale, db.UpdateCigarReview, [id + row for id, row in zip(ids, new_rows)]))
+
+            results.append(_Scan('fetch_all', scale, db.FetchAllCigarReviews))
+            results.append(_Memory('memory_fetch_all', scale, db.FetchAllCigarReviews))
+            results.append(_Memory('memory_fetch_all_records_projected', scale,
+                                   lambda: db.FetchAllCigarReviews(columns=['id', 'brand', 'country', 'rating', 'price_cents'], as_records=True)))
+            results.append(_Scan('fetch_pages', scale, db.FetchCigarReviewPages))
+            results.append(_Scan('fetch_pages_projected', scale, lambda: db.FetchCigarReviewPages(columns=['brand', 'rating'])))
+            results.append(_Scan('query_brand_rating', scale, lambda: db.QueryCigarReviews({'brand': 'Padron', 'rating_min': 4})))
+            results.append(_Scan('query_date_range', scale, lambda: db.QueryCigarReviews({'date_from': '2020-01-01', 'date_to': '2020-03-31'})))
+            results.append(_Scan('query_tags_all', scale, lambda: db.FetchCigarReviewsByTags('maduro,box-press')))
+            results.append(_Scan('search_notes', scale, lambda: db.SearchCigarReviews('cedar leather')))
+            results.append(_Scan('summary_brand', scale, lambda: db.FetchReviewSummary('brand')))
+            db.ClearRollupCache()
+            results.append(_Scan('rollup_month', scale, lambda: db.FetchReviewRollup('month')))
+            results.append(_Scan('rollup_month_cached', scale, lambda: db.FetchReviewRollup('month')))
+
+            if reports:
+                results.append(_Scan('report_view_all', scale, lambda: renderer.PrintReviewTable(db.FetchCigarReviewPages(), file=devnull)))
+                results.append(_Scan('report_fancy', scale, lambda: renderer.PrintFancyReport(db.FetchCigarReviewPages(), file=devnull)))
+
+            results.append(_Latencies('delete', scale, db.DeleteCigarReview, ids))
+        finally:
+            db.CloseDatabaseConnection()
+            db.UseDatabase(previous_database)
+    return results
+
+async def _Concurrently(function, arguments, concurrency):
+    # concurrency callers share one queue of arguments, like that many clients of an async service
+    queue = iter(arguments)
+    async def caller():
+        for args in queue:
+            await function(*args)
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+async def _ConsumePages(pages):
+    rows = 0
+    async for page in pages:
+        rows += len(page)
+    return rows
+
+def BenchmarkAsync(scale, seed=0, requests=ASYNC_REQUESTS, concurrency=ASYNC_CONCURRENCY, workers=async_db.DEFAULT_WORKERS):
+    """
+    Measure the request throughput of the async_db façade with increasing numbers of concurrent callers.
+
+    Reads (fetch by id) and writes (add) are timed at every level of concurrency against a synthetic ledger
+    of scale rows, followed by one async page scan over the whole ledger.
+    """
+    rng = random.Random(seed)
+    previous_database = db.DATABASE_NAME
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        db.UseDatabase(os.path.join(tmp_dir, 'benchmark.db'))
+
+        async def run():
+            async_db.ConfigureExecutor(workers=workers)
+            try:
+                await async_db.InitializeDatabase()
+                await async_db.GetExecutor().Run(db.BulkAddCigarReviews, GenerateReviews(scale, seed))
+                new_rows = list(GenerateReviews(requests, seed + 1))
+                for level in concurrency:
+                    ids = [(rng.randint(1, scale),) for _ in range(requests)]
+                    seconds = await _Concurrently(async_db.FetchCigarReviewById, ids, level)
+                    results.append(_Result('async_fetch_by_id', requests, seconds, scale=scale, concurrency=level, workers=workers))
+                    seconds = await _Concurrently(async_db.AddCigarReview, new_rows, level)
+                    results.append(_Result('async_add', requests, seconds, scale=scale, concurrency=level, workers=workers))
+                start = time.perf_counter()
+                rows = await _ConsumePages(async_db.FetchCigarReviewPages())
+                results.append(_Result('async_fetch_pages', rows, time.perf_counter() - start, scale=scale, workers=workers))
+            finally:
+                await async_db.CloseDatabaseConnection()
+
+        try:
+            asyncio.run(run())
+        finally:
+            db.UseDatabase(previous_database)
+    return results
+
+def _Producers(rows, producers, write):
+    # producers threads split rows between them and call write(row) for each, errors are counted not raised
+    errors = []
+    def produce(chunk):
+        for row in chunk:
+            try:
+                write(row)
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+    threads = [threading.Thread(target=produce, args=(rows[start::producers],)) for start in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, len(errors)
+
+def BenchmarkWriters(scale, seed=0, requests=WRITE_REQUESTS, producers=WRITE_PRODUCERS):
+    """
+    Measure sustained insert throughput with many concurrent producer threads.
+
+    At every level the same rows are written twice: once with each thread calling db.AddCigarReview on its own
+    connection (every add is its own commit and they contend for the lock), and once through the single writer
+    queue in writer.py, where producers wait for their future and the writer group-commits whatever has queued.
+    """
+    previous_database = db.DATABASE_NAME
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        db.UseDatabase(os.path.join(tmp_dir, 'benchmark.db'))
+        try:
+            db.InitializeDatabase()
+            db.BulkAddCigarReviews(GenerateReviews(scale, seed))
+            rows = list(GenerateReviews(requests, seed + 1))
+            for level in producers:
+                seconds, errors = _Producers(rows, level, lambda row: db.AddCigarReview(*row))
+                results.append(_Result('write_direct', requests, seconds, scale=scale, producers=level, errors=errors))
+
+                queue = writer.WriteQueue()
+                seconds, errors = _Producers(rows, level, lambda row: queue.Add(*row).result())
+                queue.Close()
+                stats = queue.Stats()
+                results.append(_Result('write_queued', requests, seconds, scale=scale, producers=level, errors=errors,
+                                       batches=stats['batches'], average_batch=stats['average_batch'], retries=stats['retries']))
+        finally:
+            db.CloseDatabaseConnection()
+            db.UseDatabase(previous_database)
+    return results
+
+def BenchmarkExport(scale, seed=0):
+    """
+    Compare loading the ledger into pandas straight from the database with exporting it once and loading the export.
+
+    Each available format (npz always, parquet and arrow when pyarrow is installed) reports its export time,
+    file size and load time next to the FetchAllCigarReviews + DataFrame baseline.
+    """
+    import pandas
+    formats = ['npz'] + (['parquet', 'arrow'] if exporter._Pyarrow() else [])
+    previous_database = db.DATABASE_NAME
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        db.UseDatabase(os.path.join(tmp_dir, 'benchmark.db'))
+        try:
+            db.InitializeDatabase()
+            db.BulkAddCigarReviews(GenerateReviews(scale, seed))
+            results.append(_Scan('load_fetch_all_dataframe', scale,
+                                 lambda: len(pandas.DataFrame(db.FetchAllCigarReviews(), columns=db.ALL_COLUMNS))))
+            for file_format in formats:
+                path = os.path.join(tmp_dir, f'ledger.{file_format}')
+                report = exporter.ExportReviews(path, file_format=file_format)
+                results.append(_Result(f'export_{file_format}', report['rows'], report['seconds'], scale=scale, bytes=report['bytes']))
+                results.append(_Scan(f'load_{file_format}', scale, lambda: len(exporter.LoadReviews(path, file_format))))
+        finally:
+            db.CloseDatabaseConnection()
+            db.UseDatabase(previous_database)
+    return results
+
+def BenchmarkApproximate(scale, seed=0):
+    """
+    Compare the approximate overview in approx.py with the exact answers it estimates.
+
+    Reports the time of approx.ExactStats and of approx.ApproximateStats at the default sample size, and for
+    the estimate how far each headline number landed from the exact one next to its reported error bound.
+    The first estimate builds the stored sketches (cold); the warm one runs after 1% more reviews were added,
+    so it also brings the sketches up to date from the change log, and is the one compared with ExactStats.
+    """
+    previous_database = db.DATABASE_NAME
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        db.UseDatabase(os.path.join(tmp_dir, 'benchmark.db'))
+        try:
+            db.InitializeDatabase()
+            db.BulkAddCigarReviews(GenerateReviews(scale, seed))
+            cold = approx.ApproximateStats(seed=seed)
+            results.append(_Result('stats_approximate_cold', scale, cold['seconds'], scale=scale, calls=1))
+            db.BulkAddCigarReviews(GenerateReviews(max(1, scale // 100), seed + 1))
+            exact = approx.ExactStats()
+            results.append(_Result('stats_exact', scale, exact['seconds'], scale=scale, calls=1))
+            estimate = approx.ApproximateStats(seed=seed)
+            errors = {'rating_mean_error': round(abs(estimate['rating_mean'][0] - exact['rating_mean']), 4),
+                      'rating_mean_margin': estimate['rating_mean'][1],
+                      'price_median_error': abs(estimate['price_quantiles'][0.5][0] - exact['price_quantiles'][0.5]),
+                      'histogram_max_error': round(max(abs(share - exact['rating_histogram'].get(rating, 0))
+                                                       for rating, (share, _) in estimate['rating_histogram'].items()), 4)}
+            for column, (count, margin) in estimate['distinct'].items():
+                errors[f'distinct_{column}_error'] = abs(count - exact['distinct'][column])
+                errors[f'distinct_{column}_margin'] = margin
+            results.append(_Result('stats_approximate', scale, estimate['seconds'], scale=scale, calls=1,
+                                   sample_size=estimate['sample_size'],
+                                   speedup=round(exact['seconds'] / max(estimate['seconds'], 0.001), 1), **errors))
+        finally:
+            db.CloseDatabaseConnection()
+            db.UseDatabase(previous_database)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MyLeafLedger benchmarks and print JSON lines.")
+    parser.add_argument("--rows", type=int, default=100000, help="records for the validation benchmark")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES),
+                        help="comma separated ledger sizes for the database benchmark, e.g. 1000,1000000")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic ledger")
+    parser.add_argument("--only", choices=['validation', 'database', 'async', 'export', 'writers', 'approx'], help="run just one group of benchmarks")
+    reports = parser.add_mutually_exclusive_group()
+    reports.add_argument("--no-reports", dest="reports", action="store_false", default=None,
+                         help="skip the View All and Fancy Report rendering benchmarks")
+    reports.add_argument("--all-reports", dest="reports", action="store_true",
+                         help=f"time the rendering benchmarks even above {REPORT_MAX_SCALE} rows")
+    parser.add_argument("--output", help="append the JSON lines to this file instead of printing them")
+    args = parser.parse_args()
+
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    print(json.dumps(RunMetadata(args.seed)), file=output, flush=True)
+    if args.only in (None, 'validation'):
+        for result in BenchmarkValidation(args.rows):
+            print(json.dumps(result), file=output, flush=True)
+    if args.only in (None, 'database'):
+        for scale in [int(scale) for scale in args.scales.split(',')]:
+            for result in BenchmarkDatabase(scale, seed=args.seed, reports=args.reports):
+                print(json.dumps(result), file=output, flush=True)
+    if args.only in (None, 'async'):
+        for scale in [int(scale) for scale in args.scales.split(',')]:
+            for result in BenchmarkAsync(scale, seed=args.seed):
+                print(json.dumps(result), file=output, flush=True)
+    if args.only in (None, 'writers'):
+        for scale in [int(scale) for scale in args.scales.split(',')]:
+            for result in BenchmarkWriters(scale, seed=args.seed):
+                print(json.dumps(result), file=output, flush=True)
+    if args.only in (None, 'export'):
+        for scale in [int(scale) for scale in args.scales.split(',')]:
+            for result in BenchmarkExport(scale, seed=args.seed):
+                print(json.dumps(result), file=output, flush=True)
+    if args.only in (None, 'approx'):
+        for scale in [int(scale) for scale in args.scales.split(',')]:
+            for result in BenchmarkApproximate(scale, seed=args.seed):
+                print(json.dumps(result), file=output, flush=True)
+    if args.output:
+        output.close()
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+
+# Small thread safe LRU cache used by db.py to keep hot reviews in memory.
+#
+# Writers invalidate keys (or everything) and bump a generation counter. A reader that missed records the
+# generation before going to the database and passes it back to Put, so a row read before a concurrent
+# invalidation is never stored over it.
+
+
+class LruCache:
+    """Bounded mapping that evicts the least recently used entry and counts hits and misses."""
+
+    def __init__(self, capacity):
+        if capacity < 0:
+            raise ValueError("capacity must not be negative")
+        self.capacity = capacity
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'clears': 0}
+
+    def Get(self, key):
+        """Return (True, value) for a cached key, or (False, generation) to pass to Put after a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return True, self._entries[key]
+            self._stats['misses'] += 1
+            return False, self.generation
+
+    def Put(self, key, value, generation):
+        """Cache value unless something was invalidated since generation was handed out by Get."""
+        with self._lock:
+            if self.capacity == 0 or generation != self.generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def Invalidate(self, key):
+        """Drop one key."""
+        with self._lock:
+            self.generation += 1
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def Clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._stats['clears'] += 1
+
+    def Resize(self, capacity):
+        """Change the capacity, evicting the oldest entries if it shrank."""
+        if capacity < 0:
+            raise ValueError("capacity must not be negative")
+        with self._lock:
+            self.capacity = capacity
+            while len(self._entries) > capacity:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def Stats(self):
+        """Return the counters plus the current size, capacity and hit rate."""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, size=len(self._entries), capacity=self.capacity,
+                        hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else None)
+
+    def ResetStats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
@@ -0,0 +1,294 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import db
+import exporter
+import importer
+from constants import ALL_COLUMNS, FETCH_PAGE_SIZE, IMPORT_BATCH_SIZE, EXPORT_CHUNK_SIZE, SEARCH_RESULT_LIMIT
+from query import FILTER_KEYS, RANGE_FILTERS
+from validate import validate_changes, is_valid_integer
+
+# Non-interactive counterpart to main.main_menu for scripts and automation, e.g.
+#   python cli.py add < reviews.jsonl
+#   python cli.py get 12 13 --output csv
+#   python cli.py update --where brand=Padron --set humidor=Travel --dry-run
+#   python cli.py update < edits.jsonl              # {"id": 12, "rating": 4, "updated_at": "..."} per line
+#   python cli.py delete --where humidor=Travel
+#   python cli.py query --where country=Nicaragua --where rating_min=4 --output json
+#   python cli.py export ledger.npz
+#
+# Every command runs in one process against one database connection, results go to stdout as JSON lines,
+# a JSON array or CSV, and the db layer's progress messages go to stderr with --verbose (and nowhere otherwise).
+
+OUTPUT_FORMATS = ['jsonl', 'json', 'csv']
+
+
+class _RowWriter:
+    """Writes row tuples to a stream as they arrive, in one of OUTPUT_FORMATS."""
+
+    def __init__(self, output, output_format, columns):
+        self.output = output
+        self.output_format = output_format
+        self.columns = columns
+        self.count = 0
+        if output_format == 'csv':
+            self.csv_writer = csv.writer(output)
+            self.csv_writer.writerow(columns)
+        elif output_format == 'json':
+            output.write('[')
+
+    def Write(self, rows):
+        for row in rows:
+            if self.output_format == 'csv':
+                self.csv_writer.writerow(row)
+            else:
+                text = json.dumps(dict(zip(self.columns, row)))
+                if self.output_format == 'json':
+                    text = ('\n' if self.count == 0 else ',\n') + text
+                else:
+                    text += '\n'
+                self.output.write(text)
+            self.count += 1
+
+    def Close(self):
+        if self.output_format == 'json':
+            self.output.write('\n]\n' if self.count else ']\n')
+        self.output.flush()
+        return self.count
+
+
+def _WriteReport(output, report):
+    output.write(json.dumps(report) + '\n')
+    output.flush()
+
+def _ParseAssignments(assignments, what):
+    # turn ['brand=Padron', 'rating_min=4'] into a dict
+    parsed = {}
+    for assignment in assignments or []:
+        key, separator, value = assignment.partition('=')
+        if not separator or not key.strip():
+            raise ValueError(f"Expected {what} as key=value, got '{assignment}'")
+        parsed[key.strip()] = value.strip()
+    return parsed
+
+def _ParseFilters(assignments):
+    filters = _ParseAssignments(assignments, 'a filter')
+    unknown = [key for key in filters if key not in FILTER_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown review filter(s): {', '.join(unknown)}, expected one of {', '.join(FILTER_KEYS)}")
+    # the range filters are compared against INTEGER columns so the numeric ones must be bound as ints
+    for key in RANGE_FILTERS:
+        if key in filters and not key.startswith('date_'):
+            filters[key] = int(filters[key])
+    return filters
+
+def _ParseColumns(columns):
+    return columns.split(',') if columns else None
+
+def _RecordFormat(path, file_format):
+    if file_format:
+        return file_format
+    return 'csv' if path != '-' and path.lower().endswith('.csv') else 'jsonl'
+
+
+def AddCommand(args, output):
+    _WriteReport(output, importer.ImportReviews(args.file, file_format=_RecordFormat(args.file, args.format),
+                                                batch_size=args.batch_size))
+    return 0
+
+def ImportCommand(args, output):
+    _WriteReport(output, importer.ImportReviews(args.path, file_format=args.format, batch_size=args.batch_size))
+    return 0
+
+def GetCommand(args, output):
+    writer = _RowWriter(output, args.output, ALL_COLUMNS)
+    missing = []
+    for id in args.ids:
+        record = db.FetchCigarReviewById(id)
+        if record is None:
+            missing.append(id)
+        else:
+            writer.Write([record])
+    writer.Close()
+    if missing:
+        print(f"No cigar review found with ID {', '.join(str(id) for id in missing)}", file=sys.stderr)
+    return 1 if missing else 0
+
+def UpdateCommand(args, output):
+    if args.set:
+        changes, errors = validate_changes(_ParseAssignments(args.set, 'a change'))
+        if errors:
+            raise ValueError(', '.join(errors))
+        ids = db.BulkUpdateCigarReviews(_ParseFilters(args.where), changes, dry_run=args.dry_run)
+        _WriteReport(output, {'dry_run': args.dry_run, 'updated': len(ids), 'ids': ids})
+        return 0
+    if args.where:
+        raise ValueError("--where needs --set, or pipe in records to update by id")
+
+    # one record per review, {"id": ..., <changed columns>..., "updated_at": <optional conflict check>}
+    file_format = _RecordFormat(args.file, args.format)
+    reader = importer.ReadCsvRecords if file_format == 'csv' else importer.ReadJsonlRecords
+    report = {'updated': 0, 'conflicts': [], 'missing': [], 'rejected': []}
+    # the whole batch is one transaction, so thousands of edits cost one commit
+    with db.Transaction():
+        for line_number, record in reader(args.file):
+            if not isinstance(record, dict) or '_error' in record or 'id' not in record:
+                report['rejected'].append((line_number, [record.get('_error', "missing id") if isinstance(record, dict) else "record is not an object"]))
+                continue
+            record = dict(record)
+            id = str(record.pop('id')).strip()
+            if not is_valid_integer(id):
+                report['rejected'].append((line_number, ["invalid id"]))
+                continue
+            id = int(id)
+            expected_updated_at = record.pop('updated_at', None) or None
+            if file_format == 'csv':
+                # a blank cell means "leave as is", there is no way to tell it apart from "clear" in CSV
+                record = {column: value for column, value in record.items() if value != ''}
+            changes, errors = validate_changes(record)
+            if errors:
+                report['rejected'].append((line_number, errors))
+                continue
+            try:
+                if db.PatchCigarReview(id, changes, expected_updated_at=expected_updated_at) is None:
+                    report['missing'].append(id)
+                else:
+                    report['updated'] += 1
+            except db.UpdateConflict:
+                report['conflicts'].append(id)
+    _WriteReport(output, report)
+    return 1 if report['conflicts'] or report['missing'] or report['rejected'] else 0
+
+def DeleteCommand(args, output):
+    if args.where:
+        ids = db.BulkDeleteCigarReviews(_ParseFilters(args.where), dry_run=args.dry_run)
+        _WriteReport(output, {'dry_run': args.dry_run, 'deleted': len(ids), 'ids': ids})
+        return 0
+    if not args.ids:
+        raise ValueError("Give the ids to delete or --where filters")
+    if args.dry_run:
+        ids = [id for id in args.ids if db.FetchCigarReviewById(id) is not None]
+    else:
+        with db.Transaction():
+            ids = [id for id in args.ids if db.FetchCigarReviewById(id) is not None]
+            for id in ids:
+                db.DeleteCigarReview(id)
+    _WriteReport(output, {'dry_run': args.dry_run, 'deleted': len(ids), 'ids': ids})
+    return 0
+
+def ListCommand(args, output):
+    columns = _ParseColumns(args.columns) or list(ALL_COLUMNS)
+    filters = _ParseFilters(getattr(args, 'where', None))
+    writer = _RowWriter(output, args.output, columns)
+    if getattr(args, 'search', None):
+        writer.Write(db.SearchCigarReviews(args.search, limit=args.limit or SEARCH_RESULT_LIMIT, columns=columns))
+    else:
+        remaining = getattr(args, 'limit', None)
+        for page in db.FetchCigarReviewPages(page_size=args.page_size, columns=columns, filters=filters):
+            if remaining is not None:
+                page = page[:remaining]
+                remaining -= len(page)
+            writer.Write(page)
+            if remaining == 0:
+                break
+    writer.Close()
+    return 0
+
+def ExportCommand(args, output):
+    _WriteReport(output, exporter.ExportReviews(args.path, file_format=args.format, chunk_size=args.chunk_size,
+                                                columns=_ParseColumns(args.columns), filters=_ParseFilters(args.where),
+                                                compress=args.compress))
+    return 0
+
+
+def BuildParser():
+    parser = argparse.ArgumentParser(description="Scriptable MyLeafLedger commands, see main.py for the interactive menu.")
+    parser.add_argument("--database", help="ledger file to use instead of the default")
+    parser.add_argument("--verbose", action="store_true", help="show the database layer's progress messages on stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def records_arguments(command):
+        command.add_argument("--file", default='-', help="JSONL or CSV records to read, stdin by default")
+        command.add_argument("--format", choices=['jsonl', 'csv'], help="defaults to the file extension, jsonl for stdin")
+
+    def output_argument(command):
+        command.add_argument("--output", choices=OUTPUT_FORMATS, default='jsonl', help="row output format")
+
+    def where_argument(command):
+        command.add_argument("--where", action="append", metavar="FILTER=VALUE",
+                             help=f"Query Reviews filter, repeatable: {', '.join(FILTER_KEYS)}")
+
+    add = commands.add_parser("add", help="add reviews from JSONL or CSV records")
+    records_arguments(add)
+    add.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction")
+    add.set_defaults(handler=AddCommand)
+
+    get = commands.add_parser("get", help="print reviews by id")
+    get.add_argument("ids", nargs="+", type=int)
+    output_argument(get)
+    get.set_defaults(handler=GetCommand)
+
+    update = commands.add_parser("update", help="patch reviews from records with an id, or every review matching --where")
+    records_arguments(update)
+    where_argument(update)
+    update.add_argument("--set", action="append", metavar="COLUMN=VALUE", help="change for every matching review, repeatable")
+    update.add_argument("--dry-run", action="store_true", help="only report which reviews match --where")
+    update.set_defaults(handler=UpdateCommand)
+
+    delete = commands.add_parser("delete", help="delete reviews by id or every review matching --where")
+    delete.add_argument("ids", nargs="*", type=int)
+    where_argument(delete)
+    delete.add_argument("--dry-run", action="store_true", help="only report which reviews would be deleted")
+    delete.set_defaults(handler=DeleteCommand)
+
+    for name, help_text in [("list", "stream every review"), ("query", "stream the reviews matching filters or a search")]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--columns", help="comma separated columns, all when omitted")
+        command.add_argument("--page-size", type=int, default=FETCH_PAGE_SIZE, help="rows fetched at a time")
+        output_argument(command)
+        if name == "query":
+            where_argument(command)
+            command.add_argument("--search", help="full-text search over brand, line, vitola and notes instead of filters")
+            command.add_argument("--limit", type=int, help="maximum number of reviews")
+        command.set_defaults(handler=ListCommand)
+
+    import_command = commands.add_parser("import", help="bulk import a CSV or JSONL file")
+    import_command.add_argument("path")
+    import_command.add_argument("--format", choices=['csv', 'jsonl'], help="defaults to the file extension")
+    import_command.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction")
+    import_command.set_defaults(handler=ImportCommand)
+
+    export = commands.add_parser("export", help="export to a columnar file (.npz, .parquet or .arrow)")
+    export.add_argument("path")
+    export.add_argument("--format", choices=exporter.EXPORT_FORMATS, help="defaults to the file extension")
+    export.add_argument("--columns", help="comma separated columns, all when omitted")
+    export.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="rows encoded at a time")
+    export.add_argument("--compress", action="store_true", help="compress .npz arrays")
+    where_argument(export)
+    export.set_defaults(handler=ExportCommand)
+    return parser
+
+def main(argv=None, output=None):
+    """Run one command and return its exit status (0 ok, 1 partly failed, 2 bad arguments)."""
+    parser = BuildParser()
+    args = parser.parse_args(argv)
+    output = output or sys.stdout
+    if args.database:
+        db.UseDatabase(args.database)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stderr if args.verbose else devnull):
+        db.InitializeDatabase()
+        try:
+            return args.handler(args, output)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        finally:
+            db.CloseDatabaseConnection()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
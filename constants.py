@@ -28,10 +28,269 @@ INSERT_QUERY = """INSERT INTO cigar_reviews
     (brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags) 
     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
 
+# secondary indexes backing the Query Reviews filters (see query.py), text columns are indexed case-insensitively
+# because the filters compare them with COLLATE NOCASE
+INDEX_QUERIES = [
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_brand_line ON cigar_reviews(brand COLLATE NOCASE, line COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_line ON cigar_reviews(line COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_vitola ON cigar_reviews(vitola COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_country ON cigar_reviews(country COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_wrapper ON cigar_reviews(wrapper COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_humidor ON cigar_reviews(humidor COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_date_smoked ON cigar_reviews(date_smoked)",
+    "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_rating ON cigar_reviews(rating)",
+]
+
+# the price range filters compare NULLIF(price_cents, ''), an index on that same expression keeps them seeks
+PRICE_INDEX_QUERY = "CREATE INDEX IF NOT EXISTS idx_cigar_reviews_price ON cigar_reviews(NULLIF(price_cents, ''))"
+
+# the plain price_cents index the range filters used before, unused since and only a cost on every write
+DROP_OLD_PRICE_INDEX_QUERY = "DROP INDEX IF EXISTS idx_cigar_reviews_price_cents"
+
+# normalized copy of the CSV tags column so tag lookups are indexed joins instead of string splitting,
+# kept in sync by db.py whenever a review is added, updated or deleted
+TAG_TABLE_QUERIES = [
+    """CREATE TABLE IF NOT EXISTS tags(
+        id   INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE           -- e.g., "maduro"
+    )""",
+    # keyed by (tag_id, review_id) so "reviews with tag X" is a prefix seek
+    """CREATE TABLE IF NOT EXISTS review_tags(
+        review_id INTEGER NOT NULL,
+        tag_id    INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, review_id)
+    ) WITHOUT ROWID""",
+    # and the reverse direction for re-syncing or deleting one review's tags
+    "CREATE INDEX IF NOT EXISTS idx_review_tags_review ON review_tags(review_id)",
+]
+
+# full-text index over the tasting notes (and names), an external content table so the text is not stored twice,
+# kept consistent with cigar_reviews by the triggers below
+FTS_TABLE_QUERY = """CREATE VIRTUAL TABLE IF NOT EXISTS cigar_reviews_fts USING fts5(
+    brand, line, vitola, notes,
+    content='cigar_reviews', content_rowid='id', tokenize='porter unicode61'
+    )"""
+
+FTS_TRIGGER_QUERIES = [
+    """CREATE TRIGGER IF NOT EXISTS cigar_reviews_fts_insert AFTER INSERT ON cigar_reviews BEGIN
+        INSERT INTO cigar_reviews_fts (rowid, brand, line, vitola, notes) VALUES (new.id, new.brand, new.line, new.vitola, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cigar_reviews_fts_delete AFTER DELETE ON cigar_reviews BEGIN
+        INSERT INTO cigar_reviews_fts (cigar_reviews_fts, rowid, brand, line, vitola, notes) VALUES ('delete', old.id, old.brand, old.line, old.vitola, old.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cigar_reviews_fts_update AFTER UPDATE OF brand, line, vitola, notes ON cigar_reviews BEGIN
+        INSERT INTO cigar_reviews_fts (cigar_reviews_fts, rowid, brand, line, vitola, notes) VALUES ('delete', old.id, old.brand, old.line, old.vitola, old.notes);
+        INSERT INTO cigar_reviews_fts (rowid, brand, line, vitola, notes) VALUES (new.id, new.brand, new.line, new.vitola, new.notes);
+    END""",
+]
+
+# incrementally maintained summary tables for the reports, one per grouping column,
+# each row holds running totals so averages are computed from O(groups) rows instead of O(reviews)
+SUMMARY_DIMENSIONS = ['brand', 'country', 'humidor']
+
+SUMMARY_TABLE_QUERIES = [
+    f"""CREATE TABLE IF NOT EXISTS {dimension}_summary(
+        {dimension}   TEXT    NOT NULL PRIMARY KEY COLLATE NOCASE,   -- '' for reviews without one
+        review_count  INTEGER NOT NULL,
+        rating_total  INTEGER NOT NULL,
+        price_total   INTEGER NOT NULL,                          -- sum of price_cents
+        priced_count  INTEGER NOT NULL                           -- reviews that have a price_cents
+    )""" for dimension in SUMMARY_DIMENSIONS
+]
+
+# add (sign 1) or remove (sign -1) one review's contribution, used with new.* and old.* inside the triggers
+# (the menu stores a skipped price as '' rather than NULL, so both count as "no price")
+SUMMARY_APPLY_QUERY = """INSERT INTO {dimension}_summary ({dimension}, review_count, rating_total, price_total, priced_count)
+        VALUES (COALESCE({row}.{dimension}, ''), {sign}, {sign} * {row}.rating, {sign} * COALESCE(NULLIF({row}.price_cents, ''), 0), {sign} * (NULLIF({row}.price_cents, '') IS NOT NULL))
+        ON CONFLICT ({dimension}) DO UPDATE SET
+            review_count = review_count + excluded.review_count,
+            rating_total = rating_total + excluded.rating_total,
+            price_total = price_total + excluded.price_total,
+            priced_count = priced_count + excluded.priced_count;
+        DELETE FROM {dimension}_summary WHERE {dimension} = COALESCE({row}.{dimension}, '') AND review_count <= 0;"""
+
+def _summary_statements(row, sign):
+    return "\n        ".join(SUMMARY_APPLY_QUERY.format(dimension=dimension, row=row, sign=sign) for dimension in SUMMARY_DIMENSIONS)
+
+SUMMARY_TRIGGER_QUERIES = [
+    f"""CREATE TRIGGER IF NOT EXISTS cigar_reviews_summary_insert AFTER INSERT ON cigar_reviews BEGIN
+        {_summary_statements('new', 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cigar_reviews_summary_delete AFTER DELETE ON cigar_reviews BEGIN
+        {_summary_statements('old', -1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cigar_reviews_summary_update AFTER UPDATE OF {', '.join(SUMMARY_DIMENSIONS)}, rating, price_cents ON cigar_reviews BEGIN
+        {_summary_statements('old', -1)}
+        {_summary_statements('new', 1)}
+    END""",
+]
+
+# the 14 writable columns in the same order as the INSERT_QUERY placeholders (used by the bulk importer)
+INSERT_COLUMNS = [
+    'brand', 'line', 'vitola', 'ring_gauge', 'country', 'wrapper', 'binder', 'filler',
+    'date_smoked', 'rating', 'notes', 'price_cents', 'humidor', 'tags'
+]
+
+# UpdateCigarReview and PatchCigarReview stamp updated_at to the millisecond so two edits within the same second still
+# leave different values behind for the optimistic concurrency check
+PATCH_UPDATED_AT = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# the statements below are kept as module level constants so every call passes the exact same SQL text
+# and sqlite3 can reuse the prepared statement from the connection's statement cache
+UPDATE_QUERY = f"""UPDATE cigar_reviews 
+    SET brand = ?, line = ?, vitola = ?, ring_gauge = ?, country = ?, wrapper = ?, binder = ?, filler = ?, 
+        date_smoked = ?, rating = ?, notes = ?, price_cents = ?, humidor = ?, tags = ?, 
+        updated_at = {PATCH_UPDATED_AT}
+    WHERE id = ?"""
+
+DELETE_QUERY = "DELETE FROM cigar_reviews WHERE id = ?"
+
+SELECT_ALL_QUERY = "SELECT * FROM cigar_reviews"
+
+SELECT_BY_ID_QUERY = "SELECT * FROM cigar_reviews WHERE id = ?"
+
+# number of prepared statements each long lived connection keeps around
+STATEMENT_CACHE_SIZE = 256
+
+# seconds a connection waits on another connection's lock before giving up with "database is locked"
+BUSY_TIMEOUT = 5.0
+
+# the single writer (writer.py) commits up to this many queued writes together in one transaction,
+# and retries a batch that still hits a lock after BUSY_TIMEOUT with exponential backoff
+WRITE_BATCH_SIZE = 256
+WRITE_RETRIES = 8
+WRITE_RETRY_BACKOFF = 0.01          # seconds before the first retry, doubled after each one
+WRITE_RETRY_MAX_BACKOFF = 1.0
+
+# storage profile applied to every connection when it is opened (journal_mode is remembered by the database file)
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",       # readers keep reading while a writer commits instead of blocking on each other
+    "PRAGMA synchronous = NORMAL",     # with WAL this is still corruption safe, it just skips an fsync per commit
+    "PRAGMA cache_size = -65536",      # 64 MiB page cache (negative values are KiB)
+    "PRAGMA mmap_size = 268435456",    # read up to 256 MiB of the file through memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",      # ORDER BY / GROUP BY scratch b-trees stay in memory
+]
+
+# default number of rows inserted per transaction by the bulk import path
+IMPORT_BATCH_SIZE = 1000
+
+# default number of ranked results returned by a full-text search
+SEARCH_RESULT_LIMIT = 50
+
+# default number of rows per page when streaming reviews with keyset pagination
+FETCH_PAGE_SIZE = 500
+
+# default number of rows fetched and encoded at a time by the columnar export
+EXPORT_CHUNK_SIZE = 10000
+
+# online backups copy this many database pages per step and sleep between steps (seconds) so other
+# connections can keep reading and writing while a large ledger is copied
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP = 0.005
+
+# text columns that repeat the same few values across many reviews: the columnar export dictionary encodes them
+# and compact review records share one string object per distinct value
+LOW_CARDINALITY_COLUMNS = ['brand', 'line', 'vitola', 'country', 'wrapper', 'binder', 'filler', 'humidor']
+
+# number of reviews kept by the FetchCigarReviewById read-through cache (0 turns the cache off)
+REVIEW_CACHE_SIZE = 1024
+
 # used by pandas dataframe to display all columns in the fetch all reviews option
 ALL_COLUMNS = [
     'id', 'brand', 'line', 'vitola', 'ring_gauge', 'country', 'wrapper', 
     'binder', 'filler', 'date_smoked', 
     'rating', 'notes', 'price_cents', 'humidor', 'tags', 
     'created_at', 'updated_at'
-]
\ No newline at end of file
+]
+
+# change data capture log for incremental sync: every insert, update and delete on cigar_reviews appends one row
+# with a monotonic sequence number (AUTOINCREMENT so numbers are never reused, even after pruning)
+CHANGE_LOG_QUERIES = [
+    """CREATE TABLE IF NOT EXISTS review_changes(
+        seq             INTEGER PRIMARY KEY AUTOINCREMENT,
+        operation       TEXT    NOT NULL,                   -- 'insert', 'update' or 'delete'
+        review_id       INTEGER NOT NULL,
+        changed_columns TEXT,                               -- CSV of the columns an update changed, NULL otherwise
+        changed_at      TEXT    NOT NULL DEFAULT (datetime('now'))
+    )""",
+    # on a replica, the last source sequence applied, written in the same transaction as the changes themselves
+    """CREATE TABLE IF NOT EXISTS review_sync_state(
+        source   TEXT    NOT NULL PRIMARY KEY,
+        last_seq INTEGER NOT NULL
+    )""",
+]
+
+_CHANGED_COLUMNS = " || ".join(f"CASE WHEN old.{column} IS NOT new.{column} THEN '{column},' ELSE '' END" for column in ALL_COLUMNS[1:])
+
+CHANGE_TRIGGER_QUERIES = [
+    """CREATE TRIGGER IF NOT EXISTS cigar_reviews_changes_insert AFTER INSERT ON cigar_reviews BEGIN
+        INSERT INTO review_changes (operation, review_id) VALUES ('insert', new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cigar_reviews_changes_delete AFTER DELETE ON cigar_reviews BEGIN
+        INSERT INTO review_changes (operation, review_id) VALUES ('delete', old.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS cigar_reviews_changes_update AFTER UPDATE ON cigar_reviews BEGIN
+        INSERT INTO review_changes (operation, review_id, changed_columns) VALUES ('update', new.id, rtrim({_CHANGED_COLUMNS}, ','));
+    END""",
+]
+
+# replicas write whole rows by id, inserting new reviews and overwriting existing ones
+UPSERT_QUERY = f"""INSERT INTO cigar_reviews ({', '.join(ALL_COLUMNS)}) VALUES ({', '.join('?' * len(ALL_COLUMNS))})
+    ON CONFLICT (id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in ALL_COLUMNS[1:])}"""
+
+# default number of changes read per FetchReviewChanges call
+CHANGE_BATCH_SIZE = 1000
+
+# time-series rollups of spend and ratings by date_smoked, period name -> strftime bucket format
+ROLLUP_PERIODS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+
+# number of periods (the current one included) averaged by the moving columns of a rollup
+ROLLUP_MOVING_WINDOW = 3
+
+# number of rollup results kept by FetchReviewRollup, keyed on the filters and the ledger's change sequence
+ROLLUP_CACHE_SIZE = 64
+
+# one row per period that has reviews; the moving and cumulative columns come from window functions over those rows
+# (a skipped price is stored as '' by the menu, so like the summary tables both '' and NULL count as "no price")
+ROLLUP_QUERY = """WITH periods AS (
+        SELECT strftime(?, date_smoked) AS period, COUNT(*) AS reviews, SUM(rating) AS rating_total,
+            SUM(COALESCE(NULLIF(price_cents, ''), 0)) AS spend, COUNT(NULLIF(price_cents, '')) AS priced
+        FROM cigar_reviews WHERE strftime(?, date_smoked) IS NOT NULL AND ({where_sql})
+        GROUP BY period
+    )
+    SELECT period, reviews, spend, ROUND(1.0 * rating_total / reviews, 2),
+        CAST(ROUND(1.0 * spend / NULLIF(priced, 0)) AS INTEGER),
+        ROUND(1.0 * SUM(rating_total) OVER moving / SUM(reviews) OVER moving, 2),
+        SUM(spend) OVER moving,
+        SUM(spend) OVER (ORDER BY period ROWS UNBOUNDED PRECEDING)
+    FROM periods
+    WINDOW moving AS (ORDER BY period ROWS BETWEEN ? PRECEDING AND CURRENT ROW)
+    ORDER BY period"""
+
+ROLLUP_COLUMNS = ['period', 'reviews', 'spend_cents', 'avg_rating', 'avg_price_cents',
+                  'moving_avg_rating', 'moving_spend_cents', 'cumulative_spend_cents']
+
+# approximate analytics (approx.py): reviews sampled for the quick overview, the quantiles it estimates,
+# the columns whose distinct values are counted with a HyperLogLog sketch and the sketch precision
+# (2**precision registers, relative standard error 1.04 / sqrt(2**precision), about 1.6% at 12)
+APPROX_SAMPLE_SIZE = 10000
+APPROX_QUANTILES = [0.25, 0.5, 0.75, 0.9]
+APPROX_DISTINCT_COLUMNS = ['brand', 'line', 'country']
+HLL_PRECISION = 12
+
+# z score for the error bounds reported with approximate results (95% confidence)
+APPROX_CONFIDENCE_Z = 1.96
+
+# ledger-wide HyperLogLog sketches kept by approx.py, brought up to date from review_changes on each use
+# instead of rescanning, last_seq is the change log position they include and stale counts the deletes and
+# edits of the column since they were built (a sketch cannot forget a value, so each may have removed one)
+SKETCH_TABLE_QUERY = """CREATE TABLE IF NOT EXISTS review_sketches(
+    name       TEXT    NOT NULL PRIMARY KEY,   -- the sketched cigar_reviews column
+    precision  INTEGER NOT NULL,
+    registers  BLOB    NOT NULL,
+    last_seq   INTEGER NOT NULL,
+    stale      INTEGER NOT NULL
+)"""
+
+# a sketch is rebuilt with a full pass once its stale changes exceed this share of the reviews
+APPROX_SKETCH_STALE_FRACTION = 0.02
@@ -1,117 +1,936 @@
+import json
 import sqlite3
-from constants import DATABASE_NAME, CREATE_QUERY, INSERT_QUERY
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+from constants import (DATABASE_NAME, CREATE_QUERY, INSERT_QUERY, UPDATE_QUERY, DELETE_QUERY,
+                       SELECT_ALL_QUERY, SELECT_BY_ID_QUERY, STATEMENT_CACHE_SIZE, CONNECTION_PRAGMAS, IMPORT_BATCH_SIZE,
+                       FETCH_PAGE_SIZE, ALL_COLUMNS, INDEX_QUERIES, TAG_TABLE_QUERIES,
+                       FTS_TABLE_QUERY, FTS_TRIGGER_QUERIES, SEARCH_RESULT_LIMIT,
+                       SUMMARY_DIMENSIONS, SUMMARY_TABLE_QUERIES, SUMMARY_TRIGGER_QUERIES, REVIEW_CACHE_SIZE,
+                       INSERT_COLUMNS, PATCH_UPDATED_AT, CHANGE_LOG_QUERIES, CHANGE_TRIGGER_QUERIES, UPSERT_QUERY,
+                       CHANGE_BATCH_SIZE, BUSY_TIMEOUT, ROLLUP_PERIODS, ROLLUP_MOVING_WINDOW, ROLLUP_CACHE_SIZE,
+                       ROLLUP_QUERY, PRICE_INDEX_QUERY, DROP_OLD_PRICE_INDEX_QUERY, SKETCH_TABLE_QUERY)
+from cache import LruCache
+from records import RecordFactory
+from query import CompileReviewFilters, SplitTags, BuildSearchQuery
+from instrumentation import Instrument, Enabled as InstrumentationEnabled, RecordStatement, RecordTransaction
 
-def InitializeDatabase(): 
-    print("Initializing database...")
-    
-    # define database connection
-    connection = sqlite3.connect(DATABASE_NAME)
-    print("Database connection established.")
+# one long lived connection per thread, keyed by thread id so CloseDatabaseConnection can shut them all down
+# each entry is (database_name, connection) so a connection is reopened if DATABASE_NAME changes (the tests do this)
+_connections = {}
+_connections_lock = threading.Lock()
+
+class UpdateConflict(RuntimeError):
+    """Raised by PatchCigarReview when the review was changed by someone else since the caller read it."""
+
+    def __init__(self, id, expected_updated_at, current_updated_at):
+        super().__init__(f"Cigar review with ID {id} was modified at {current_updated_at}, expected {expected_updated_at}")
+        self.id = id
+        self.expected_updated_at = expected_updated_at
+        self.current_updated_at = current_updated_at
+
+# FetchReviewRollup results keyed by (database, change sequence, period, window, filters), see _ChangeSequence
+_rollup_cache = LruCache(ROLLUP_CACHE_SIZE)
+
+# per thread bookkeeping for nested Transaction() blocks and the data_version last seen by the thread's connection
+_local = threading.local()
+
+# read-through cache of FetchCigarReviewById results keyed by (database, id), see _ReviewCacheIsCurrent
+_review_cache = LruCache(REVIEW_CACHE_SIZE)
+
+
+def GetDatabaseConnection():
+    """Return the open connection for the calling thread, opening it on first use."""
+    key = threading.get_ident()
+    with _connections_lock:
+        entry = _connections.get(key)
+
+    if entry is not None:
+        database_name, connection = entry
+        if database_name == DATABASE_NAME:
+            return connection
+        # the database file changed underneath us, drop the stale handle
+        connection.close()
+
+    # check_same_thread=False only so CloseDatabaseConnection can close every thread's handle on shutdown,
+    # each connection is still only ever used by the thread that opened it
+    connection = sqlite3.connect(DATABASE_NAME, timeout=BUSY_TIMEOUT, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in CONNECTION_PRAGMAS:
+        connection.execute(pragma)
+    with _connections_lock:
+        _connections[key] = (DATABASE_NAME, connection)
+    return connection
+
+
+def UseDatabase(path):
+    """Point every later call in this module at another database file (each thread reconnects on its next call)."""
+    global DATABASE_NAME
+    DATABASE_NAME = path
+
+
+def ConfigureBusyTimeout(seconds=BUSY_TIMEOUT):
+    """Set how long connections wait on another connection's lock, for this thread's connection and every new one."""
+    global BUSY_TIMEOUT
+    if seconds < 0:
+        raise ValueError("busy timeout cannot be negative")
+    BUSY_TIMEOUT = seconds
+    GetDatabaseConnection().execute(f"PRAGMA busy_timeout = {int(seconds * 1000)}")
+
+def IsBusyError(error):
+    """True if error is SQLite reporting that another connection holds the lock (SQLITE_BUSY or SQLITE_LOCKED)."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        # the extended result codes keep the primary code in the low byte
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+@contextmanager
+def Transaction():
+    """
+    Yield a cursor on the thread's connection and commit when the block exits cleanly.
 
-    # define cursor used to query the database and execute SQL commands
+    Any exception rolls the whole block back. Nested Transaction() blocks join the
+    outermost one so helpers can be composed into a single atomic unit of work.
+    """
+    connection = GetDatabaseConnection()
+    depth = getattr(_local, "depth", 0)
+    # statement tracing is only switched on while instrumentation is enabled so it costs nothing otherwise
+    instrumented = depth == 0 and InstrumentationEnabled()
+    if instrumented:
+        connection.set_trace_callback(RecordStatement)
+        start = time.perf_counter()
     cursor = connection.cursor()
+    _local.depth = depth + 1
+    committed = False
+    try:
+        yield cursor
+        if depth == 0:
+            connection.commit()
+            committed = True
+    except BaseException:
+        if depth == 0:
+            connection.rollback()
+        raise
+    finally:
+        _local.depth = depth
+        cursor.close()
+        if instrumented:
+            connection.set_trace_callback(None)
+            RecordTransaction(time.perf_counter() - start, committed)
+
+
+def _CreateReviewsTable(cursor):
+    """cigar_reviews table and the Query Reviews indexes"""
+    # will not recreate the table if it already exists, see the query in constants.py
+    cursor.execute(CREATE_QUERY)
+    for index_query in INDEX_QUERIES:
+        cursor.execute(index_query)
+
+def _CreateTagIndex(cursor):
+    """normalized tag index, filled from the existing CSV tags"""
+    for tag_query in TAG_TABLE_QUERIES:
+        cursor.execute(tag_query)
+    _RebuildTagIndex(cursor)
+
+def _CreateSearchIndex(cursor):
+    """full-text index over notes, filled from the existing rows"""
+    cursor.execute(FTS_TABLE_QUERY)
+    for trigger_query in FTS_TRIGGER_QUERIES:
+        cursor.execute(trigger_query)
+    cursor.execute("INSERT INTO cigar_reviews_fts (cigar_reviews_fts) VALUES ('rebuild')")
+
+def _CreateReviewSummaries(cursor):
+    """report summary tables, totalled from the existing rows"""
+    for summary_query in SUMMARY_TABLE_QUERIES + SUMMARY_TRIGGER_QUERIES:
+        cursor.execute(summary_query)
+    _RebuildReviewSummaries(cursor)
+
+def _CreateChangeLog(cursor):
+    """change log for incremental sync, seeded with an insert for every existing review"""
+    for change_query in CHANGE_LOG_QUERIES + CHANGE_TRIGGER_QUERIES:
+        cursor.execute(change_query)
+    # so a replica reading from sequence 0 receives the whole ledger, not just what changes from now on
+    cursor.execute("INSERT INTO review_changes (operation, review_id) SELECT 'insert', id FROM cigar_reviews ORDER BY id")
+
+def _CreatePriceIndex(cursor):
+    """index for the price range filters, which treat an unpriced '' as NULL"""
+    cursor.execute(PRICE_INDEX_QUERY)
+
+def _DropOldPriceIndex(cursor):
+    """drop the price_cents index the price filters no longer use"""
+    cursor.execute(DROP_OLD_PRICE_INDEX_QUERY)
+
+def _CreateSketchTable(cursor):
+    """stored distinct-count sketches for the approximate overview"""
+    cursor.execute(SKETCH_TABLE_QUERY)
+
+# Schema migrations, applied in order. PRAGMA user_version records how many have run, so each one runs exactly once
+# per database. Never edit or reorder a released migration, append a new function instead. They all use IF NOT EXISTS
+# because ledgers created before versioning existed already have some of these objects at user_version 0.
+MIGRATIONS = [
+    _CreateReviewsTable,
+    _CreateTagIndex,
+    _CreateSearchIndex,
+    _CreateReviewSummaries,
+    _CreateChangeLog,
+    _CreatePriceIndex,
+    _DropOldPriceIndex,
+    _CreateSketchTable,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def GetSchemaVersion():
+    """Return the number of migrations applied to the current database."""
+    with Transaction() as cursor:
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+
+@Instrument
+def InitializeDatabase():
+    print("Initializing database...")
+
+    # define database connection (opened once and reused by every other function in this module)
+    GetDatabaseConnection()
+    print("Database connection established.")
 
-    # create the cigar_reviews table
     print("Creating database and tables if they do not exist...")
-    command_create_db_if_exists = CREATE_QUERY 
+    version = GetSchemaVersion()
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this version of MyLeafLedger supports ({SCHEMA_VERSION}).")
 
-    # execute the cursor to call the create table query (will not recreate if it already exists see the query in constants.py)
-    cursor.execute(command_create_db_if_exists)
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        with Transaction() as cursor:
+            # BEGIN IMMEDIATE takes the write lock up front, then the version is re-read in case another process migrated first
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("PRAGMA user_version")
+            if cursor.fetchone()[0] >= number:
+                continue
+            print(f"Applying schema migration {number}: {migration.__doc__}...")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
     print("Table creation command executed successfully.")
-    
-    # commit the changes to the database
-    connection.commit()
-
-    # fetching all cigars from the cigar_reviews table 
-    #print("Fetching all records from cigar_reviews table...")
-    #cursor.execute("SELECT * FROM cigar_reviews")
-    #records = cursor.fetchall()
-    #print(f"Fetched {len(records)} records from cigar_reviews table.")  
-    #print(records)  # print the fetched records
-    
-    # close the cursor
-    cursor.close()
 
     print("Database initialization completed successfully.")
 
 
+@Instrument
 def CloseDatabaseConnection():
     print("Closing database connection...")
-    connection = sqlite3.connect(DATABASE_NAME)
-    connection.close()
+    with _connections_lock:
+        entries = list(_connections.values())
+        _connections.clear()
+
+    for _, connection in entries:
+        try:
+            # let SQLite refresh the planner statistics for the indexes it found useful before the handle goes away
+            connection.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            # a locked, busy or read-only database only skips the statistics, the connection is still closed
+            print(f"Skipped PRAGMA optimize: {e}")
+        finally:
+            connection.close()
+    _review_cache.Clear()
+    _rollup_cache.Clear()
     print("Database connection closed.")
 
+def CloseThreadConnection(thread_id=None):
+    """
+    Close just one thread's connection, e.g. when a long lived worker thread exits.
+
+    Args:
+        thread_id (int): threading.get_ident() of a thread that has finished, the calling thread when None
+    """
+    with _connections_lock:
+        entry = _connections.pop(threading.get_ident() if thread_id is None else thread_id, None)
+    if entry is not None:
+        entry[1].close()
+
+def _ReviewCacheIsCurrent(connection):
+    """
+    Clear the review cache if another connection has committed since this thread last looked.
+
+    PRAGMA data_version only changes when a different connection (another thread here, or another process)
+    commits to the database, so writes made through this module's own functions invalidate precisely and
+    anything else drops the whole cache. A connection the thread has not checked before has no baseline yet,
+    so the cache is cleared then as well.
+    """
+    version = connection.execute("PRAGMA data_version").fetchone()[0]
+    seen = getattr(_local, "data_version", None)
+    if seen is None or seen[0] is not connection or seen[1] != version:
+        _local.data_version = (connection, version)
+        if seen is not None or _review_cache.Stats()['size']:
+            _review_cache.Clear()
+
+def _ReviewKey(id):
+    """Review cache key, the same for an id typed at the menu ("12") and one read back from SQLite (12)."""
+    try:
+        id = int(id)
+    except (TypeError, ValueError):
+        # not an id SQLite could match, it is never cached so the key only has to be consistent
+        pass
+    return (DATABASE_NAME, id)
+
+def ConfigureReviewCache(size=REVIEW_CACHE_SIZE):
+    """Resize the FetchCigarReviewById cache (0 turns it off)."""
+    _review_cache.Resize(size)
+    if size == 0:
+        _review_cache.Clear()
+
+def ClearReviewCache():
+    """Forget every cached review."""
+    _review_cache.Clear()
+
+def ReviewCacheStats():
+    """Return the cache counters: hits, misses, evictions, invalidations, clears, size, capacity and hit_rate."""
+    return _review_cache.Stats()
+
+def _SyncReviewTags(cursor, review_id, tags):
+    # replace the review's rows in review_tags with the tags from its CSV tags column
+    cursor.execute("DELETE FROM review_tags WHERE review_id = ?", (review_id,))
+    for tag in SplitTags(tags):
+        cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag,))
+        cursor.execute("INSERT OR IGNORE INTO review_tags (review_id, tag_id) SELECT ?, id FROM tags WHERE name = ?", (review_id, tag))
+
+def _RebuildTagIndex(cursor):
+    cursor.execute("DELETE FROM review_tags")
+    cursor.execute("SELECT id, tags FROM cigar_reviews WHERE tags IS NOT NULL AND tags != ''")
+    for review_id, tags in cursor.fetchall():
+        _SyncReviewTags(cursor, review_id, tags)
+
+@Instrument
+def RebuildTagIndex():
+    """Repopulate tags/review_tags from the CSV tags column of every review."""
+    print("Rebuilding tag index...")
+    with Transaction() as cursor:
+        _RebuildTagIndex(cursor)
+    print("Tag index rebuilt.")
+
+def _RebuildReviewSummaries(cursor):
+    for dimension in SUMMARY_DIMENSIONS:
+        cursor.execute(f"DELETE FROM {dimension}_summary")
+        cursor.execute(f"""INSERT INTO {dimension}_summary ({dimension}, review_count, rating_total, price_total, priced_count)
+            SELECT COALESCE({dimension}, ''), COUNT(*), SUM(rating), SUM(COALESCE(NULLIF(price_cents, ''), 0)), COUNT(NULLIF(price_cents, ''))
+            FROM cigar_reviews GROUP BY COALESCE({dimension}, '') COLLATE NOCASE""")
+
+@Instrument
+def RebuildReviewSummaries():
+    """Recompute every summary table from scratch (the triggers keep them current after that)."""
+    print("Rebuilding review summaries...")
+    with Transaction() as cursor:
+        _RebuildReviewSummaries(cursor)
+    print("Review summaries rebuilt.")
+
+@Instrument
 def AddCigarReview(brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags):
     print("Adding a new cigar review...")
-    connection = sqlite3.connect(DATABASE_NAME)
-    cursor = connection.cursor()
-  
-    cursor.execute(INSERT_QUERY, (brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags))
-    
-    connection.commit()
-    cursor.close()
-    connection.close()
+    with Transaction() as cursor:
+        cursor.execute(INSERT_QUERY, (brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags))
+        _SyncReviewTags(cursor, cursor.lastrowid, tags)
     print("Cigar review added successfully.")
 
-def FetchAllCigarReviews():
+@Instrument
+def BulkAddCigarReviews(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Insert many reviews with executemany, committing once per batch.
+
+    Args:
+        rows (iterable): 14-value tuples in INSERT_QUERY column order, consumed lazily
+        batch_size (int): number of rows written per transaction
+
+    Returns:
+        int: the number of rows inserted
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    print(f"Bulk adding cigar reviews in batches of {batch_size}...")
+    rows = iter(rows)
+    inserted = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        with Transaction() as cursor:
+            cursor.executemany(INSERT_QUERY, batch)
+            # the batch holds the write lock, so its rows got the highest, consecutive ids
+            cursor.execute("SELECT id, tags FROM cigar_reviews WHERE id > (SELECT MAX(id) FROM cigar_reviews) - ? AND tags IS NOT NULL AND tags != ''", (len(batch),))
+            for review_id, tags in cursor.fetchall():
+                _SyncReviewTags(cursor, review_id, tags)
+        inserted += len(batch)
+
+    print(f"Bulk added {inserted} cigar reviews.")
+    return inserted
+
+@Instrument
+def FetchAllCigarReviews(columns=None, as_records=False):
+    """
+    Return every review in id order.
+
+    Args:
+        columns (list): column names to select in that order, all columns when None
+        as_records (bool): return compact review records (see records.py) instead of plain tuples
+
+    Returns:
+        list: the row tuples or records
+    """
     print("Fetching all cigar reviews...")
-    connection = sqlite3.connect(DATABASE_NAME)
-    cursor = connection.cursor()
-    
-    cursor.execute("SELECT * FROM cigar_reviews")
-    records = cursor.fetchall()
-    
-    cursor.close()
-    connection.close()
-    
+    with Transaction() as cursor:
+        if as_records:
+            cursor.row_factory = RecordFactory(_ProjectedColumns(columns))
+        if columns is None:
+            cursor.execute(SELECT_ALL_QUERY)
+        else:
+            cursor.execute(f"SELECT {', '.join(_ProjectedColumns(columns))} FROM cigar_reviews ORDER BY id")
+        records = cursor.fetchall()
+
     print(f"Fetched {len(records)} cigar reviews.")
     return records
 
+def _ProjectedColumns(columns):
+    # column names cannot be bound as parameters, so only names from the schema are ever put into SQL
+    if columns is None:
+        return list(ALL_COLUMNS)
+    unknown = [column for column in columns if column not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown cigar_reviews column(s): {', '.join(unknown)}")
+    return list(columns)
+
+@Instrument
+def FetchCigarReviewPages(page_size=FETCH_PAGE_SIZE, columns=None, after_id=0, filters=None, as_records=False):
+    """
+    Stream cigar reviews in id order, one page (list of row tuples) at a time.
+
+    Pages are fetched with keyset pagination (WHERE id > last id seen) rather than OFFSET,
+    so every page is a primary key seek no matter how deep into the ledger it is.
+
+    Args:
+        page_size (int): maximum rows per page
+        columns (list): column names to select in that order, all columns when None
+        after_id (int): only rows with an id greater than this are returned
+        filters (dict): optional Query Reviews filters, see query.py
+        as_records (bool): yield compact review records (see records.py) instead of plain tuples
+
+    Yields:
+        list: the rows of the next page, never empty
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+
+    columns = _ProjectedColumns(columns)
+    # the id is needed to find where the next page starts even when the caller does not want it
+    include_id = 'id' not in columns
+    select_columns = ['id'] + columns if include_id else columns
+    id_index = select_columns.index('id')
+    where_sql, params = CompileReviewFilters(filters)
+    query = f"SELECT {', '.join(select_columns)} FROM cigar_reviews WHERE id > ? AND ({where_sql}) ORDER BY id LIMIT ?"
+    # one factory for the whole stream so every page shares the same pool of brand, country, ... strings
+    make_record = RecordFactory(columns, skip=1 if include_id else 0) if as_records else None
+
+    last_id = after_id
+    while True:
+        with Transaction() as cursor:
+            cursor.execute(query, (last_id, *params, page_size))
+            page = cursor.fetchall()
+        if not page:
+            return
+
+        last_id = page[-1][id_index]
+        if make_record:
+            yield [make_record(None, row) for row in page]
+        else:
+            yield [row[1:] for row in page] if include_id else page
+
+        if len(page) < page_size:
+            return
+
+@Instrument
+def QueryCigarReviews(filters, columns=None, limit=None, as_records=False):
+    """
+    Return the reviews matching the Query Reviews filters in id order.
+
+    Args:
+        filters (dict): filter key to value, see query.py for the supported keys
+        columns (list): column names to select in that order, all columns when None
+        limit (int): maximum number of rows to return, unlimited when None
+        as_records (bool): return compact review records (see records.py) instead of plain tuples
+
+    Returns:
+        list: the matching row tuples
+    """
+    print(f"Querying cigar reviews with filters {filters}...")
+    columns = _ProjectedColumns(columns)
+    where_sql, params = CompileReviewFilters(filters)
+    query = f"SELECT {', '.join(columns)} FROM cigar_reviews WHERE {where_sql} ORDER BY id"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    with Transaction() as cursor:
+        if as_records:
+            cursor.row_factory = RecordFactory(columns)
+        cursor.execute(query, params)
+        records = cursor.fetchall()
+
+    print(f"Found {len(records)} matching cigar reviews.")
+    return records
+
+@Instrument
+def FetchCigarReviewsByTags(tags, match_all=True, columns=None, as_records=False):
+    """
+    Return the reviews carrying all (AND) or any (OR) of the given tags.
+
+    Args:
+        tags (str | list): CSV string or list of tags, matched case-insensitively
+        match_all (bool): True for reviews with every tag, False for reviews with at least one
+        columns (list): column names to select in that order, all columns when None
+        as_records (bool): return compact review records (see records.py) instead of plain tuples
+
+    Returns:
+        list: the matching row tuples in id order
+    """
+    if not SplitTags(tags):
+        return []
+    return QueryCigarReviews({'tags_all' if match_all else 'tags_any': tags}, columns=columns, as_records=as_records)
+
+@Instrument
+def SearchCigarReviews(text, limit=SEARCH_RESULT_LIMIT, columns=None, as_records=False):
+    """
+    Full-text search over brand, line, vitola and notes, best matches first.
+
+    Args:
+        text (str): words to look for, all of them must match, "word*" matches a prefix
+        limit (int): maximum number of results
+        columns (list): column names to select in that order, all columns when None
+        as_records (bool): return compact review records (see records.py) instead of plain tuples
+
+    Returns:
+        list: the matching row tuples ordered by FTS5 bm25 rank
+    """
+    print(f"Searching cigar reviews for '{text}'...")
+    match = BuildSearchQuery(text)
+    if not match:
+        return []
+
+    columns = _ProjectedColumns(columns)
+    select_columns = ', '.join(f"cigar_reviews.{column}" for column in columns)
+    query = f"""SELECT {select_columns} FROM cigar_reviews_fts
+        JOIN cigar_reviews ON cigar_reviews.id = cigar_reviews_fts.rowid
+        WHERE cigar_reviews_fts MATCH ? ORDER BY cigar_reviews_fts.rank LIMIT ?"""
+
+    with Transaction() as cursor:
+        if as_records:
+            cursor.row_factory = RecordFactory(columns)
+        cursor.execute(query, (match, limit))
+        records = cursor.fetchall()
+
+    print(f"Found {len(records)} matching cigar reviews.")
+    return records
+
+@Instrument
+def FetchReviewSummary(dimension):
+    """
+    Read the pre-aggregated totals for one grouping column, largest groups first.
+
+    Args:
+        dimension (str): one of SUMMARY_DIMENSIONS ('brand', 'country' or 'humidor')
+
+    Returns:
+        list: (group, review_count, average_rating, total_price_cents, average_price_cents) tuples,
+              average_price_cents is None for groups without any priced reviews
+    """
+    if dimension not in SUMMARY_DIMENSIONS:
+        raise ValueError(f"Unknown summary dimension: {dimension}")
+
+    print(f"Fetching review summary by {dimension}...")
+    with Transaction() as cursor:
+        cursor.execute(f"""SELECT {dimension}, review_count, ROUND(1.0 * rating_total / review_count, 2),
+            price_total, CAST(ROUND(1.0 * price_total / NULLIF(priced_count, 0)) AS INTEGER)
+            FROM {dimension}_summary ORDER BY review_count DESC, {dimension}""")
+        records = cursor.fetchall()
+
+    print(f"Fetched {len(records)} {dimension} groups.")
+    return records
+
+def _ChangeSequence(cursor):
+    # every insert, update and delete appends to review_changes, so its AUTOINCREMENT counter works as a version
+    # number for cigar_reviews that also moves on this connection's own commits (PRAGMA data_version does not)
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'review_changes'")
+    record = cursor.fetchone()
+    return record[0] if record else 0
+
+def ClearRollupCache():
+    """Forget every cached rollup, e.g. after the database file was replaced by a restore."""
+    _rollup_cache.Clear()
+
+def RollupCacheStats():
+    """Return the rollup cache counters: hits, misses, evictions, invalidations, clears, size, capacity and hit_rate."""
+    return _rollup_cache.Stats()
+
+@Instrument
+def FetchReviewRollup(period='month', moving_window=ROLLUP_MOVING_WINDOW, filters=None):
+    """
+    Aggregate spend, review counts and ratings per day, month or year of date_smoked.
+
+    Results are cached until the ledger next changes, so dashboards that ask again do not rescan cigar_reviews.
+    The moving columns cover the last moving_window periods that have reviews (periods without any are
+    skipped rather than counted as zero).
+
+    Args:
+        period (str): one of ROLLUP_PERIODS ('day', 'month' or 'year')
+        moving_window (int): number of periods in the moving average and moving spend, the current one included
+        filters (dict): optional Query Reviews filters, see query.py
+
+    Returns:
+        list: (period, reviews, spend_cents, average_rating, average_price_cents, moving_average_rating,
+              moving_spend_cents, cumulative_spend_cents) tuples in period order, see ROLLUP_COLUMNS;
+              average_price_cents is None for periods without any priced reviews
+    """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown rollup period: {period}")
+    if moving_window < 1:
+        raise ValueError("moving_window must be at least 1")
+
+    print(f"Fetching {period}ly review rollup...")
+    where_sql, params = CompileReviewFilters(filters)
+    bucket = ROLLUP_PERIODS[period]
+    # inside a caller's open transaction the sequence may still be rolled back and then reused, so bypass the cache
+    cacheable = not getattr(_local, "depth", 0)
+    with Transaction() as cursor:
+        found = False
+        if cacheable:
+            # the sequence is read before the rollup, so a result can only ever be newer than its key, never older
+            key = (DATABASE_NAME, _ChangeSequence(cursor), period, moving_window, repr(sorted((filters or {}).items())))
+            found, records = _rollup_cache.Get(key)
+            generation = records
+        if not found:
+            cursor.execute(ROLLUP_QUERY.format(where_sql=where_sql), (bucket, bucket, *params, moving_window - 1))
+            records = cursor.fetchall()
+            if cacheable:
+                _rollup_cache.Put(key, records, generation)
+
+    print(f"Fetched {len(records)} {period} periods.")
+    return list(records)
+
+@Instrument
 def DeleteCigarReview(id):
     print(f"Deleting cigar review with ID {id}...")
-    connection = sqlite3.connect(DATABASE_NAME)
-    cursor = connection.cursor()
-    
-    cursor.execute("DELETE FROM cigar_reviews WHERE id = ?", (id,))
-    
-    connection.commit()
-    cursor.close()
-    connection.close()
+    try:
+        with Transaction() as cursor:
+            cursor.execute(DELETE_QUERY, (id,))
+            cursor.execute("DELETE FROM review_tags WHERE review_id = ?", (id,))
+    finally:
+        _review_cache.Invalidate(_ReviewKey(id))
     print(f"Cigar review with ID {id} deleted successfully.")
-    
-def FetchCigarReviewById(id):
+
+@Instrument
+def FetchCigarReviewById(id, columns=None, as_records=False):
+    """
+    Return one review, or None when there is no review with that id.
+
+    Full rows are read through the review cache and then narrowed to columns, so a projected
+    lookup shares cache entries with every other lookup of the same review.
+
+    Args:
+        id (int): the review id
+        columns (list): column names to return in that order, all columns when None
+        as_records (bool): return a compact review record (see records.py) instead of a plain tuple
+
+    Returns:
+        tuple: the row, or None
+    """
     print(f"Fetching cigar review with ID {id}...")
-    connection = sqlite3.connect(DATABASE_NAME)
-    cursor = connection.cursor()
-    
-    cursor.execute("SELECT * FROM cigar_reviews WHERE id = ?", (id,))
-    record = cursor.fetchone()
-    
-    cursor.close()
-    connection.close()
-    
+    # rows read inside a caller's open transaction may still be rolled back, so they bypass the cache
+    cacheable = _review_cache.capacity and not getattr(_local, "depth", 0)
+    key = _ReviewKey(id)
+    found = False
+    if cacheable:
+        _ReviewCacheIsCurrent(GetDatabaseConnection())
+        found, record = _review_cache.Get(key)
+        generation = record
+    if not found:
+        with Transaction() as cursor:
+            cursor.execute(SELECT_BY_ID_QUERY, (id,))
+            record = cursor.fetchone()
+        # missing ids are not cached, so a later AddCigarReview never has to invalidate anything
+        if cacheable and record is not None:
+            _review_cache.Put(key, record, generation)
+
     if record:
         print(f"Cigar review found: {record}")
     else:
         print(f"No cigar review found with ID {id}.")
-    
+        return None
+
+    if columns is not None:
+        columns = _ProjectedColumns(columns)
+        record = tuple(record[ALL_COLUMNS.index(column)] for column in columns)
+    if as_records:
+        record = RecordFactory(columns or ALL_COLUMNS)(None, record)
     return record
 
+@Instrument
 def UpdateCigarReview(id, brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags):
     print(f"Updating cigar review with ID {id}...")
-    connection = sqlite3.connect(DATABASE_NAME)
-    cursor = connection.cursor()
-    
-    update_query = """UPDATE cigar_reviews 
-                      SET brand = ?, line = ?, vitola = ?, ring_gauge = ?, country = ?, wrapper = ?, binder = ?, filler = ?, 
-                          date_smoked = ?, rating = ?, notes = ?, price_cents = ?, humidor = ?, tags = ?, 
-                          updated_at = datetime('now')
-                      WHERE id = ?"""
-    
-    cursor.execute(update_query, (brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags, id))
-    
-    connection.commit()
-    cursor.close()
-    connection.close()
+    try:
+        with Transaction() as cursor:
+            cursor.execute(UPDATE_QUERY, (brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags, id))
+            if cursor.rowcount:
+                _SyncReviewTags(cursor, id, tags)
+    finally:
+        _review_cache.Invalidate(_ReviewKey(id))
     print(f"Cigar review with ID {id} updated successfully.")
-    
+
+
+def _CompileChanges(changes):
+    # column names cannot be bound as parameters, so only insert columns are accepted, and they go into the SET
+    # list in schema order so the same set of changes always produces the same SQL text (and prepared statement)
+    unknown = [column for column in changes if column not in INSERT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown or read-only cigar_reviews column(s): {', '.join(unknown)}")
+    columns = [column for column in INSERT_COLUMNS if column in changes]
+    set_sql = ', '.join([f"{column} = ?" for column in columns] + [f"updated_at = {PATCH_UPDATED_AT}"])
+    return set_sql, [changes[column] for column in columns]
+
+@Instrument
+def PatchCigarReview(id, changes, expected_updated_at=None):
+    """
+    Write only the given columns of one review and return the updated row.
+
+    The new row comes back from the UPDATE itself (RETURNING), so no follow-up SELECT is needed.
+    Passing the updated_at value the caller read turns the write into an optimistic concurrency
+    check: if the row has been updated since, nothing is written and UpdateConflict is raised.
+
+    Args:
+        id (int): the review to change
+        changes (dict): insert column name to new value, e.g. {'rating': 5}
+        expected_updated_at (str): the review's updated_at as last read, None skips the check
+
+    Returns:
+        tuple: the full updated row, or None when no review has that id
+    """
+    set_sql, params = _CompileChanges(changes)
+    if not changes:
+        return FetchCigarReviewById(id)
+
+    print(f"Patching cigar review with ID {id} ({', '.join(changes)})...")
+    query = f"UPDATE cigar_reviews SET {set_sql} WHERE id = ?"
+    params.append(id)
+    if expected_updated_at is not None:
+        query += " AND updated_at = ?"
+        params.append(expected_updated_at)
+    query += " RETURNING *"
+
+    try:
+        with Transaction() as cursor:
+            cursor.execute(query, params)
+            # fetchall steps the statement to completion so it is finished before the commit
+            records = cursor.fetchall()
+            record = records[0] if records else None
+            if record is None:
+                cursor.execute("SELECT updated_at FROM cigar_reviews WHERE id = ?", (id,))
+                current = cursor.fetchone()
+                if current is None:
+                    print(f"No cigar review found with ID {id}.")
+                    return None
+                raise UpdateConflict(id, expected_updated_at, current[0])
+            if 'tags' in changes:
+                _SyncReviewTags(cursor, id, changes['tags'])
+    finally:
+        _review_cache.Invalidate(_ReviewKey(id))
+    print(f"Cigar review with ID {id} patched successfully.")
+    return record
+
+def _CompileBulkFilters(filters):
+    where_sql, params = CompileReviewFilters(filters)
+    # an empty filter matches every review, which is never what a bulk update or delete means by accident
+    if where_sql == "1":
+        raise ValueError("Bulk operations need at least one filter")
+    return where_sql, params
+
+def _MatchingReviewIds(cursor, where_sql, params):
+    cursor.execute(f"SELECT id FROM cigar_reviews WHERE {where_sql} ORDER BY id", params)
+    return [row[0] for row in cursor.fetchall()]
+
+def _SetReviewsTags(cursor, ids, tags):
+    # the set-based form of _SyncReviewTags: give every review in ids the same tags, one statement per tag
+    ids_json = json.dumps(ids)
+    cursor.execute("DELETE FROM review_tags WHERE review_id IN (SELECT value FROM json_each(?))", (ids_json,))
+    for tag in SplitTags(tags):
+        cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag,))
+        cursor.execute("""INSERT OR IGNORE INTO review_tags (review_id, tag_id)
+            SELECT ids.value, tags.id FROM json_each(?) AS ids, tags WHERE tags.name = ?""", (ids_json, tag))
+
+@Instrument
+def BulkUpdateCigarReviews(filters, changes, dry_run=False):
+    """
+    Apply the same changes to every review matching the Query Reviews filters with one UPDATE.
+
+    Args:
+        filters (dict): Query Reviews filters, see query.py, at least one is required
+        changes (dict): insert column name to new value, e.g. {'humidor': 'Cabinet'}
+        dry_run (bool): only report which reviews would change, write nothing
+
+    Returns:
+        list: the ids of the updated (or, for a dry run, matching) reviews in id order
+    """
+    where_sql, params = _CompileBulkFilters(filters)
+    set_sql, set_params = _CompileChanges(changes)
+    if not changes:
+        raise ValueError("Bulk update needs at least one column to change")
+
+    print(f"{'Dry run: counting' if dry_run else 'Bulk updating'} cigar reviews matching {filters}...")
+    ids = []
+    try:
+        with Transaction() as cursor:
+            if dry_run:
+                ids = _MatchingReviewIds(cursor, where_sql, params)
+            else:
+                cursor.execute(f"UPDATE cigar_reviews SET {set_sql} WHERE {where_sql} RETURNING id", set_params + params)
+                ids = sorted(row[0] for row in cursor.fetchall())
+                if 'tags' in changes and ids:
+                    _SetReviewsTags(cursor, ids, changes['tags'])
+    finally:
+        if not dry_run:
+            for id in ids:
+                _review_cache.Invalidate(_ReviewKey(id))
+
+    print(f"{len(ids)} cigar reviews {'would be' if dry_run else 'were'} updated.")
+    return ids
+
+@Instrument
+def BulkDeleteCigarReviews(filters, dry_run=False):
+    """
+    Delete every review matching the Query Reviews filters with one DELETE.
+
+    Args:
+        filters (dict): Query Reviews filters, see query.py, at least one is required
+        dry_run (bool): only report which reviews would be deleted, delete nothing
+
+    Returns:
+        list: the ids of the deleted (or, for a dry run, matching) reviews in id order
+    """
+    where_sql, params = _CompileBulkFilters(filters)
+
+    print(f"{'Dry run: counting' if dry_run else 'Bulk deleting'} cigar reviews matching {filters}...")
+    ids = []
+    try:
+        with Transaction() as cursor:
+            if dry_run:
+                ids = _MatchingReviewIds(cursor, where_sql, params)
+            else:
+                # the tag filters read review_tags, so the reviews go first and their tag rows after
+                cursor.execute(f"DELETE FROM cigar_reviews WHERE {where_sql} RETURNING id", params)
+                ids = sorted(row[0] for row in cursor.fetchall())
+                cursor.execute("DELETE FROM review_tags WHERE review_id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+    finally:
+        if not dry_run:
+            for id in ids:
+                _review_cache.Invalidate(_ReviewKey(id))
+
+    print(f"{len(ids)} cigar reviews {'would be' if dry_run else 'were'} deleted.")
+    return ids
+
+@Instrument
+def FetchReviewChanges(since_seq=0, limit=CHANGE_BATCH_SIZE, connection=None):
+    """
+    Read the change log after a given sequence number, oldest first.
+
+    The log records which review changed, not the values, so each change carries the review's current
+    row (None once it has been deleted). Applying changes in order therefore always converges on the
+    source's current state, however many times a review changed in between.
+
+    Args:
+        since_seq (int): the last sequence number already seen, 0 for everything
+        limit (int): maximum number of changes to return
+        connection (sqlite3.Connection): read another ledger's log through this connection instead of
+                                         the current database, see sync.py
+
+    Returns:
+        list: dicts with seq, operation, review_id, columns (list of changed columns, None for
+              inserts and deletes) and row (a full row tuple in ALL_COLUMNS order or None)
+    """
+    select_columns = ', '.join(f"cigar_reviews.{column}" for column in ALL_COLUMNS)
+    select_sql = f"""SELECT review_changes.seq, review_changes.operation, review_changes.review_id,
+            review_changes.changed_columns, cigar_reviews.id IS NOT NULL, {select_columns}
+            FROM review_changes LEFT JOIN cigar_reviews ON cigar_reviews.id = review_changes.review_id
+            WHERE review_changes.seq > ? ORDER BY review_changes.seq LIMIT ?"""
+    if connection is not None:
+        # one statement, so it reads a single consistent snapshot of the other ledger
+        records = connection.execute(select_sql, (since_seq, limit)).fetchall()
+    else:
+        with Transaction() as cursor:
+            cursor.execute(select_sql, (since_seq, limit))
+            records = cursor.fetchall()
+
+    return [{'seq': seq, 'operation': operation, 'review_id': review_id,
+             'columns': changed_columns.split(',') if changed_columns else None,
+             'row': tuple(row) if exists else None}
+            for seq, operation, review_id, changed_columns, exists, *row in records]
+
+def GetSyncPosition(source):
+    """Return the last change sequence from source applied to the current database, 0 if none."""
+    with Transaction() as cursor:
+        cursor.execute("SELECT last_seq FROM review_sync_state WHERE source = ?", (source,))
+        record = cursor.fetchone()
+    return record[0] if record else 0
+
+@Instrument
+def ApplyReviewChanges(changes, source):
+    """
+    Apply changes read with FetchReviewChanges from another ledger to the current database.
+
+    Every change and the new sync position for source are written in one transaction, so a sync
+    that fails part way can simply be retried from GetSyncPosition(source). Changes at or below the
+    recorded position are skipped, which makes re-applying a batch harmless.
+
+    Args:
+        changes (list): change dicts from FetchReviewChanges, in sequence order
+        source (str): a stable name for the ledger the changes came from
+
+    Returns:
+        int: the new sync position for source
+    """
+    print(f"Applying {len(changes)} changes from {source}...")
+    applied = []
+    try:
+        with Transaction() as cursor:
+            cursor.execute("SELECT last_seq FROM review_sync_state WHERE source = ?", (source,))
+            record = cursor.fetchone()
+            position = record[0] if record else 0
+            for change in changes:
+                if change['seq'] <= position:
+                    continue
+                review_id, row = change['review_id'], change['row']
+                if row is None:
+                    cursor.execute(DELETE_QUERY, (review_id,))
+                    cursor.execute("DELETE FROM review_tags WHERE review_id = ?", (review_id,))
+                else:
+                    cursor.execute(UPSERT_QUERY, row)
+                    _SyncReviewTags(cursor, review_id, row[ALL_COLUMNS.index('tags')])
+                applied.append(review_id)
+                position = change['seq']
+            cursor.execute("""INSERT INTO review_sync_state (source, last_seq) VALUES (?, ?)
+                ON CONFLICT (source) DO UPDATE SET last_seq = excluded.last_seq""", (source, position))
+    finally:
+        for review_id in applied:
+            _review_cache.Invalidate(_ReviewKey(review_id))
+
+    print(f"Applied {len(applied)} changes, {source} is now synced up to change {position}.")
+    return position
+
+@Instrument
+def PruneReviewChanges(up_to_seq):
+    """Delete change log entries up to and including up_to_seq, once every replica has applied them."""
+    with Transaction() as cursor:
+        cursor.execute("DELETE FROM review_changes WHERE seq <= ?", (up_to_seq,))
+        deleted = cursor.rowcount
+    print(f"Pruned {deleted} change log entries.")
+    return deleted
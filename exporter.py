@@ -0,0 +1,289 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from constants import EXPORT_CHUNK_SIZE, ALL_COLUMNS, LOW_CARDINALITY_COLUMNS
+from db import InitializeDatabase, CloseDatabaseConnection, FetchCigarReviewPages
+
+# Columnar export of cigar_reviews for analysis, e.g.
+#   python exporter.py ledger.npz          # always available, needs only numpy
+#   python exporter.py ledger.parquet      # Parquet or Arrow IPC stream (.arrow/.arrows) when pyarrow is installed
+# and then in a notebook:
+#   frame = exporter.LoadReviews('ledger.npz')
+#
+# The table is streamed out with FetchCigarReviewPages, chunk_size rows at a time, so the whole ledger never exists
+# as a list of row tuples in memory. Repetitive text columns (brand, country, wrapper, ...) are dictionary encoded:
+# every distinct value is stored once and each row holds a small integer code, which LoadReviews turns into a
+# pandas Categorical.
+
+NPZ_FORMAT_VERSION = 1
+
+# how each column is stored, anything not listed is plain text
+DICTIONARY_COLUMNS = LOW_CARDINALITY_COLUMNS
+INTEGER_COLUMNS = ['id', 'ring_gauge', 'rating', 'price_cents']
+DATE_COLUMNS = ['date_smoked']
+TIMESTAMP_COLUMNS = ['created_at', 'updated_at']
+
+EXPORT_FORMATS = ['npz', 'parquet', 'arrow']
+
+
+def _Pyarrow():
+    # pyarrow is optional, without it only the .npz format is available
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+def _FormatFromPath(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        return 'parquet'
+    if extension in ('.arrow', '.arrows', '.feather'):
+        return 'arrow'
+    if extension == '.npz':
+        return 'npz'
+    return None
+
+def _Integer(value):
+    # main.py stores a skipped optional number as '' rather than NULL
+    return None if value is None or value == '' else int(value)
+
+def _Date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+def _Timestamp(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+class _NpzColumn:
+    """Accumulates one column chunk by chunk in its compact numpy form."""
+
+    def __init__(self, name, numpy):
+        self.name = name
+        self.np = numpy
+        self.chunks = []
+        self.masks = []
+        if name in DICTIONARY_COLUMNS:
+            self.dictionary = {}
+        elif name not in INTEGER_COLUMNS + DATE_COLUMNS + TIMESTAMP_COLUMNS:
+            self.data = bytearray()
+            self.offsets = [0]
+
+    def Append(self, values):
+        np = self.np
+        # '' is a missing value for the typed columns only, text keeps empty strings as they are
+        typed = self.name in INTEGER_COLUMNS + DATE_COLUMNS + TIMESTAMP_COLUMNS
+        self.masks.append(np.fromiter((value is None or (typed and value == '') for value in values), dtype=bool, count=len(values)))
+        if self.name in DICTIONARY_COLUMNS:
+            codes = self.dictionary
+            self.chunks.append(np.fromiter((-1 if value is None else codes.setdefault(value, len(codes)) for value in values),
+                                           dtype=np.int32, count=len(values)))
+        elif self.name in INTEGER_COLUMNS:
+            self.chunks.append(np.fromiter((_Integer(value) or 0 for value in values), dtype=np.int64, count=len(values)))
+        elif self.name in DATE_COLUMNS:
+            self.chunks.append(np.array([value or 'NaT' for value in values], dtype='datetime64[D]'))
+        elif self.name in TIMESTAMP_COLUMNS:
+            self.chunks.append(np.array([value or 'NaT' for value in values], dtype='datetime64[s]'))
+        else:
+            # variable length text as one UTF-8 buffer plus row offsets, the same layout Arrow uses
+            for value in values:
+                if value:
+                    self.data += value.encode('utf-8')
+                self.offsets.append(len(self.data))
+
+    def Arrays(self):
+        np = self.np
+        name = self.name
+        mask = np.concatenate(self.masks) if self.masks else np.zeros(0, dtype=bool)
+        arrays = {f"{name}.mask": mask}
+        if name in DICTIONARY_COLUMNS:
+            arrays[f"{name}.codes"] = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.int32)
+            arrays[f"{name}.dictionary"] = np.array(list(self.dictionary), dtype=str)
+        elif name in INTEGER_COLUMNS + DATE_COLUMNS + TIMESTAMP_COLUMNS:
+            arrays[name] = np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.int64)
+        else:
+            arrays[f"{name}.data"] = np.frombuffer(bytes(self.data), dtype=np.uint8)
+            arrays[f"{name}.offsets"] = np.array(self.offsets, dtype=np.int64)
+        return arrays
+
+
+def _ArrowSchema(pa, columns):
+    fields = []
+    for name in columns:
+        if name in DICTIONARY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        elif name in INTEGER_COLUMNS:
+            fields.append(pa.field(name, pa.int64()))
+        elif name in DATE_COLUMNS:
+            fields.append(pa.field(name, pa.date32()))
+        elif name in TIMESTAMP_COLUMNS:
+            fields.append(pa.field(name, pa.timestamp('s')))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+def _ArrowBatch(pa, schema, columns, page):
+    arrays = []
+    for index, name in enumerate(columns):
+        values = [row[index] for row in page]
+        if name in DICTIONARY_COLUMNS:
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        elif name in INTEGER_COLUMNS:
+            arrays.append(pa.array([_Integer(value) for value in values], type=pa.int64()))
+        elif name in DATE_COLUMNS:
+            arrays.append(pa.array([_Date(value) for value in values], type=pa.date32()))
+        elif name in TIMESTAMP_COLUMNS:
+            arrays.append(pa.array([_Timestamp(value) for value in values], type=pa.timestamp('s')))
+        else:
+            arrays.append(pa.array(values, type=pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def ExportReviews(path, file_format=None, chunk_size=EXPORT_CHUNK_SIZE, columns=None, filters=None, compress=False):
+    """
+    Stream cigar_reviews into a columnar file that LoadReviews can read back.
+
+    Args:
+        path (str): the file to write
+        file_format (str): 'npz', 'parquet' or 'arrow' (an Arrow IPC stream), guessed from the
+            file extension when None, falling back to parquet when pyarrow is installed and npz otherwise
+        chunk_size (int): rows fetched and encoded at a time
+        columns (list): column names to export in that order, all columns when None
+        filters (dict): optional Query Reviews filters, see query.py
+        compress (bool): zip-compress the arrays of an npz file (smaller, slower to load)
+
+    Returns:
+        dict: rows, format, bytes, seconds and rows_per_second
+    """
+    pa = _Pyarrow()
+    if file_format is None:
+        file_format = _FormatFromPath(path) or ('parquet' if pa else 'npz')
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    if file_format != 'npz' and pa is None:
+        raise RuntimeError(f"Exporting {file_format} needs pyarrow, install it or export to .npz instead")
+    columns = list(columns) if columns else list(ALL_COLUMNS)
+    unknown = [column for column in columns if column not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown cigar_reviews column(s): {', '.join(unknown)}")
+
+    print(f"Exporting cigar reviews to {path} ({file_format})...")
+    start = time.perf_counter()
+    rows = 0
+    pages = FetchCigarReviewPages(page_size=chunk_size, columns=columns, filters=filters)
+
+    if file_format == 'npz':
+        import numpy
+        encoders = [_NpzColumn(name, numpy) for name in columns]
+        for page in pages:
+            for index, encoder in enumerate(encoders):
+                encoder.Append([row[index] for row in page])
+            rows += len(page)
+        arrays = {'__meta__': numpy.array(json.dumps({'version': NPZ_FORMAT_VERSION, 'columns': columns, 'rows': rows}))}
+        for encoder in encoders:
+            arrays.update(encoder.Arrays())
+        # numpy appends .npz to paths without it, write through a file object so the name is kept as given
+        with open(path, 'wb') as output:
+            (numpy.savez_compressed if compress else numpy.savez)(output, **arrays)
+    else:
+        schema = _ArrowSchema(pa, columns)
+        # parquet dictionary encodes each column chunk itself, an IPC stream (unlike the IPC file format)
+        # may carry a new dictionary with every batch
+        writer = pa.parquet.ParquetWriter(path, schema) if file_format == 'parquet' else pa.ipc.new_stream(path, schema)
+        try:
+            for page in pages:
+                writer.write_batch(_ArrowBatch(pa, schema, columns, page))
+                rows += len(page)
+        finally:
+            writer.close()
+
+    seconds = time.perf_counter() - start
+    report = {'rows': rows, 'format': file_format, 'bytes': os.path.getsize(path), 'seconds': round(seconds, 3),
+              'rows_per_second': round(rows / seconds) if seconds > 0 else None}
+    print(f"Exported {rows} cigar reviews ({report['bytes']} bytes) in {report['seconds']}s.")
+    return report
+
+
+def ReadNpzColumns(path):
+    """Return the raw arrays of an .npz export as a dict, plus the '__meta__' dict (columns, rows)."""
+    import numpy
+    with numpy.load(path, allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    meta = json.loads(str(arrays.pop('__meta__')))
+    if meta['version'] > NPZ_FORMAT_VERSION:
+        raise ValueError(f"{path} was written by a newer exporter (format {meta['version']})")
+    arrays['__meta__'] = meta
+    return arrays
+
+def _NpzFrame(path):
+    import numpy
+    import pandas
+    arrays = ReadNpzColumns(path)
+    data = {}
+    for name in arrays['__meta__']['columns']:
+        mask = arrays[f"{name}.mask"]
+        if name in DICTIONARY_COLUMNS:
+            data[name] = pandas.Categorical.from_codes(arrays[f"{name}.codes"], categories=arrays[f"{name}.dictionary"])
+        elif name in INTEGER_COLUMNS:
+            data[name] = pandas.arrays.IntegerArray(arrays[name], mask)
+        elif name in DATE_COLUMNS + TIMESTAMP_COLUMNS:
+            data[name] = arrays[name]
+        else:
+            buffer = arrays[f"{name}.data"].tobytes()
+            offsets = arrays[f"{name}.offsets"].tolist()
+            values = numpy.empty(len(mask), dtype=object)
+            values[:] = [None if missing else buffer[offsets[i]:offsets[i + 1]].decode('utf-8')
+                         for i, missing in enumerate(mask.tolist())]
+            data[name] = values
+    return pandas.DataFrame(data)
+
+def LoadReviews(path, file_format=None):
+    """
+    Load a file written by ExportReviews into a pandas DataFrame.
+
+    Dictionary encoded text columns become Categoricals, integers use the nullable Int64 dtype
+    and the date and timestamp columns are datetime64.
+
+    Args:
+        path (str): the exported file
+        file_format (str): 'npz', 'parquet' or 'arrow', guessed from the file extension when None
+
+    Returns:
+        pandas.DataFrame: one row per exported review
+    """
+    file_format = file_format or _FormatFromPath(path)
+    if file_format == 'npz':
+        return _NpzFrame(path)
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    pa = _Pyarrow()
+    if pa is None:
+        raise RuntimeError(f"Loading {file_format} needs pyarrow")
+    if file_format == 'parquet':
+        table = pa.parquet.read_table(path)
+    else:
+        with pa.ipc.open_stream(path) as reader:
+            table = reader.read_all()
+    import pandas
+    return table.to_pandas(types_mapper={pa.int64(): pandas.Int64Dtype()}.get)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export cigar reviews to a columnar file for analysis.")
+    parser.add_argument("path", help=".npz, .parquet or .arrow file to write")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="rows encoded at a time")
+    parser.add_argument("--columns", help="comma separated columns to export, all when omitted")
+    parser.add_argument("--compress", action="store_true", help="compress .npz arrays")
+    args = parser.parse_args()
+
+    InitializeDatabase()
+    try:
+        ExportReviews(args.path, file_format=args.format, chunk_size=args.chunk_size,
+                      columns=args.columns.split(',') if args.columns else None, compress=args.compress)
+    finally:
+        CloseDatabaseConnection()
@@ -0,0 +1,118 @@
+import argparse
+import contextlib
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from constants import IMPORT_BATCH_SIZE
+from db import InitializeDatabase, CloseDatabaseConnection, BulkAddCigarReviews
+from validate import validate_batch
+
+# only the first few rejected rows are kept in the report so a bad file cannot eat all our memory
+MAX_REPORTED_ERRORS = 100
+
+
+def _OpenRecords(path, **kwargs):
+    # '-' reads from stdin so records can be piped in, stdin is left open for the caller
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, encoding='utf-8', **kwargs)
+
+def ReadCsvRecords(path):
+    """Yield (line_number, record dict) for every data row of a CSV file with a header row ('-' for stdin)."""
+    with _OpenRecords(path, newline='') as csv_file:
+        reader = csv.DictReader(csv_file)
+        for record in reader:
+            yield reader.line_num, record
+
+def ReadJsonlRecords(path):
+    """Yield (line_number, record dict) for every non-blank line of a JSON Lines file ('-' for stdin)."""
+    with _OpenRecords(path) as jsonl_file:
+        for line_number, text in enumerate(jsonl_file, start=1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError as e:
+                record = {'_error': f"invalid JSON: {e.msg}"}
+            yield line_number, record
+
+def ImportReviews(path, file_format=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Stream a CSV or JSONL file into cigar_reviews.
+
+    Valid rows are inserted batch_size at a time, each batch in a single transaction.
+    Rejected rows are counted and the first MAX_REPORTED_ERRORS are kept in the report.
+
+    Args:
+        path (str): the file to import, '-' for stdin
+        file_format (str): 'csv' or 'jsonl', guessed from the file extension when None (jsonl for stdin)
+        batch_size (int): number of rows written per transaction
+
+    Returns:
+        dict: inserted, rejected, errors, seconds and rows_per_second
+    """
+    if file_format is None:
+        file_format = 'jsonl' if path == '-' or path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    if file_format == 'csv':
+        records = ReadCsvRecords(path)
+    elif file_format == 'jsonl':
+        records = ReadJsonlRecords(path)
+    else:
+        raise ValueError(f"Unsupported import format: {file_format}")
+
+    print(f"Importing cigar reviews from {path} ({file_format})...")
+    report = {'inserted': 0, 'rejected': 0, 'errors': []}
+
+    def reject(line_number, errors):
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append((line_number, errors))
+
+    # generator so rows flow from the file into executemany one batch at a time, each batch validated column by column
+    def valid_rows():
+        while True:
+            chunk = list(islice(records, batch_size))
+            if not chunk:
+                return
+            parsed = []
+            rejected = []
+            for line_number, record in chunk:
+                if not isinstance(record, dict):
+                    rejected.append((line_number, ["record is not an object"]))
+                elif '_error' in record:
+                    rejected.append((line_number, [record['_error']]))
+                else:
+                    parsed.append((line_number, record))
+
+            rows, batch_errors = validate_batch([record for _, record in parsed])
+            rejected.extend((parsed[index][0], errors) for index, errors in batch_errors)
+            for line_number, errors in sorted(rejected):
+                reject(line_number, errors)
+            yield from rows
+
+    start = time.perf_counter()
+    report['inserted'] = BulkAddCigarReviews(valid_rows(), batch_size=batch_size)
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = report['inserted'] / report['seconds'] if report['seconds'] > 0 else 0.0
+
+    print(f"Imported {report['inserted']} reviews in {report['seconds']:.2f}s "
+          f"({report['rows_per_second']:.0f} rows/sec), rejected {report['rejected']} rows.")
+    for line_number, errors in report['errors']:
+        print(f"  line {line_number}: {', '.join(errors)}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import cigar reviews from CSV or JSONL.")
+    parser.add_argument("path", help="CSV (with header row) or JSONL file to import")
+    parser.add_argument("--format", choices=['csv', 'jsonl'], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction")
+    args = parser.parse_args()
+
+    InitializeDatabase()
+    try:
+        ImportReviews(args.path, file_format=args.format, batch_size=args.batch_size)
+    finally:
+        CloseDatabaseConnection()
@@ -0,0 +1,257 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+# Timing and profiling hooks for the db layer.
+#
+# Every public db.py function is wrapped with @Instrument. While no sink is registered the wrapper only checks
+# one list and calls straight through, so instrumentation costs nothing measurable when it is off.
+# Once a sink is added each call produces an event dict:
+#
+#   {'event': 'call', 'function': 'FetchCigarReviewById', 'seconds': 0.0002, 'rows': 1,
+#    'statements': ['SELECT * FROM cigar_reviews WHERE id = 3'], 'statement_count': 1, 'error': None, ...}
+#
+# and db.Transaction adds {'event': 'transaction', 'seconds': ..., 'committed': True, ...} events.
+# A sink is any callable taking the event dict, see JsonLinesSink and MetricsSink below.
+#
+# It can be switched on from the command line without touching any code through environment variables:
+#   MYLEAFLEDGER_METRICS=metrics.jsonl python main.py    # one JSON event per line ('-' for stderr)
+#   MYLEAFLEDGER_PROFILE=db.prof python main.py          # cProfile stats of every db call, see pstats
+
+METRICS_ENVIRONMENT_VARIABLE = "MYLEAFLEDGER_METRICS"
+PROFILE_ENVIRONMENT_VARIABLE = "MYLEAFLEDGER_PROFILE"
+
+# statements beyond this many per call are only counted, so a bulk insert does not log every row
+MAX_STATEMENTS_PER_CALL = 50
+
+_sinks = []
+_sinks_lock = threading.Lock()
+_profiler = None
+_profile_path = None
+
+# stack of the events for the instrumented calls in progress on this thread
+_local = threading.local()
+
+
+def Enabled():
+    """True when at least one sink or the profiler is active."""
+    return bool(_sinks) or _profiler is not None
+
+def AddSink(sink):
+    """Start sending events to sink, a callable taking one event dict."""
+    with _sinks_lock:
+        _sinks.append(sink)
+
+def RemoveSink(sink):
+    """Stop sending events to sink."""
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+def Emit(event):
+    """Send one event to every sink, a failing sink never breaks the database call it describes."""
+    for sink in list(_sinks):
+        try:
+            sink(event)
+        except Exception as e:
+            print(f"Instrumentation sink {sink!r} failed: {e}", file=sys.stderr)
+
+def RecordStatement(sql):
+    """Attach one executed SQL statement to the innermost instrumented call (used as a sqlite3 trace callback)."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        event = stack[-1]
+        event['statement_count'] += 1
+        if len(event['statements']) < MAX_STATEMENTS_PER_CALL:
+            event['statements'].append(sql)
+
+def RecordTransaction(seconds, committed):
+    """Report how long a db.Transaction block took and whether it committed."""
+    stack = getattr(_local, "stack", None)
+    Emit({'event': 'transaction', 'seconds': seconds, 'committed': committed,
+          'function': stack[-1]['function'] if stack else None,
+          'thread': threading.get_ident(), 'timestamp': time.time()})
+
+def _CountRows(result):
+    # lists of rows count their length, a single row or a count returned by a write counts as given
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        return 1
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return None
+
+def _Stack():
+    # a generator can be resumed on another thread than the one it started on (async_db runs each page on
+    # whichever worker is free), so every thread gets its stack the first time it touches one
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _Begin(name):
+    stack = _Stack()
+    event = {'event': 'call', 'function': name, 'seconds': None, 'rows': None, 'statements': [],
+             'statement_count': 0, 'error': None, 'thread': threading.get_ident(), 'timestamp': time.time()}
+    # only the outermost call switches the profiler, nested db calls are already inside its window
+    if _profiler is not None and not stack:
+        _profiler.enable()
+    stack.append(event)
+    return event, time.perf_counter()
+
+def _End(event, start, error=None):
+    event['seconds'] = time.perf_counter() - start
+    if error is not None:
+        event['error'] = f"{type(error).__name__}: {error}"
+    stack = _Stack()
+    stack.pop()
+    if _profiler is not None and not stack:
+        _profiler.disable()
+    Emit(event)
+
+def Instrument(function):
+    """Decorator reporting latency, rows returned and SQL statements of every call to function."""
+    name = function.__name__
+
+    if inspect.isgeneratorfunction(function):
+        # a generator is timed from the first page to the last, rows are counted as the pages go by
+        @functools.wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            if not Enabled():
+                yield from function(*args, **kwargs)
+                return
+            event, start = _Begin(name)
+            event['rows'] = 0
+            error = None
+            # the stack entry is only live while the generator body runs, not while the caller holds a page
+            _Stack().pop()
+            try:
+                generator = function(*args, **kwargs)
+                while True:
+                    _Stack().append(event)
+                    try:
+                        page = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        _Stack().pop()
+                    event['rows'] += len(page) if isinstance(page, list) else 1
+                    yield page
+            except GeneratorExit:
+                # the caller stopped reading early, that is not an error
+                raise
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _Stack().append(event)
+                _End(event, start, error)
+        return generator_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not Enabled():
+            return function(*args, **kwargs)
+        event, start = _Begin(name)
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            _End(event, start, e)
+            raise
+        event['rows'] = _CountRows(result)
+        _End(event, start)
+        return result
+    return wrapper
+
+
+class JsonLinesSink:
+    """Write every event as one JSON line to a file path ('-' for stderr)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = sys.stderr if path == "-" else open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stderr:
+            self.file.close()
+
+
+class MetricsSink:
+    """Aggregate call events in memory into per-function counts, total and max latency and rows."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.functions = {}
+        self.transactions = {'count': 0, 'seconds': 0.0, 'rolled_back': 0}
+
+    def __call__(self, event):
+        with self.lock:
+            if event['event'] == 'transaction':
+                self.transactions['count'] += 1
+                self.transactions['seconds'] += event['seconds']
+                self.transactions['rolled_back'] += not event['committed']
+                return
+            stats = self.functions.setdefault(event['function'], {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows': 0})
+            stats['calls'] += 1
+            stats['errors'] += event['error'] is not None
+            stats['seconds'] += event['seconds']
+            stats['max_seconds'] = max(stats['max_seconds'], event['seconds'])
+            stats['rows'] += event['rows'] or 0
+
+    def Summary(self):
+        """Return a copy of the per-function stats with the mean latency added."""
+        with self.lock:
+            summary = {}
+            for function, stats in self.functions.items():
+                summary[function] = dict(stats, mean_seconds=stats['seconds'] / stats['calls'])
+            return summary
+
+
+def StartProfiling(path):
+    """Capture cProfile stats for every instrumented db call until StopProfiling."""
+    global _profiler, _profile_path
+    # imported here so startups that do not profile never load cProfile
+    import cProfile
+
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profile_path = path
+
+def StopProfiling():
+    """Stop profiling and write the collected stats (load them with pstats.Stats(path))."""
+    global _profiler, _profile_path
+    if _profiler is not None:
+        profiler, path = _profiler, _profile_path
+        _profiler, _profile_path = None, None
+        profiler.dump_stats(path)
+
+def ConfigureFromEnvironment(environment=os.environ):
+    """Turn on the sinks requested by MYLEAFLEDGER_METRICS and MYLEAFLEDGER_PROFILE."""
+    metrics_path = environment.get(METRICS_ENVIRONMENT_VARIABLE)
+    if metrics_path:
+        sink = JsonLinesSink(metrics_path)
+        AddSink(sink)
+        atexit.register(sink.close)
+
+    profile_path = environment.get(PROFILE_ENVIRONMENT_VARIABLE)
+    if profile_path:
+        StartProfiling(profile_path)
+        atexit.register(StopProfiling)
+
+
+ConfigureFromEnvironment()
@@ -1,12 +1,36 @@
+import sqlite3
 import sys
-from db import InitializeDatabase, CloseDatabaseConnection, AddCigarReview, FetchCigarReviewById, UpdateCigarReview, FetchAllCigarReviews, DeleteCigarReview
-from constants import ALL_COLUMNS
-import pandas as pd
-import textwrap
-from tabulate import tabulate
-from rich.console import Console
-from rich.table import Table
-from validate import is_valid_date, is_valid_string, is_valid_integer
+from db import InitializeDatabase, CloseDatabaseConnection, AddCigarReview, FetchCigarReviewById, PatchCigarReview, UpdateConflict, FetchCigarReviewPages, DeleteCigarReview, SearchCigarReviews, FetchReviewSummary, FetchReviewRollup
+from constants import ALL_COLUMNS, SUMMARY_DIMENSIONS, ROLLUP_PERIODS, ROLLUP_COLUMNS, ROLLUP_MOVING_WINDOW, APPROX_SAMPLE_SIZE
+from approx import ApproximateStats
+from renderer import PrintReviewTable, PrintFancyReport, PrintSummaryTable
+from validate import is_valid_date, is_valid_string, is_valid_integer, is_valid_tags, is_valid_rating, validate_changes
+
+# option 2 asks for these in order: column, prompt text, whether the field may be cleared
+EDIT_PROMPTS = [
+    ('brand', 'brand', False),
+    ('line', 'line', False),
+    ('vitola', 'vitola', False),
+    ('ring_gauge', 'ring gauge (in mm)', False),
+    ('country', 'country', False),
+    ('wrapper', 'wrapper (optional)', True),
+    ('binder', 'binder (optional)', True),
+    ('filler', 'filler (optional)', True),
+    ('date_smoked', 'date smoked (YYYY-MM-DD)', False),
+    ('rating', 'rating (1-5)', False),
+    ('notes', 'notes (optional)', True),
+    ('price_cents', 'price in cents (optional)', True),
+    ('humidor', 'humidor location (optional)', True),
+    ('tags', "tags (CSV, e.g. 'maduro,box-press') (optional)", True),
+]
+
+def prompt_filter(prompt, validator):
+    # keep asking until the answer is blank (no filter) or passes the validator
+    while True:
+        value = input(prompt).strip()
+        if value == "" or validator(value):
+            return value
+        print("Invalid value, please try again or leave blank to skip.")
 
 def main_menu():
     print("Starting MyLeafLedger")
@@ -21,6 +45,10 @@ def main_menu():
         print("5. Fancy Report")
         print("6. Delete a Cigar Review")
         print("7. Exit")
+        print("8. Search Reviews")
+        print("9. Summary Report")
+        print("10. Spending Over Time")
+        print("11. Approximate Overview")
         
         choice = input("Enter your choice: ")
         
@@ -149,7 +177,7 @@ def main_menu():
             #tags
             while True:
                 tags = input("Enter tags (CSV, e.g. 'maduro,box-press') (optional): ")
-                if tags == "" or all(is_valid_string(tag.strip()) for tag in tags.split(',')):
+                if tags == "" or is_valid_tags(tags):
                     print(f"Valid tags entered: {tags}")
                     break
                 else:
@@ -170,70 +198,80 @@ def main_menu():
             if record:
                 print("Current review details:")
                 print(record)
-                brand = input("Enter new brand: ")
-                line = input("Enter new line: ")
-                vitola = input("Enter new vitola: ")
-                ring_gauge = input("Enter new ring gauge (in mm): ")
-                country = input("Enter new country: ")
-                wrapper = input("Enter new wrapper (optional): ")
-                binder = input("Enter new binder (optional): ")
-                filler = input("Enter new filler (optional): ")
-                date_smoked = input("Enter new date smoked (YYYY-MM-DD): ")
-                rating = input("Enter new rating (1-5): ")
-                notes = input("Enter new notes (optional): ")
-                price_cents = input("Enter new price in cents (optional): ")
-                humidor = input("Enter new humidor location (optional): ")
-                tags = input("Enter new tags (CSV, e.g. 'maduro,box-press') (optional): ")
-                
-                UpdateCigarReview(id, brand, line, vitola, ring_gauge, country, wrapper, binder, filler, date_smoked, rating, notes, price_cents, humidor, tags)
-                print(f"Review with ID {id} updated successfully!")
+                print("Press Enter to keep a value, or enter - to clear an optional one.")
+                # only the fields that actually change are written, and the update is refused
+                # if someone else edited the review after it was loaded above
+                changes = {}
+                for column, prompt, optional in EDIT_PROMPTS:
+                    current = record[ALL_COLUMNS.index(column)]
+                    while True:
+                        value = input(f"Enter new {prompt} [{'' if current is None else current}]: ").strip()
+                        if value == "":
+                            break
+                        if value == "-" and not optional:
+                            print(f"The {column.replace('_', ' ')} is required and cannot be cleared.")
+                            continue
+                        # the same checks as adding a review, with "-" (now blank) clearing an optional field
+                        converted, errors = validate_changes({column: "" if value == "-" else value})
+                        if errors:
+                            print(f"Invalid {column.replace('_', ' ')}, please try again or press Enter to keep it.")
+                            continue
+                        if converted[column] != current:
+                            changes[column] = converted[column]
+                        break
+
+                if not changes:
+                    print("Nothing changed.")
+                    continue
+                try:
+                    if PatchCigarReview(id, changes, expected_updated_at=record[ALL_COLUMNS.index('updated_at')]):
+                        print(f"Review with ID {id} updated successfully!")
+                    else:
+                        print(f"Review with ID {id} was deleted while you were editing it.")
+                except UpdateConflict:
+                    print(f"Review with ID {id} was changed by someone else while you were editing it, nothing was saved. Please try again.")
+                except sqlite3.IntegrityError as e:
+                    print(f"Review with ID {id} was not updated: {e}")
 
         elif choice == '3':
             print("You selected Option 3 to view All Reviews")
             
-            records = FetchAllCigarReviews()
-            if records:   
-                pd.set_option ('display.max_columns', None)  # Show all columns
-                df = pd.DataFrame(records, columns=ALL_COLUMNS)
-                df['notes'] = df['notes'].apply(lambda x: '\n'.join(textwrap.wrap(str(x), width=50))) # wrap notes column only with this voodoo
-                pd.set_option('display.max_colwidth', None)
-                print(tabulate(df, headers=ALL_COLUMNS, tablefmt='simple', showindex=False, maxcolwidths=[10] * len(ALL_COLUMNS)))  # None for unlimited, or e.g., 50 for 'notes'
+            PrintReviewTable(FetchCigarReviewPages())
 
         elif choice == '4':
             print("You selected Option 4 to Query Reviews")
-            print("Feature not implemented yet. Stay tuned!")
+            print("Leave a filter blank to skip it.")
+
+            filters = {
+                'brand': prompt_filter("Brand: ", is_valid_string),
+                'line': prompt_filter("Line: ", is_valid_string),
+                'vitola': prompt_filter("Vitola: ", is_valid_string),
+                'country': prompt_filter("Country: ", is_valid_string),
+                'wrapper': prompt_filter("Wrapper: ", is_valid_string),
+                'humidor': prompt_filter("Humidor location: ", is_valid_string),
+                'rating_min': prompt_filter("Minimum rating (1-5): ", is_valid_rating),
+                'rating_max': prompt_filter("Maximum rating (1-5): ", is_valid_rating),
+                'date_from': prompt_filter("Smoked on or after (YYYY-MM-DD): ", is_valid_date),
+                'date_to': prompt_filter("Smoked on or before (YYYY-MM-DD): ", is_valid_date),
+                'price_min': prompt_filter("Minimum price in cents: ", is_valid_integer),
+                'price_max': prompt_filter("Maximum price in cents: ", is_valid_integer),
+            }
+            tags = prompt_filter("Tags (CSV, e.g. 'maduro,box-press'): ", is_valid_tags)
+            if tags:
+                match = prompt_filter("Match all tags or any tag? (all/any, default all): ", lambda value: value.lower() in ('all', 'any'))
+                filters['tags_any' if match.lower() == 'any' else 'tags_all'] = tags
+
+            # the numeric filters are compared against INTEGER columns so they must be bound as ints
+            for key in ('rating_min', 'rating_max', 'price_min', 'price_max'):
+                if filters[key]:
+                    filters[key] = int(filters[key])
+
+            if not PrintReviewTable(FetchCigarReviewPages(filters=filters)):
+                print("No reviews match those filters.")
 
         elif choice == '5':
             print("Option 5 Fancy Report")
-
-            records = FetchAllCigarReviews()
-            if records:   
-                pd.set_option ('display.max_columns', None)  # Show all columns
-                df = pd.DataFrame(records, columns=ALL_COLUMNS)
-                df['notes'] = df['notes'].apply(lambda x: '\n'.join(textwrap.wrap(str(x), width=50))) # wrap notes column only with this voodoo
-                pd.set_option('display.max_colwidth', None)
-                #print(tabulate(df, headers=ALL_COLUMNS, tablefmt='simple', showindex=False, maxcolwidths=[10] * len(ALL_COLUMNS)))  # None for unlimited, or e.g., 50 for 'notes'
-            # Create a rich console and table
-            console = Console()
-            table = Table(title="Cigar Reviews", show_header=True, header_style="bold cyan")
-            
-            # Add columns with optional styles (adjust as needed)
-            for col in ALL_COLUMNS:
-                if col == 'brand':
-                    table.add_column(col, style="green", justify="left")
-                elif col == 'rating':
-                    table.add_column(col, style="magenta", justify="center")
-                elif col == 'notes':
-                    table.add_column(col, style="italic white", justify="left", width=50)  # Wider for wrapped notes
-                else:
-                    table.add_column(col, style="white", justify="left")
-            
-            # Add rows from DataFrame (convert all to str for safety)
-            for _, row in df.iterrows():
-                table.add_row(*[str(value) for value in row])
-            
-            # Print the rich table
-            console.print(table)
+            PrintFancyReport(FetchCigarReviewPages())
 
         elif choice == '6':
             print("You selected Option 6 to Delete a Cigar Review")
@@ -252,6 +290,58 @@ def main_menu():
             # close the database connection before exiting
             CloseDatabaseConnection()
             break
+        elif choice == '8':
+            print("You selected Option 8 to Search Reviews")
+            text = input("Enter words to search for in brand, line, vitola and notes: ")
+            records = SearchCigarReviews(text)
+            if records:
+                PrintReviewTable([records])
+            else:
+                print("No reviews match that search.")
+
+        elif choice == '9':
+            print("You selected Option 9 Summary Report")
+            # read from the trigger maintained summary tables, so this costs one row per group rather than per review
+            for dimension in SUMMARY_DIMENSIONS:
+                records = FetchReviewSummary(dimension)
+                headers = [dimension, 'reviews', 'avg rating', 'total spend (cents)', 'avg price (cents)']
+                PrintSummaryTable(f"Reviews by {dimension}", records, headers)
+
+        elif choice == '10':
+            print("You selected Option 10 Spending Over Time")
+            period = prompt_filter("Group by day, month or year (default month): ", lambda value: value.lower() in ROLLUP_PERIODS)
+            period = period.lower() or 'month'
+            # repeated reports are answered from the rollup cache until a review is added, changed or deleted
+            records = FetchReviewRollup(period)
+            if records:
+                PrintSummaryTable(f"Spend and ratings by {period} (moving columns cover the last {ROLLUP_MOVING_WINDOW} {period}s with reviews)",
+                                  records, ROLLUP_COLUMNS)
+            else:
+                print("No reviews to report on yet.")
+
+        elif choice == '11':
+            print("You selected Option 11 Approximate Overview")
+            size = prompt_filter(f"Sample size (default {APPROX_SAMPLE_SIZE}): ", lambda value: is_valid_integer(value) and int(value) > 0)
+            # ratings and prices come from a random sample, distinct counts from the summary tables and stored sketches
+            stats = ApproximateStats(int(size) if size else APPROX_SAMPLE_SIZE)
+            if not stats['sample_size']:
+                print("No reviews to report on yet.")
+                continue
+            print(f"Estimated from {stats['sample_size']} of {stats['reviews']} reviews, ± is the 95% margin of error.")
+            overview = [['avg rating', *stats['rating_mean']], ['avg price (cents)', *(stats['price_mean'] or (None, None))]]
+            overview += [[f"distinct {column}", *estimate] for column, estimate in stats['distinct'].items()]
+            PrintSummaryTable("Approximate overview", overview, ['statistic', 'estimate', '±'])
+            PrintSummaryTable("Approximate rating histogram",
+                              [[rating, f"{share:.1%}", f"{margin:.1%}"] for rating, (share, margin) in stats['rating_histogram'].items()],
+                              ['rating', 'share', '±'])
+            quantiles = []
+            for q in stats['rating_quantiles']:
+                row = [f"p{round(q * 100)}"]
+                for estimate in (stats['rating_quantiles'][q], stats['price_quantiles'][q]):
+                    row += [estimate[0], f"{estimate[1][0]} - {estimate[1][1]}"] if estimate else [None, None]
+                quantiles.append(row)
+            PrintSummaryTable("Approximate quantiles", quantiles, ['quantile', 'rating', 'rating range', 'price (cents)', 'price range'])
+
         else:
             print("Invalid choice. Please try again.")
     
@@ -0,0 +1,133 @@
+# Filter engine behind option 4 (Query Reviews) in main.py.
+#
+# A filter is a plain dict, e.g. {'brand': 'Padron', 'rating_min': 4, 'date_from': '2024-01-01'}.
+# Every key narrows the result (they are ANDed together) and a text filter may also be a list of
+# values to match any of them, so filters compose by merging dicts: {**by_brand, **by_date}.
+# Tags are matched with tags_all (AND) or tags_any (OR), e.g. {'tags_all': 'maduro,box-press'}.
+
+# exact (case-insensitive) match filters, key -> column
+TEXT_FILTERS = {
+    'brand': 'brand',
+    'line': 'line',
+    'vitola': 'vitola',
+    'country': 'country',
+    'wrapper': 'wrapper',
+    'humidor': 'humidor',
+}
+
+# inclusive range filters, key -> (column, operator)
+RANGE_FILTERS = {
+    'rating_min': ('rating', '>='),
+    'rating_max': ('rating', '<='),
+    'date_from': ('date_smoked', '>='),
+    'date_to': ('date_smoked', '<='),
+    # the menu stores a skipped price as '', which SQLite sorts above every integer, so it is compared as NULL
+    'price_min': ("NULLIF(price_cents, '')", '>='),
+    'price_max': ("NULLIF(price_cents, '')", '<='),
+}
+
+# tag filters take a CSV string or a list of tags and are answered from the review_tags index
+TAG_FILTERS = ['tags_all', 'tags_any']
+
+FILTER_KEYS = list(TEXT_FILTERS) + list(RANGE_FILTERS) + TAG_FILTERS
+
+# review ids carrying at least one of the given tags, the HAVING clause is added for tags_all
+TAG_SUBQUERY = """id IN (SELECT review_tags.review_id FROM review_tags
+    JOIN tags ON tags.id = review_tags.tag_id
+    WHERE tags.name IN ({placeholders}){having})"""
+
+
+def SplitTags(tags):
+    """
+    Split a CSV tags string (or a list of tags) into clean, case-insensitively unique tags.
+
+    Args:
+        tags (str | list): e.g. "maduro, box-press" or ["maduro", "box-press"]
+
+    Returns:
+        list: the tags in their original order with blanks and duplicates removed
+    """
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+
+    unique_tags = []
+    seen = set()
+    for tag in tags:
+        tag = tag.strip()
+        if tag and tag.casefold() not in seen:
+            seen.add(tag.casefold())
+            unique_tags.append(tag)
+    return unique_tags
+
+
+def CompileReviewFilters(filters):
+    """
+    Compile a filter dict into a parameterized WHERE expression.
+
+    Text filters compare with COLLATE NOCASE so they line up with the NOCASE indexes created
+    by InitializeDatabase, and range filters compare the raw column, so every filter can be
+    answered by an index seek. Values are always bound as parameters, never formatted into SQL.
+
+    Args:
+        filters (dict): filter key to value; None and "" values are ignored
+
+    Returns:
+        tuple: (where_sql, params) where where_sql is "1" when there is nothing to filter on
+    """
+    clauses = []
+    params = []
+    for key, value in (filters or {}).items():
+        if value is None or value == "":
+            continue
+
+        if key in TEXT_FILTERS:
+            column = TEXT_FILTERS[key]
+            if isinstance(value, (list, tuple, set)):
+                values = list(value)
+                if not values:
+                    raise ValueError(f"Filter {key} needs at least one value")
+                clauses.append(f"{column} COLLATE NOCASE IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                clauses.append(f"{column} = ? COLLATE NOCASE")
+                params.append(value)
+        elif key in TAG_FILTERS:
+            tags = SplitTags(value)
+            if not tags:
+                continue
+            having = f" GROUP BY review_tags.review_id HAVING COUNT(*) = {len(tags)}" if key == 'tags_all' else ""
+            clauses.append(TAG_SUBQUERY.format(placeholders=', '.join('?' * len(tags)), having=having))
+            params.extend(tags)
+        elif key in RANGE_FILTERS:
+            column, operator = RANGE_FILTERS[key]
+            clauses.append(f"{column} {operator} ?")
+            params.append(value)
+        else:
+            raise ValueError(f"Unknown review filter: {key}")
+
+    return " AND ".join(clauses) or "1", params
+
+
+def BuildSearchQuery(text):
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted FTS5 string, so punctuation such as the hyphen in
+    "box-press" is matched literally instead of being parsed as query syntax.
+    Words are implicitly ANDed, and a trailing * on a word keeps prefix matching.
+
+    Args:
+        text (str): e.g. "cedar box-press choc*"
+
+    Returns:
+        str: the MATCH expression, "" when there is nothing to search for
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
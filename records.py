@@ -0,0 +1,52 @@
+from collections import namedtuple
+from functools import lru_cache
+from constants import ALL_COLUMNS, LOW_CARDINALITY_COLUMNS
+
+# Compact review records for results that are kept in memory, e.g.
+#   reviews = db.FetchAllCigarReviews(columns=['id', 'brand', 'rating'], as_records=True)
+#   reviews[0].brand, reviews[0].rating
+#
+# A record is a tuple subclass without a per-instance __dict__ (namedtuple sets __slots__ = ()), so it costs
+# exactly what the plain row tuple costs, still compares equal to it and still indexes like it. The savings
+# come from two places: selecting only the columns that are needed, so large text such as notes is never
+# read, and sharing one string object per distinct value of the low-cardinality columns (brand, country, ...)
+# instead of holding a fresh copy in every row.
+
+
+@lru_cache(maxsize=None)
+def ReviewRecordType(columns=tuple(ALL_COLUMNS)):
+    """Return the record class for a tuple of column names, one class per distinct projection."""
+    return namedtuple('Review', columns)
+
+def RecordFactory(columns, skip=0):
+    """
+    Build a sqlite3 row_factory that turns rows into compact review records.
+
+    The returned function may also be called directly as factory(None, row).
+
+    Args:
+        columns (list): the column names of the record, in row order
+        skip (int): leading values of each row to drop first, e.g. an id selected only for paging
+
+    Returns:
+        callable: factory(cursor, row) -> ReviewRecordType(columns) instance
+    """
+    record_type = ReviewRecordType(tuple(columns))
+    new = tuple.__new__
+    shared_positions = [index for index, column in enumerate(columns) if column in LOW_CARDINALITY_COLUMNS]
+    # one pool per factory, so the strings are shared across every row (and page) of one result and are
+    # freed with it, rather than growing a process wide intern table
+    pool = {}
+
+    def factory(cursor, row):
+        if skip:
+            row = row[skip:]
+        if shared_positions:
+            row = list(row)
+            for index in shared_positions:
+                value = row[index]
+                if value is not None:
+                    row[index] = pool.setdefault(value, value)
+        return new(record_type, row)
+
+    return factory
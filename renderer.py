@@ -0,0 +1,112 @@
+import sys
+import textwrap
+from constants import ALL_COLUMNS
+
+# Renders reviews for the View All, Query, Search and Fancy Report menu options.
+#
+# Rows are consumed straight from db.FetchCigarReviewPages (or any iterable of pages) and each page is
+# formatted and printed before the next one is read, so memory stays at one page however big the ledger is.
+# tabulate and rich are imported on first use so importing this module does not slow down startup.
+
+NOTES_WIDTH = 50          # notes are wrapped to this many characters
+COLUMN_WIDTH = 10         # every other column in the plain table is wrapped to this many characters
+REPORT_WIDTH = 240        # rich table width when output is redirected instead of going to a terminal
+
+
+def WrapNotes(notes, width=NOTES_WIDTH):
+    """
+    Wrap a notes value onto several lines.
+
+    Args:
+        notes (str): the notes, may be None
+        width (int): maximum characters per line
+
+    Returns:
+        str: the wrapped text joined with newlines, "" for empty notes
+    """
+    if notes is None or notes == "":
+        return ""
+    return "\n".join(textwrap.wrap(str(notes), width=width))
+
+def FormatRow(row, columns=ALL_COLUMNS):
+    """Convert one row tuple into display strings, wrapping the notes column."""
+    cells = []
+    for column, value in zip(columns, row):
+        if column == 'notes':
+            cells.append(WrapNotes(value))
+        else:
+            cells.append("" if value is None else str(value))
+    return cells
+
+def PrintReviewTable(pages, columns=ALL_COLUMNS, file=None):
+    """
+    Print pages of reviews as plain tabulate tables, one table per page.
+
+    Args:
+        pages (iterable): lists of row tuples, e.g. db.FetchCigarReviewPages()
+        columns (list): the column names of each row
+        file: where to write, sys.stdout when None
+
+    Returns:
+        int: the number of rows printed
+    """
+    from tabulate import tabulate
+
+    file = file or sys.stdout
+    max_widths = [None if column == 'notes' else COLUMN_WIDTH for column in columns]
+    printed = 0
+    for records in pages:
+        cells = [FormatRow(row, columns) for row in records]
+        # disable_numparse keeps the values exactly as they were formatted above
+        print(tabulate(cells, headers=columns, tablefmt='simple', maxcolwidths=max_widths, disable_numparse=True), file=file)
+        printed += len(records)
+    return printed
+
+def PrintFancyReport(pages, columns=ALL_COLUMNS, title="Cigar Reviews", file=None):
+    """
+    Print pages of reviews as styled rich tables, one table per page.
+
+    Args:
+        pages (iterable): lists of row tuples, e.g. db.FetchCigarReviewPages()
+        columns (list): the column names of each row
+        title (str): title of the first table, later pages get "(page n)" appended
+        file: where to write, sys.stdout when None
+
+    Returns:
+        int: the number of rows printed
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    file = file or sys.stdout
+    # in a terminal rich fits the table to the window, when redirected it would squeeze it into 80 columns
+    console = Console(file=file, width=None if file.isatty() else REPORT_WIDTH)
+    printed = 0
+    for page_number, records in enumerate(pages, start=1):
+        table = Table(title=title if page_number == 1 else f"{title} (page {page_number})", show_header=True, header_style="bold cyan")
+
+        # Add columns with optional styles
+        for column in columns:
+            if column == 'brand':
+                table.add_column(column, style="green", justify="left")
+            elif column == 'rating':
+                table.add_column(column, style="magenta", justify="center")
+            elif column == 'notes':
+                table.add_column(column, style="italic white", justify="left", width=NOTES_WIDTH)  # Wider for wrapped notes
+            else:
+                table.add_column(column, style="white", justify="left", overflow="fold")
+
+        for row in records:
+            table.add_row(*FormatRow(row, columns))
+
+        console.print(table)
+        printed += len(records)
+    return printed
+
+def PrintSummaryTable(title, records, headers, file=None):
+    """Print one small aggregate table (e.g. a FetchReviewSummary result) under a title line."""
+    from tabulate import tabulate
+
+    file = file or sys.stdout
+    print(f"\n{title}", file=file)
+    print(tabulate(records, headers=headers, tablefmt='simple'), file=file)
@@ -0,0 +1,73 @@
+import argparse
+import os
+import sqlite3
+import time
+import db
+from constants import CHANGE_BATCH_SIZE, BUSY_TIMEOUT
+
+# Incremental replication between two ledgers, e.g.
+#   python sync.py cigars.db /mnt/laptop/cigars.db
+# copies only the reviews added, changed or deleted since the last run. The target remembers how far it
+# got per source in review_sync_state, so running it again after an interruption picks up where it stopped.
+#
+# Changes are applied to the current database through the normal connection pool, while the source is read
+# on a separate read-only connection, so nothing else using db (the writer queue, async_db workers) ever
+# sees the process switch to another file part way through a sync.
+
+
+def _OpenSource(source_path):
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    if source.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'review_changes'").fetchone() is None:
+        source.close()
+        raise ValueError(f"{source_path} has no change log yet, open it with MyLeafLedger once to upgrade it")
+    return source
+
+def SyncDatabases(source_path, batch_size=CHANGE_BATCH_SIZE, source_name=None):
+    """
+    Bring the current database up to date with source_path by applying the source's change log.
+
+    Args:
+        source_path (str): the ledger to read changes from, opened read-only
+        batch_size (int): changes read and applied per transaction
+        source_name (str): the name the target records its position under, the source's absolute path when None
+
+    Returns:
+        dict: changes, batches, position and seconds
+    """
+    source_name = source_name or os.path.abspath(source_path)
+    start = time.perf_counter()
+    changes_applied = batches = 0
+    position = db.GetSyncPosition(source_name)
+    source = _OpenSource(source_path)
+    try:
+        while True:
+            changes = db.FetchReviewChanges(position, limit=batch_size, connection=source)
+            if not changes:
+                break
+            position = db.ApplyReviewChanges(changes, source_name)
+            changes_applied += len(changes)
+            batches += 1
+    finally:
+        source.close()
+
+    report = {'changes': changes_applied, 'batches': batches, 'position': position,
+              'seconds': round(time.perf_counter() - start, 3)}
+    print(f"Synced {changes_applied} changes from {source_path} to {db.DATABASE_NAME} in {report['seconds']}s.")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy new, changed and deleted cigar reviews from one ledger to another.")
+    parser.add_argument("source", help="ledger to read changes from")
+    parser.add_argument("target", help="ledger to apply them to")
+    parser.add_argument("--batch-size", type=int, default=CHANGE_BATCH_SIZE, help="changes per transaction")
+    args = parser.parse_args()
+
+    db.UseDatabase(args.target)
+    db.InitializeDatabase()
+    try:
+        SyncDatabases(args.source, batch_size=args.batch_size)
+    finally:
+        db.CloseDatabaseConnection()
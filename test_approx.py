@@ -0,0 +1,143 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+
+import db
+import approx
+from InsertTestData.generate import GenerateReviews
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_count_within_error(self):
+        for distinct in (10, 1000, 50000):
+            sketch = approx.HyperLogLog()
+            for value in range(distinct):
+                sketch.Add(f"brand {value}")
+                sketch.Add(f"brand {value}")
+            self.assertLessEqual(abs(sketch.Count() - distinct), 3 * sketch.relative_error * distinct + 1)
+
+    def test_merge_is_union(self):
+        first, second, both = approx.HyperLogLog(10), approx.HyperLogLog(10), approx.HyperLogLog(10)
+        for value in range(3000):
+            (first if value % 2 else second).Add(value)
+            both.Add(value)
+        first.Merge(second)
+        self.assertEqual(first.registers, both.registers)
+        with self.assertRaises(ValueError):
+            first.Merge(approx.HyperLogLog(12))
+
+class TestApproximateStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patch_db_name = patch('db.DATABASE_NAME', os.path.join(self.tmp_dir.name, 'test.db'))
+        self.patch_db_name.start()
+        db.InitializeDatabase()
+        db.BulkAddCigarReviews(GenerateReviews(3000, seed=25))
+
+    def tearDown(self):
+        self.patch_db_name.stop()
+        db.CloseDatabaseConnection()
+        self.tmp_dir.cleanup()
+
+    def test_sample_reviews(self):
+        # deleted ids leave holes the id probing has to skip over
+        for id in range(1, 3001, 3):
+            db.DeleteCigarReview(id)
+        rows, population = approx.SampleReviews(500, columns=['id'], seed=1)
+        ids = [id for (id,) in rows]
+        self.assertIsNone(population)
+        self.assertEqual(len(ids), 500)
+        self.assertEqual(len(set(ids)), 500)
+        self.assertFalse([id for id in ids if id % 3 == 1])
+        self.assertEqual(approx.SampleReviews(500, columns=['id'], seed=1)[0], rows)
+
+        rows, population = approx.SampleReviews(100, columns=['id', 'rating'], filters={'rating_min': 4}, seed=1)
+        self.assertEqual(population, len(db.QueryCigarReviews({'rating_min': 4})))
+        self.assertEqual(len(rows), 100)
+        self.assertTrue(all(rating >= 4 for _, rating in rows))
+
+        # asking for more than there is returns everything
+        self.assertEqual(len(approx.SampleReviews(5000, columns=['id'])[0]), 2000)
+
+    def test_estimates_cover_exact_answers(self):
+        exact = approx.ExactStats()
+        estimate = approx.ApproximateStats(1000, seed=3)
+
+        self.assertEqual(estimate['reviews'], exact['reviews'])
+        self.assertEqual(estimate['sample_size'], 1000)
+        mean, margin = estimate['rating_mean']
+        self.assertLessEqual(abs(mean - exact['rating_mean']), 2 * margin)
+        for rating, (share, margin) in estimate['rating_histogram'].items():
+            self.assertLessEqual(abs(share - exact['rating_histogram'][rating]), 2 * margin + 0.01)
+        for q, (value, (low, high)) in estimate['price_quantiles'].items():
+            self.assertLessEqual(low, value)
+            self.assertLessEqual(value, high)
+        for column, (count, margin) in estimate['distinct'].items():
+            self.assertLessEqual(abs(count - exact['distinct'][column]), margin)
+
+    def test_sketch_distinct(self):
+        exact = approx.ExactStats()['distinct']
+        sketches = approx.SketchDistinct(['brand', 'country'])
+        for column, sketch in sketches.items():
+            self.assertLessEqual(abs(sketch.Count() - exact[column]), 3 * sketch.relative_error * exact[column] + 1)
+
+        # sketches of two disjoint filters merge into the sketch of the whole ledger
+        low = approx.SketchDistinct(['brand'], filters={'rating_max': 3})['brand']
+        low.Merge(approx.SketchDistinct(['brand'], filters={'rating_min': 4})['brand'])
+        self.assertEqual(low.registers, sketches['brand'].registers)
+        with self.assertRaises(ValueError):
+            approx.SketchDistinct(['flavour'])
+
+    def test_ledger_sketch(self):
+        def exact_lines():
+            return approx.ExactStats()['distinct']['line']
+
+        sketch, stale = approx.LedgerSketch('line')
+        self.assertEqual(stale, 0)
+        self.assertEqual(sketch.registers, approx.SketchDistinct(['line'])['line'].registers)
+
+        # new reviews are added from the change log without a rebuild, edits of the line count as stale
+        db.BulkAddCigarReviews(GenerateReviews(20, seed=26))
+        for id in range(3001, 3011):
+            db.PatchCigarReview(id, {'line': f"New line {id}"})
+        with patch('approx.SketchDistinct') as rebuild:
+            sketch, stale = approx.LedgerSketch('line')
+        rebuild.assert_not_called()
+        self.assertEqual(stale, 10)
+        self.assertLessEqual(abs(sketch.Count() - exact_lines()), 3 * sketch.relative_error * exact_lines() + 1)
+
+        # deletes and edits of the column can only be overcounted, and are rebuilt away once there are too many
+        db.DeleteCigarReview(1)
+        db.PatchCigarReview(2, {'line': 'Renamed'})
+        db.PatchCigarReview(3, {'notes': 'cedar'})
+        self.assertEqual(approx.LedgerSketch('line')[1], 12)
+        for id in range(4, 80):
+            db.DeleteCigarReview(id)
+        self.assertEqual(approx.LedgerSketch('line')[1], 0)
+
+        # a pruned change log or another precision forces a rebuild too
+        db.BulkAddCigarReviews(GenerateReviews(5, seed=27))
+        db.DeleteCigarReview(80)
+        db.PruneReviewChanges(10 ** 9)
+        db.BulkAddCigarReviews(GenerateReviews(5, seed=28))
+        self.assertEqual(approx.LedgerSketch('line')[1], 0)
+        self.assertEqual(approx.LedgerSketch('line', precision=10)[0].precision, 10)
+
+    def test_unfiltered_distinct_counts(self):
+        db.PatchCigarReview(1, {'country': ''})
+        estimate = approx.ApproximateStats(100, seed=3)
+        exact = approx.ExactStats()
+        self.assertEqual(estimate['distinct']['brand'], (exact['distinct']['brand'], 0))
+        self.assertEqual(estimate['distinct']['country'], (exact['distinct']['country'], 0))
+
+    def test_sampling_everything_is_exact(self):
+        estimate = approx.ApproximateStats(5000, filters={'country': 'Nicaragua'})
+        exact = approx.ExactStats(filters={'country': 'Nicaragua'})
+        self.assertEqual(estimate['reviews'], exact['reviews'])
+        self.assertEqual(estimate['rating_mean'], (exact['rating_mean'], 0.0))
+        self.assertEqual({q: value for q, (value, _) in estimate['rating_quantiles'].items()}, exact['rating_quantiles'])
+        self.assertEqual({rating: share for rating, (share, _) in estimate['rating_histogram'].items()},
+                         exact['rating_histogram'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from unittest.mock import patch
+import asyncio
+import tempfile
+import threading
+import os
+
+import async_db
+import db
+import instrumentation
+
+class TestAsyncDb(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patch_db_name = patch('db.DATABASE_NAME', os.path.join(self.tmp_dir.name, 'test.db'))
+        self.patch_db_name.start()
+
+    def tearDown(self):
+        asyncio.run(async_db.CloseDatabaseConnection())
+        self.patch_db_name.stop()
+        self.tmp_dir.cleanup()
+
+    async def add_review(self, brand='TestBrand', rating=4):
+        await async_db.AddCigarReview(
+            brand=brand, line='TestLine', vitola='Toro', ring_gauge=50,
+            country='Nicaragua', wrapper=None, binder=None, filler=None,
+            date_smoked='2024-01-01', rating=rating, notes='Cedar', price_cents=1500,
+            humidor=None, tags='maduro'
+        )
+
+    def test_crud(self):
+        async def run():
+            await async_db.InitializeDatabase()
+            await self.add_review()
+            record = await async_db.FetchCigarReviewById(1)
+            self.assertEqual(record[1], 'TestBrand')
+
+            await async_db.UpdateCigarReview(1, 'NewBrand', 'TestLine', 'Toro', 50, 'Nicaragua', None, None, None,
+                                             '2024-01-01', 5, 'Cedar', 1500, None, None)
+            self.assertEqual((await async_db.FetchCigarReviewById(1))[1], 'NewBrand')
+            self.assertEqual(len(await async_db.FetchAllCigarReviews()), 1)
+
+            await async_db.DeleteCigarReview(1)
+            self.assertIsNone(await async_db.FetchCigarReviewById(1))
+        asyncio.run(run())
+
+    def test_concurrent_calls_and_pages(self):
+        async_db.ConfigureExecutor(workers=3, max_pending=4)
+
+        async def run():
+            await async_db.InitializeDatabase()
+            await asyncio.gather(*(self.add_review(f'Brand{i}') for i in range(20)))
+            records = await asyncio.gather(*(async_db.FetchCigarReviewById(id) for id in range(1, 21)))
+            self.assertEqual(sorted(record[1] for record in records), sorted(f'Brand{i}' for i in range(20)))
+
+            pages = [page async for page in async_db.FetchCigarReviewPages(page_size=6, columns=['id', 'brand'])]
+            self.assertEqual([len(page) for page in pages], [6, 6, 6, 2])
+            self.assertEqual([row[0] for page in pages for row in page], list(range(1, 21)))
+
+            # stopping early closes the underlying generator
+            async for page in async_db.FetchCigarReviewPages(page_size=5):
+                break
+        asyncio.run(run())
+
+    def test_pages_with_instrumentation(self):
+        # fresh worker threads, so the page generator is resumed on threads that never started an instrumented call
+        async_db.ConfigureExecutor(workers=3, max_pending=4)
+        metrics = instrumentation.MetricsSink()
+
+        async def run():
+            await async_db.InitializeDatabase()
+            await asyncio.gather(*(self.add_review(f'Brand{i}') for i in range(10)))
+            instrumentation.AddSink(metrics)
+            try:
+                pages = [page async for page in async_db.FetchCigarReviewPages(page_size=4)]
+                # stopping early closes the page generator from the loop thread
+                early = async_db.FetchCigarReviewPages(page_size=4)
+                async for page in early:
+                    break
+                await early.aclose()
+            finally:
+                instrumentation.RemoveSink(metrics)
+            self.assertEqual([len(page) for page in pages], [4, 4, 2])
+        asyncio.run(run())
+
+        stats = metrics.Summary()['FetchCigarReviewPages']
+        self.assertEqual((stats['calls'], stats['errors'], stats['rows']), (2, 0, 14))
+
+    def test_replaced_executor_closes_worker_connections(self):
+        executor = async_db.ConfigureExecutor(workers=2, max_pending=4)
+
+        async def run():
+            await async_db.InitializeDatabase()
+            await asyncio.gather(*(async_db.FetchAllCigarReviews() for _ in range(8)))
+        asyncio.run(run())
+        workers = set(executor._threads)
+        self.assertTrue(workers)
+        self.assertTrue(workers <= set(db._connections))
+
+        async_db.ConfigureExecutor(workers=2, max_pending=4)
+        self.assertFalse(workers & set(db._connections))
+
+    def test_bounded_queue(self):
+        executor = async_db.ConfigureExecutor(workers=1, max_pending=2)
+        release = threading.Event()
+
+        async def run():
+            tasks = [asyncio.ensure_future(executor.Run(release.wait)) for _ in range(5)]
+            await asyncio.sleep(0.05)
+            # two calls hold the queue slots, the other three wait on the loop without reaching the pool
+            self.assertTrue(executor._Semaphore().locked())
+            self.assertEqual(executor._pool._work_queue.qsize(), 1)
+            release.set()
+            self.assertEqual(await asyncio.gather(*tasks), [True] * 5)
+            self.assertFalse(executor._Semaphore().locked())
+        asyncio.run(run())
+
+        with self.assertRaises(ValueError):
+            async_db.DatabaseExecutor(workers=0)
+
+    def test_errors_propagate(self):
+        async def run():
+            await async_db.InitializeDatabase()
+            with self.assertRaises(ValueError):
+                await async_db.GetExecutor().Run(db.FetchReviewSummary, 'wrapper')
+        asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import tempfile
+import threading
+import os
+
+import db
+import backup
+from InsertTestData.generate import GenerateReviews
+
+class TestBackup(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.previous_database = db.DATABASE_NAME
+        db.UseDatabase(self.path('cigars.db'))
+        db.InitializeDatabase()
+        db.BulkAddCigarReviews(GenerateReviews(500, seed=5))
+
+    def tearDown(self):
+        db.CloseDatabaseConnection()
+        db.UseDatabase(self.previous_database)
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_backup_verify_and_restore(self):
+        records = db.FetchAllCigarReviews()
+        report = backup.BackupDatabase(self.path('snapshot.db'), pages_per_step=4, sleep=0)
+        self.assertTrue(report['verification']['ok'])
+        self.assertEqual(report['verification']['reviews'], 500)
+        self.assertFalse(os.path.exists(self.path('snapshot.db.partial')))
+
+        db.BulkDeleteCigarReviews({'rating_min': 1})
+        self.assertEqual(db.FetchAllCigarReviews(), [])
+        backup.RestoreDatabase(self.path('snapshot.db'), pages_per_step=4, sleep=0)
+        self.assertEqual(db.FetchAllCigarReviews(), records)
+        self.assertEqual(sum(row[1] for row in db.FetchReviewSummary('brand')), 500)
+
+    def test_backup_while_another_thread_writes(self):
+        done = threading.Event()
+        def writer():
+            while not done.is_set():
+                db.AddCigarReview('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, None, None)
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            report = backup.BackupDatabase(self.path('snapshot.db'), pages_per_step=1, sleep=0)
+        finally:
+            done.set()
+            thread.join()
+        self.assertTrue(report['verification']['ok'])
+        self.assertGreaterEqual(report['verification']['reviews'], 500)
+
+    def test_verify_rejects_damaged_files(self):
+        with open(self.path('garbage.db'), 'wb') as garbage:
+            garbage.write(b'not a database' * 100)
+        self.assertFalse(backup.VerifyBackup(self.path('garbage.db'))['ok'])
+        with self.assertRaises(ValueError):
+            backup.RestoreDatabase(self.path('garbage.db'))
+        with self.assertRaises(FileNotFoundError):
+            backup.VerifyBackup(self.path('missing.db'))
+
+if __name__ == '__main__':
+    unittest.main()
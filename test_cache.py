@@ -0,0 +1,41 @@
+import unittest
+
+from cache import LruCache
+
+class TestLruCache(unittest.TestCase):
+    def test_eviction_and_stats(self):
+        cache = LruCache(2)
+        for key in ['a', 'b']:
+            found, generation = cache.Get(key)
+            self.assertFalse(found)
+            cache.Put(key, key.upper(), generation)
+        self.assertEqual(cache.Get('a'), (True, 'A'))
+        # 'b' is now the least recently used entry
+        cache.Put('c', 'C', cache.generation)
+        self.assertFalse(cache.Get('b')[0])
+        self.assertEqual(cache.Get('c'), (True, 'C'))
+
+        stats = cache.Stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 3, 1, 2))
+        self.assertEqual(stats['hit_rate'], 0.4)
+
+        cache.Resize(1)
+        self.assertEqual(cache.Stats()['size'], 1)
+        with self.assertRaises(ValueError):
+            LruCache(-1)
+
+    def test_invalidation_wins_over_a_stale_read(self):
+        cache = LruCache(10)
+        found, generation = cache.Get('a')
+        # a writer invalidates while the reader is still fetching the old value
+        cache.Invalidate('a')
+        cache.Put('a', 'stale', generation)
+        self.assertFalse(cache.Get('a')[0])
+
+        found, generation = cache.Get('a')
+        cache.Put('a', 'fresh', generation)
+        cache.Clear()
+        self.assertEqual(cache.Stats()['size'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
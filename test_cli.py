@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import io
+import os
+import csv
+import json
+
+import db
+import cli
+import exporter
+
+RECORD = {'brand': 'Padron', 'line': '1964', 'vitola': 'Toro', 'ring_gauge': 50, 'country': 'Nicaragua',
+          'date_smoked': '2024-01-01', 'rating': 5, 'humidor': 'Desk', 'tags': 'maduro'}
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmp_dir.name, 'cli.db')
+        self.previous_database = db.DATABASE_NAME
+
+    def tearDown(self):
+        db.CloseDatabaseConnection()
+        db.UseDatabase(self.previous_database)
+        self.tmp_dir.cleanup()
+
+    def run_cli(self, *argv, stdin=''):
+        output = io.StringIO()
+        with patch('sys.stdin', io.StringIO(stdin)):
+            status = cli.main(['--database', self.database, *argv], output=output)
+        return status, output.getvalue()
+
+    def add(self, *records):
+        return self.run_cli('add', stdin=''.join(json.dumps(record) + '\n' for record in records))
+
+    def test_add_get_and_list(self):
+        status, output = self.add(RECORD, dict(RECORD, brand='Oliva', humidor='Cabinet'), dict(RECORD, rating=9))
+        self.assertEqual(status, 0)
+        report = json.loads(output)
+        self.assertEqual((report['inserted'], report['rejected']), (2, 1))
+
+        status, output = self.run_cli('get', '1', '3')
+        self.assertEqual(status, 1)
+        self.assertEqual([json.loads(line)['brand'] for line in output.splitlines()], ['Padron'])
+
+        status, output = self.run_cli('list', '--columns', 'id,brand', '--output', 'csv')
+        self.assertEqual(output.splitlines(), ['id,brand', '1,Padron', '2,Oliva'])
+
+        status, output = self.run_cli('query', '--where', 'humidor=cabinet', '--output', 'json')
+        self.assertEqual([record['id'] for record in json.loads(output)], [2])
+        status, output = self.run_cli('query', '--limit', '1')
+        self.assertEqual(len(output.splitlines()), 1)
+        self.assertEqual(self.run_cli('query', '--where', 'colour=brown')[0], 2)
+
+    def test_update_and_delete(self):
+        self.add(RECORD, dict(RECORD, brand='Oliva'), dict(RECORD, brand='Oliva', line='V'))
+        stale = db.FetchCigarReviewById(1)[16]
+        db.PatchCigarReview(1, {'notes': 'cedar'})
+        edits = [{'id': 1, 'rating': 3, 'updated_at': stale}, {'id': 2, 'rating': 4, 'wrapper': ''},
+                 {'id': 99, 'rating': 4}, {'id': 3, 'rating': 'great'}]
+
+        status, output = self.run_cli('update', stdin=''.join(json.dumps(edit) + '\n' for edit in edits))
+        self.assertEqual(status, 1)
+        report = json.loads(output)
+        self.assertEqual((report['updated'], report['conflicts'], report['missing']), (1, [1], [99]))
+        self.assertEqual(report['rejected'], [[4, ['invalid rating']]])
+        self.assertEqual(db.FetchCigarReviewById(2)[10], 4)
+
+        status, output = self.run_cli('update', '--where', 'brand=Oliva', '--set', 'humidor=Travel', '--dry-run')
+        self.assertEqual(json.loads(output)['ids'], [2, 3])
+        self.assertEqual(db.FetchCigarReviewById(2)[13], 'Desk')
+        self.run_cli('update', '--where', 'brand=Oliva', '--set', 'humidor=Travel')
+        self.assertEqual(db.FetchCigarReviewById(2)[13], 'Travel')
+
+        status, output = self.run_cli('delete', '1', '99')
+        self.assertEqual(json.loads(output)['ids'], [1])
+        status, output = self.run_cli('delete', '--where', 'humidor=Travel')
+        self.assertEqual(json.loads(output)['deleted'], 2)
+        self.assertEqual(db.FetchAllCigarReviews(), [])
+        self.assertEqual(self.run_cli('delete')[0], 2)
+
+    def test_import_export_and_search(self):
+        path = os.path.join(self.tmp_dir.name, 'reviews.csv')
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(RECORD) + ['notes'])
+            writer.writeheader()
+            writer.writerow(dict(RECORD, notes='Cedar and cocoa'))
+            writer.writerow(dict(RECORD, brand='Oliva', notes='Leather and pepper'))
+        status, output = self.run_cli('import', path)
+        self.assertEqual((status, json.loads(output)['inserted']), (0, 2))
+
+        export_path = os.path.join(self.tmp_dir.name, 'ledger.npz')
+        status, output = self.run_cli('export', export_path, '--columns', 'id,brand', '--where', 'rating_min=5')
+        self.assertEqual((status, json.loads(output)['rows']), (0, 2))
+        self.assertEqual(list(exporter.LoadReviews(export_path)['brand']), ['Padron', 'Oliva'])
+
+        status, output = self.run_cli('query', '--search', 'leather', '--columns', 'id,brand')
+        self.assertEqual([json.loads(line) for line in output.splitlines()], [{'id': 2, 'brand': 'Oliva'}])
+        status, output = self.run_cli('get', '1', '--output', 'csv')
+        rows = list(csv.reader(io.StringIO(output)))
+        self.assertEqual((rows[0][:2], rows[1][:2]), (['id', 'brand'], ['1', 'Padron']))
+
+    def test_bad_arguments_exit_2(self):
+        self.add(RECORD)
+        self.assertEqual(self.run_cli('query', '--where', 'rating_min=x')[0], 2)
+        self.assertEqual(self.run_cli('update', '--where', 'brand=Padron')[0], 2)
+        self.assertEqual(db.FetchCigarReviewById(1)[1], 'Padron')
+
+if __name__ == '__main__':
+    unittest.main()
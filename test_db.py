@@ -1,9 +1,11 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 import tempfile
+import sqlite3
 import os
 
 import db  # Import your db module
+import query
 
 class TestDatabase(unittest.TestCase):
     def setUp(self):
@@ -56,6 +58,9 @@ class TestDatabase(unittest.TestCase):
         self.patch_create_query.stop()
         self.patch_insert_query.stop()
 
+        # Close the pooled connection before removing its file
+        db.CloseDatabaseConnection()
+
         # Clean up the temp database file
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
@@ -133,6 +138,8 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(record[2], 'NewLine')
         self.assertEqual(record[10], 9.5)  # rating
         self.assertEqual(record[14], 'newtag1,newtag2')  # tags
+        # stamped to the millisecond like PatchCigarReview, so the conflict check can tell quick edits apart
+        self.assertRegex(record[16], r'\.\d{3}$')  # updated_at
 
     def test_delete_cigar_review(self):
         # Add a review
@@ -154,12 +161,460 @@ class TestDatabase(unittest.TestCase):
         record = db.FetchCigarReviewById(1)
         self.assertIsNone(record)
 
+    def test_fetch_cigar_review_pages(self):
+        # Add a handful of reviews and page through them two at a time
+        for i in range(5):
+            db.AddCigarReview(
+                brand=f'Brand{i}', line='TestLine', vitola='TestVitola', ring_gauge=50,
+                country='TestCountry', wrapper=None, binder=None, filler=None,
+                date_smoked='2023-01-01', rating=4, notes='Long notes that are not displayed', price_cents=1500,
+                humidor='TestHumidor', tags=None
+            )
+
+        pages = list(db.FetchCigarReviewPages(page_size=2, columns=['brand', 'rating']))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(pages[0][0], ('Brand0', 4))  # only the projected columns, id is not leaked
+        self.assertEqual(pages[2][0], ('Brand4', 4))
+
+        # Keyset start point
+        pages = list(db.FetchCigarReviewPages(page_size=10, after_id=3))
+        self.assertEqual([record[0] for record in pages[0]], [4, 5])
+
+        # Unknown columns are refused rather than interpolated into SQL
+        with self.assertRaises(ValueError):
+            list(db.FetchCigarReviewPages(columns=['brand; DROP TABLE cigar_reviews']))
+
+    def test_query_cigar_reviews(self):
+        # Three reviews differing in brand, rating, date and price
+        for brand, rating, date_smoked, price in [('Padron', 5, '2024-01-10', 2000),
+                                                  ('Padron', 3, '2023-06-01', 900),
+                                                  ('Oliva', 4, '2024-02-20', 1200)]:
+            db.AddCigarReview(
+                brand=brand, line='TestLine', vitola='Toro', ring_gauge=50,
+                country='Nicaragua', wrapper='Maduro', binder=None, filler=None,
+                date_smoked=date_smoked, rating=rating, notes=None, price_cents=price,
+                humidor='Office', tags=None
+            )
+
+        # Text filters are case-insensitive and AND with ranges
+        records = db.QueryCigarReviews({'brand': 'padron', 'rating_min': 4}, columns=['id', 'brand'])
+        self.assertEqual(records, [(1, 'Padron')])
+
+        # A list of values matches any of them, blank filters are ignored
+        records = db.QueryCigarReviews({'brand': ['Oliva', 'Padron'], 'line': '', 'date_from': '2024-01-01', 'date_to': '2024-12-31'})
+        self.assertEqual([record[0] for record in records], [1, 3])
+
+        records = db.QueryCigarReviews({'price_min': 1000, 'price_max': 1500, 'humidor': 'office'})
+        self.assertEqual([record[0] for record in records], [3])
+
+        # The same filters work with the paged fetch
+        pages = list(db.FetchCigarReviewPages(page_size=1, columns=['id'], filters={'country': 'NICARAGUA'}))
+        self.assertEqual(pages, [[(1,)], [(2,)], [(3,)]])
+
+        with self.assertRaises(ValueError):
+            db.QueryCigarReviews({'flavour': 'cedar'})
+
+        # a price skipped in the menu is stored as '', it must not pass a minimum price
+        db.AddCigarReview(brand='Padron', line='TestLine', vitola='Toro', ring_gauge=50, country='Nicaragua',
+                          wrapper=None, binder=None, filler=None, date_smoked='2024-03-01', rating=4, notes=None,
+                          price_cents='', humidor=None, tags=None)
+        self.assertEqual(db.QueryCigarReviews({'price_min': 1000}, columns=['id']), [(1,), (3,)])
+        self.assertEqual(db.QueryCigarReviews({'price_max': 1000}, columns=['id']), [(2,)])
+
+    def test_query_filters_use_indexes(self):
+        # Every text filter should be answered by an index seek rather than a table scan
+        connection = db.GetDatabaseConnection()
+        for key in query.TEXT_FILTERS:
+            where_sql, params = query.CompileReviewFilters({key: 'x'})
+            plan = connection.execute(f"EXPLAIN QUERY PLAN SELECT * FROM cigar_reviews WHERE {where_sql}", params).fetchall()
+            self.assertIn('USING INDEX', plan[0][3], key)
+
+        where_sql, params = query.CompileReviewFilters({'date_from': '2024-01-01', 'date_to': '2024-12-31'})
+        plan = connection.execute(f"EXPLAIN QUERY PLAN SELECT * FROM cigar_reviews WHERE {where_sql}", params).fetchall()
+        self.assertIn('idx_cigar_reviews_date_smoked', plan[0][3])
+
+        where_sql, params = query.CompileReviewFilters({'price_min': 1000, 'price_max': 2000})
+        plan = connection.execute(f"EXPLAIN QUERY PLAN SELECT * FROM cigar_reviews WHERE {where_sql}", params).fetchall()
+        self.assertIn('idx_cigar_reviews_price ', plan[0][3] + ' ')
+
+    def test_tag_index_tracks_writes(self):
+        def add(brand, tags):
+            db.AddCigarReview(
+                brand=brand, line='TestLine', vitola='Toro', ring_gauge=50,
+                country='Nicaragua', wrapper=None, binder=None, filler=None,
+                date_smoked='2024-01-01', rating=4, notes=None, price_cents=None,
+                humidor=None, tags=tags
+            )
+
+        add('One', 'maduro,box-press')
+        add('Two', 'Maduro, connecticut')
+        add('Three', 'box-press')
+
+        def ids(tags, match_all):
+            return [record[0] for record in db.FetchCigarReviewsByTags(tags, match_all=match_all, columns=['id'])]
+
+        self.assertEqual(ids('maduro,box-press', True), [1])
+        self.assertEqual(ids(['MADURO', 'box-press'], False), [1, 2, 3])
+        self.assertEqual(ids('', True), [])
+
+        # Updates re-sync the review's tags, deletes drop them
+        db.UpdateCigarReview(
+            id=3, brand='Three', line='TestLine', vitola='Toro', ring_gauge=50,
+            country='Nicaragua', wrapper=None, binder=None, filler=None,
+            date_smoked='2024-01-01', rating=4, notes=None, price_cents=None,
+            humidor=None, tags='maduro, box-press'
+        )
+        self.assertEqual(ids('maduro,box-press', True), [1, 3])
+        db.DeleteCigarReview(1)
+        self.assertEqual(ids('maduro,box-press', True), [3])
+
+        # Bulk inserts are indexed too
+        db.BulkAddCigarReviews([('Four', 'L', 'V', 50, 'C', None, None, None, '2024-01-01', 3, None, None, None, 'connecticut'),
+                                ('Five', 'L', 'V', 50, 'C', None, None, None, '2024-01-01', 3, None, None, None, None)])
+        self.assertEqual(ids('connecticut', True), [2, 4])
+
+    def test_existing_csv_tags_are_migrated(self):
+        # Simulate a ledger written before the tag index existed (schema version 1)
+        with db.Transaction() as cursor:
+            cursor.execute("DROP TABLE review_tags")
+            cursor.execute("DROP TABLE tags")
+            cursor.execute("INSERT INTO cigar_reviews (brand, date_smoked, rating, tags) VALUES ('Old', '2020-01-01', 3, 'maduro,lancero')")
+            cursor.execute("PRAGMA user_version = 1")
+
+        db.InitializeDatabase()
+        self.assertEqual(len(db.FetchCigarReviewsByTags('lancero,maduro')), 1)
+
+    def test_old_price_index_is_dropped(self):
+        def indexes():
+            with db.Transaction() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_cigar_reviews_price%'")
+                return sorted(row[0] for row in cursor.fetchall())
+
+        self.assertEqual(indexes(), ['idx_cigar_reviews_price'])
+        # a ledger from before the price filters moved to NULLIF(price_cents, '') still has the plain index
+        with db.Transaction() as cursor:
+            cursor.execute("CREATE INDEX idx_cigar_reviews_price_cents ON cigar_reviews(price_cents)")
+            cursor.execute("PRAGMA user_version = 6")
+        db.InitializeDatabase()
+        self.assertEqual(indexes(), ['idx_cigar_reviews_price'])
+
+    def test_search_cigar_reviews(self):
+        for brand, notes in [('Padron', 'Cedar and dark chocolate, perfect box-press draw'),
+                             ('Oliva', 'Leather with a hint of cedar'),
+                             ('Arturo Fuente', 'Creamy and nutty')]:
+            db.AddCigarReview(
+                brand=brand, line='TestLine', vitola='Toro', ring_gauge=50,
+                country='Nicaragua', wrapper=None, binder=None, filler=None,
+                date_smoked='2024-01-01', rating=4, notes=notes, price_cents=None,
+                humidor=None, tags=None
+            )
+
+        def ids(text):
+            return sorted(record[0] for record in db.SearchCigarReviews(text, columns=['id']))
+
+        self.assertEqual(ids('cedar'), [1, 2])
+        self.assertEqual(ids('cedar chocolate'), [1])
+        self.assertEqual(ids('box-press'), [1])  # hyphen is not parsed as FTS syntax
+        self.assertEqual(ids('choc*'), [1])
+        self.assertEqual(ids('fuente'), [3])
+        self.assertEqual(ids('   '), [])
+
+        # Triggers keep the index in step with updates and deletes
+        db.UpdateCigarReview(
+            id=3, brand='Arturo Fuente', line='TestLine', vitola='Toro', ring_gauge=50,
+            country='Nicaragua', wrapper=None, binder=None, filler=None,
+            date_smoked='2024-01-01', rating=4, notes='Cedar bomb', price_cents=None,
+            humidor=None, tags=None
+        )
+        db.DeleteCigarReview(2)
+        self.assertEqual(ids('cedar'), [1, 3])
+        self.assertEqual(ids('creamy'), [])
+
+    def test_review_summaries_follow_writes(self):
+        def add(brand, humidor, rating, price):
+            db.AddCigarReview(
+                brand=brand, line='TestLine', vitola='Toro', ring_gauge=50,
+                country='Nicaragua', wrapper=None, binder=None, filler=None,
+                date_smoked='2024-01-01', rating=rating, notes=None, price_cents=price,
+                humidor=humidor, tags=None
+            )
+
+        add('Padron', 'Office', 5, 2000)
+        add('padron', 'Office', 3, None)
+        add('Oliva', '', 4, 1000)
+
+        self.assertEqual(db.FetchReviewSummary('brand'), [('Padron', 2, 4.0, 2000, 2000), ('Oliva', 1, 4.0, 1000, 1000)])
+        self.assertEqual(db.FetchReviewSummary('country'), [('Nicaragua', 3, 4.0, 3000, 1500)])
+
+        # Moving a review to another humidor moves its totals, deleting the last review of a group drops the group
+        db.UpdateCigarReview(
+            id=3, brand='Oliva', line='TestLine', vitola='Toro', ring_gauge=50,
+            country='Nicaragua', wrapper=None, binder=None, filler=None,
+            date_smoked='2024-01-01', rating=4, notes=None, price_cents=1000,
+            humidor='Office', tags=None
+        )
+        db.DeleteCigarReview(2)
+        self.assertEqual(db.FetchReviewSummary('humidor'), [('Office', 2, 4.5, 3000, 1500)])
+        self.assertEqual(db.FetchReviewSummary('brand'), [('Oliva', 1, 4.0, 1000, 1000), ('Padron', 1, 5.0, 2000, 2000)])
+
+        # The triggers agree with a full recount
+        before = [db.FetchReviewSummary(dimension) for dimension in ('brand', 'country', 'humidor')]
+        db.RebuildReviewSummaries()
+        self.assertEqual([db.FetchReviewSummary(dimension) for dimension in ('brand', 'country', 'humidor')], before)
+
+        with self.assertRaises(ValueError):
+            db.FetchReviewSummary('wrapper')
+
+    def test_schema_migrations(self):
+        # A fresh database is migrated all the way and remembers it
+        self.assertEqual(db.GetSchemaVersion(), db.SCHEMA_VERSION)
+        db.InitializeDatabase()
+        self.assertEqual(db.GetSchemaVersion(), db.SCHEMA_VERSION)
+
+        # Only the missing migrations run on an older ledger
+        with db.Transaction() as cursor:
+            cursor.execute(f"PRAGMA user_version = {db.SCHEMA_VERSION - 1}")
+        applied = []
+        with patch.object(db, 'MIGRATIONS', db.MIGRATIONS[:-1] + [lambda cursor: applied.append(db.SCHEMA_VERSION)]):
+            db.InitializeDatabase()
+        self.assertEqual(applied, [db.SCHEMA_VERSION])
+
+        # A ledger from a newer release is refused rather than silently misread
+        with db.Transaction() as cursor:
+            cursor.execute(f"PRAGMA user_version = {db.SCHEMA_VERSION + 1}")
+        with self.assertRaises(RuntimeError):
+            db.InitializeDatabase()
+
+    def test_review_cache(self):
+        db.ClearReviewCache()
+        for brand in ['BrandA', 'BrandB']:
+            db.AddCigarReview(
+                brand=brand, line='TestLine', vitola='TestVitola', ring_gauge=50,
+                country='TestCountry', wrapper=None, binder=None, filler=None,
+                date_smoked='2023-01-01', rating=4, notes=None, price_cents=None,
+                humidor=None, tags='maduro'
+            )
+        before = db.ReviewCacheStats()
+
+        # the second lookup is served from memory, missing ids are never cached
+        self.assertEqual(db.FetchCigarReviewById(1)[1], 'BrandA')
+        self.assertEqual(db.FetchCigarReviewById(1)[1], 'BrandA')
+        self.assertIsNone(db.FetchCigarReviewById(999))
+        self.assertIsNone(db.FetchCigarReviewById(999))
+        stats = db.ReviewCacheStats()
+        self.assertEqual(stats['hits'] - before['hits'], 1)
+        self.assertEqual(stats['misses'] - before['misses'], 3)
+        self.assertEqual(stats['size'], 1)
+
+        # writes through db.py invalidate exactly the review they touch
+        db.FetchCigarReviewById(2)
+        db.UpdateCigarReview(1, 'NewBrand', 'TestLine', 'TestVitola', 50, 'TestCountry', None, None, None,
+                             '2023-01-01', 5, None, None, None, 'maduro')
+        self.assertEqual(db.ReviewCacheStats()['size'], 1)
+        self.assertEqual(db.FetchCigarReviewById(1)[1], 'NewBrand')
+        db.DeleteCigarReview(2)
+        self.assertIsNone(db.FetchCigarReviewById(2))
+
+        # an id typed at the menu ("1") and one read back by the bulk writes (1) share one cache entry
+        self.assertEqual(db.FetchCigarReviewById("1")[1], 'NewBrand')
+        db.BulkUpdateCigarReviews({'brand': 'NewBrand'}, {'humidor': 'Travel'})
+        self.assertEqual(db.FetchCigarReviewById("1")[13], 'Travel')
+        db.PatchCigarReview(1, {'humidor': 'Desk'})
+        self.assertEqual(db.FetchCigarReviewById(" 1 ")[13], 'Desk')
+
+        # a commit from another connection (another process) is noticed through PRAGMA data_version
+        other = sqlite3.connect(self.db_path)
+        other.execute("UPDATE cigar_reviews SET brand = 'OtherProcess' WHERE id = 1")
+        other.commit()
+        other.close()
+        self.assertEqual(db.FetchCigarReviewById(1)[1], 'OtherProcess')
+
+        # rows read inside an open transaction bypass the cache, so a rollback cannot leave them behind
+        with self.assertRaises(RuntimeError):
+            with db.Transaction() as cursor:
+                cursor.execute("UPDATE cigar_reviews SET brand = 'RolledBack' WHERE id = 1")
+                self.assertEqual(db.FetchCigarReviewById(1)[1], 'RolledBack')
+                raise RuntimeError("boom")
+        self.assertEqual(db.FetchCigarReviewById(1)[1], 'OtherProcess')
+
+        db.ConfigureReviewCache(0)
+        try:
+            db.FetchCigarReviewById(1)
+            self.assertEqual(db.ReviewCacheStats()['size'], 0)
+        finally:
+            db.ConfigureReviewCache()
+
+    def test_patch_cigar_review(self):
+        db.AddCigarReview('OldBrand', 'OldLine', 'Toro', 50, 'Nicaragua', 'Maduro', None, None,
+                          '2023-01-01', 3, 'Old notes', 1000, 'Desk', 'oldtag')
+        before = db.FetchCigarReviewById(1)
+
+        # only the given columns change and the new row comes straight back from the UPDATE
+        record = db.PatchCigarReview(1, {'rating': 5, 'tags': 'maduro,box-press'}, expected_updated_at=before[16])
+        self.assertEqual(record[:10], before[:10])
+        self.assertEqual((record[10], record[14]), (5, 'maduro,box-press'))
+        self.assertNotEqual(record[16], before[16])
+        self.assertEqual(db.FetchCigarReviewById(1), record)
+        self.assertEqual(len(db.FetchCigarReviewsByTags('box-press')), 1)
+
+        # a write based on the old updated_at is refused and changes nothing
+        with self.assertRaises(db.UpdateConflict) as conflict:
+            db.PatchCigarReview(1, {'rating': 1}, expected_updated_at=before[16])
+        self.assertEqual(conflict.exception.current_updated_at, record[16])
+        self.assertEqual(db.FetchCigarReviewById(1)[10], 5)
+
+        # without an expected updated_at the write always goes through
+        self.assertEqual(db.PatchCigarReview(1, {'wrapper': None})[6], None)
+        self.assertIsNone(db.PatchCigarReview(999, {'rating': 4}))
+        self.assertEqual(db.PatchCigarReview(1, {}), db.FetchCigarReviewById(1))
+        with self.assertRaises(ValueError):
+            db.PatchCigarReview(1, {'created_at': '2020-01-01'})
+
+    def test_bulk_update_and_delete(self):
+        db.BulkAddCigarReviews([
+            ('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, 'Desk', 'maduro'),
+            ('Padron', '1926', 'Robusto', 52, 'Nicaragua', None, None, None, '2023-06-01', 4, None, None, 'Desk', 'maduro,box-press'),
+            ('Arturo Fuente', 'Hemingway', 'Short Story', 49, 'Dominican Republic', None, None, None, '2024-01-01', 4, None, None, 'Cabinet', None),
+        ])
+        db.FetchCigarReviewById(1)
+
+        # a dry run reports the matching ids and writes nothing
+        self.assertEqual(db.BulkUpdateCigarReviews({'brand': 'padron'}, {'humidor': 'Travel'}, dry_run=True), [1, 2])
+        self.assertEqual(db.FetchCigarReviewById(1)[13], 'Desk')
+
+        self.assertEqual(db.BulkUpdateCigarReviews({'tags_any': 'maduro'}, {'humidor': 'Travel', 'tags': 'discontinued'}), [1, 2])
+        self.assertEqual(db.FetchCigarReviewById(1)[13], 'Travel')
+        self.assertEqual([record[0] for record in db.FetchCigarReviewsByTags('discontinued')], [1, 2])
+        self.assertEqual(db.FetchCigarReviewsByTags('maduro'), [])
+        self.assertEqual(db.FetchReviewSummary('humidor')[0][:2], ('Travel', 2))
+
+        self.assertEqual(db.BulkDeleteCigarReviews({'date_to': '2023-12-31', 'humidor': 'Travel'}, dry_run=True), [1, 2])
+        self.assertEqual(len(db.FetchAllCigarReviews()), 3)
+        self.assertEqual(db.BulkDeleteCigarReviews({'tags_all': 'discontinued'}), [1, 2])
+        self.assertEqual([record[0] for record in db.FetchAllCigarReviews()], [3])
+        self.assertIsNone(db.FetchCigarReviewById(1))
+        self.assertEqual(db.GetDatabaseConnection().execute("SELECT COUNT(*) FROM review_tags").fetchone()[0], 0)
+
+        # an empty filter would touch every review, so it is refused
+        with self.assertRaises(ValueError):
+            db.BulkDeleteCigarReviews({})
+        with self.assertRaises(ValueError):
+            db.BulkUpdateCigarReviews({'brand': 'Padron'}, {})
+
+    def test_change_log(self):
+        db.AddCigarReview('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, 'Desk', 'maduro')
+        db.AddCigarReview('Oliva', 'V', 'Robusto', 50, 'Nicaragua', None, None, None, '2023-02-01', 4, None, None, 'Desk', None)
+        db.PatchCigarReview(1, {'rating': 4, 'notes': 'cocoa'})
+        db.DeleteCigarReview(2)
+
+        changes = db.FetchReviewChanges()
+        self.assertEqual([(change['operation'], change['review_id']) for change in changes],
+                         [('insert', 1), ('insert', 2), ('update', 1), ('delete', 2)])
+        self.assertEqual(changes[2]['columns'], ['rating', 'notes', 'updated_at'])
+        self.assertEqual(changes[0]['row'], db.FetchCigarReviewById(1))
+        self.assertIsNone(changes[1]['row'])
+        self.assertEqual([change['seq'] for change in db.FetchReviewChanges(changes[1]['seq'], limit=1)], [changes[2]['seq']])
+
+        # sequence numbers keep growing after the log is pruned
+        self.assertEqual(db.PruneReviewChanges(changes[-1]['seq']), 4)
+        db.AddCigarReview('Oliva', 'V', 'Robusto', 50, 'Nicaragua', None, None, None, '2023-02-01', 4, None, None, 'Desk', None)
+        self.assertGreater(db.FetchReviewChanges()[0]['seq'], changes[-1]['seq'])
+
+    def test_apply_review_changes(self):
+        db.AddCigarReview('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, 'Desk', 'maduro')
+        db.AddCigarReview('Oliva', 'V', 'Robusto', 50, 'Nicaragua', None, None, None, '2023-02-01', 4, None, None, 'Desk', None)
+        db.DeleteCigarReview(2)
+        changes = db.FetchReviewChanges()
+        source_rows = db.FetchAllCigarReviews()
+
+        replica_fd, replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(replica_fd)
+        try:
+            with patch('db.DATABASE_NAME', replica_path):
+                db.InitializeDatabase()
+                self.assertEqual(db.GetSyncPosition('main'), 0)
+                self.assertEqual(db.ApplyReviewChanges(changes, 'main'), changes[-1]['seq'])
+                self.assertEqual(db.FetchAllCigarReviews(), source_rows)
+                self.assertEqual(len(db.FetchCigarReviewsByTags('maduro')), 1)
+                # re-applying the same batch is a no-op
+                self.assertEqual(db.ApplyReviewChanges(changes, 'main'), changes[-1]['seq'])
+                self.assertEqual(db.FetchAllCigarReviews(), source_rows)
+                db.CloseDatabaseConnection()
+        finally:
+            os.remove(replica_path)
+
+    def test_review_rollup(self):
+        db.BulkAddCigarReviews([
+            ('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-05', 5, None, 1500, None, None),
+            ('Padron', '1926', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-20', 3, None, '', None, None),
+            ('Oliva', 'V', 'Robusto', 50, 'Nicaragua', None, None, None, '2023-03-02', 4, None, 900, None, None),
+            ('Oliva', 'V', 'Robusto', 50, 'Nicaragua', None, None, None, '2024-02-11', 2, None, 600, None, None),
+        ])
+
+        monthly = db.FetchReviewRollup('month', moving_window=2)
+        self.assertEqual(monthly, [
+            ('2023-01', 2, 1500, 4.0, 1500, 4.0, 1500, 1500),
+            ('2023-03', 1, 900, 4.0, 900, 4.0, 2400, 2400),
+            ('2024-02', 1, 600, 2.0, 600, 3.0, 1500, 3000),
+        ])
+        self.assertEqual([row[:3] for row in db.FetchReviewRollup('year')], [('2023', 3, 2400), ('2024', 1, 600)])
+        self.assertEqual([row[0] for row in db.FetchReviewRollup('day', filters={'brand': 'Oliva'})], ['2023-03-02', '2024-02-11'])
+
+        # asking again is answered from the cache until the ledger changes
+        hits = db.RollupCacheStats()['hits']
+        self.assertEqual(db.FetchReviewRollup('month', moving_window=2), monthly)
+        self.assertEqual(db.RollupCacheStats()['hits'], hits + 1)
+        db.PatchCigarReview(4, {'price_cents': 700})
+        self.assertEqual(db.FetchReviewRollup('month', moving_window=2)[-1][2], 700)
+        self.assertEqual(db.RollupCacheStats()['hits'], hits + 1)
+
+        with self.assertRaises(ValueError):
+            db.FetchReviewRollup('week')
+
+    def test_connection_pragmas(self):
+        connection = db.GetDatabaseConnection()
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        self.assertEqual(connection.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.execute("PRAGMA cache_size").fetchone()[0], -65536)
+        self.assertEqual(connection.execute("PRAGMA mmap_size").fetchone()[0], 268435456)
+
     def test_close_database_connection(self):
-        # This function opens and closes a connection; test it doesn't raise errors
+        # This function closes the pooled connections; test it doesn't raise errors
         try:
             db.CloseDatabaseConnection()
         except Exception as e:
             self.fail(f"CloseDatabaseConnection raised an exception: {e}")
 
+        # The next call transparently opens a fresh connection
+        self.assertEqual(db.FetchAllCigarReviews(), [])
+
+    def test_close_survives_failed_optimize(self):
+        # a connection whose PRAGMA optimize fails is still closed, and so is every other pooled one
+        failing = Mock()
+        failing.execute.side_effect = sqlite3.OperationalError("database is locked")
+        healthy = db.GetDatabaseConnection()
+        db._connections[object()] = (db.DATABASE_NAME, failing)
+        db.CloseDatabaseConnection()
+
+        failing.close.assert_called_once()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            healthy.execute("SELECT 1")
+        self.assertEqual(db._connections, {})
+
+    def test_connection_is_reused(self):
+        # Every call on the same thread shares one open handle
+        first = db.GetDatabaseConnection()
+        db.FetchAllCigarReviews()
+        self.assertIs(db.GetDatabaseConnection(), first)
+
+    def test_transaction_rolls_back_on_error(self):
+        # A failing block leaves nothing behind
+        with self.assertRaises(RuntimeError):
+            with db.Transaction() as cursor:
+                cursor.execute("INSERT INTO cigar_reviews (brand, date_smoked, rating) VALUES ('Rolled', '2023-01-01', 3)")
+                raise RuntimeError("boom")
+
+        self.assertEqual(db.FetchAllCigarReviews(), [])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+
+import pandas
+
+import db
+import exporter
+from InsertTestData.generate import GenerateReviews
+
+class TestExporter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patch_db_name = patch('db.DATABASE_NAME', os.path.join(self.tmp_dir.name, 'test.db'))
+        self.patch_db_name.start()
+        db.InitializeDatabase()
+
+    def tearDown(self):
+        self.patch_db_name.stop()
+        db.CloseDatabaseConnection()
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_npz_round_trip(self):
+        db.BulkAddCigarReviews(GenerateReviews(250, seed=2))
+        # main.py stores a skipped price as '' and notes may be empty
+        db.AddCigarReview('Padron', None, 'Toro', '', 'Nicaragua', None, None, None, '2024-05-06', 4, '', '', None, None)
+
+        report = exporter.ExportReviews(self.path('ledger.npz'), chunk_size=64)
+        self.assertEqual((report['rows'], report['format']), (251, 'npz'))
+
+        frame = exporter.LoadReviews(self.path('ledger.npz'))
+        records = db.FetchAllCigarReviews()
+        self.assertEqual(list(frame.columns), db.ALL_COLUMNS)
+        self.assertEqual(len(frame), len(records))
+        self.assertEqual(str(frame['brand'].dtype), 'category')
+        self.assertEqual(str(frame['price_cents'].dtype), 'Int64')
+
+        # every value survives the trip, blanks in the typed columns come back missing
+        typed = exporter.INTEGER_COLUMNS + exporter.DATE_COLUMNS + exporter.TIMESTAMP_COLUMNS
+        for record, row in zip(records, frame.itertuples(index=False)):
+            for column, value, loaded in zip(db.ALL_COLUMNS, record, row):
+                if pandas.isna(loaded):
+                    loaded = None
+                elif column in exporter.DATE_COLUMNS:
+                    loaded = loaded.date().isoformat()
+                elif column in exporter.TIMESTAMP_COLUMNS:
+                    loaded = str(loaded)
+                if column in typed and value == '':
+                    value = None
+                self.assertEqual(loaded, value, (column, record))
+
+    def test_projected_and_filtered_export(self):
+        db.BulkAddCigarReviews(GenerateReviews(100, seed=4))
+        report = exporter.ExportReviews(self.path('padron.npz'), columns=['brand', 'rating'],
+                                        filters={'brand': 'Padron'}, compress=True)
+
+        arrays = exporter.ReadNpzColumns(self.path('padron.npz'))
+        self.assertEqual(arrays['__meta__']['columns'], ['brand', 'rating'])
+        self.assertEqual(list(arrays['brand.dictionary']), ['Padron'])
+        self.assertEqual(len(arrays['rating']), report['rows'])
+        self.assertEqual(report['rows'], len(db.QueryCigarReviews({'brand': 'Padron'})))
+
+    def test_empty_ledger_and_bad_arguments(self):
+        exporter.ExportReviews(self.path('empty.npz'))
+        self.assertEqual(len(exporter.LoadReviews(self.path('empty.npz'))), 0)
+
+        with self.assertRaises(ValueError):
+            exporter.ExportReviews(self.path('x.npz'), columns=['brand', 'nope'])
+        with self.assertRaises(ValueError):
+            exporter.ExportReviews(self.path('x.csv'), file_format='csv')
+
+    @unittest.skipIf(exporter._Pyarrow() is not None, "pyarrow is installed")
+    def test_arrow_formats_need_pyarrow(self):
+        with self.assertRaises(RuntimeError):
+            exporter.ExportReviews(self.path('ledger.parquet'))
+        # without pyarrow an unknown extension falls back to npz
+        self.assertEqual(exporter.ExportReviews(self.path('ledger.bin'))['format'], 'npz')
+
+    @unittest.skipIf(exporter._Pyarrow() is None, "pyarrow is not installed")
+    def test_arrow_round_trip(self):
+        db.BulkAddCigarReviews(GenerateReviews(250, seed=2))
+        for name in ['ledger.parquet', 'ledger.arrow']:
+            exporter.ExportReviews(self.path(name), chunk_size=64)
+            frame = exporter.LoadReviews(self.path(name))
+            self.assertEqual(len(frame), 250)
+            self.assertEqual(str(frame['brand'].dtype), 'category')
+            self.assertEqual(list(frame['brand']), [record[1] for record in db.FetchAllCigarReviews()])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+
+import db
+import importer
+from InsertTestData.generate import GenerateReviews, WriteReviews
+from constants import INSERT_COLUMNS
+from validate import validate_record
+
+class TestGenerate(unittest.TestCase):
+    def test_generation_is_reproducible(self):
+        self.assertEqual(list(GenerateReviews(50, seed=7)), list(GenerateReviews(50, seed=7)))
+        self.assertNotEqual(list(GenerateReviews(50, seed=7)), list(GenerateReviews(50, seed=8)))
+
+    def test_generated_rows_are_valid(self):
+        for row in GenerateReviews(500, seed=1):
+            self.assertEqual(len(row), 14)
+            _, errors = validate_record(dict(zip(INSERT_COLUMNS, row)))
+            self.assertEqual(errors, [], row)
+
+    def test_written_file_imports_cleanly(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'ledger.csv')
+            WriteReviews(path, 100, seed=3)
+
+            with patch('db.DATABASE_NAME', os.path.join(tmp_dir, 'test.db')):
+                db.InitializeDatabase()
+                try:
+                    report = importer.ImportReviews(path)
+                finally:
+                    db.CloseDatabaseConnection()
+
+        self.assertEqual(report['inserted'], 100)
+        self.assertEqual(report['rejected'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import json
+import os
+
+import db
+import importer
+
+HEADER = "brand,line,vitola,ring_gauge,country,wrapper,binder,filler,date_smoked,rating,notes,price_cents,humidor,tags\n"
+GOOD_ROW = "Padron,1964 Anniversary,Toro,50,Nicaragua,Maduro,,,2023-01-01,5,Great smoke,1500,Main,\"maduro,box-press\"\n"
+
+class TestImporter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+
+        self.patch_db_name = patch('db.DATABASE_NAME', self.db_path)
+        self.patch_db_name.start()
+        db.InitializeDatabase()
+
+    def tearDown(self):
+        self.patch_db_name.stop()
+        db.CloseDatabaseConnection()
+        self.tmp_dir.cleanup()
+
+    def write_file(self, name, text):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_import_csv_in_batches(self):
+        path = self.write_file('reviews.csv', HEADER + GOOD_ROW * 5)
+
+        report = importer.ImportReviews(path, batch_size=2)
+
+        self.assertEqual(report['inserted'], 5)
+        self.assertEqual(report['rejected'], 0)
+        records = db.FetchAllCigarReviews()
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[0][1], 'Padron')
+        self.assertEqual(records[0][4], 50)
+        self.assertIsNone(records[0][7])  # blank binder stored as NULL
+        self.assertEqual(records[0][14], 'maduro,box-press')
+
+    def test_import_jsonl_reports_rejected_rows(self):
+        good = {'brand': 'Padron', 'line': 'Family Reserve', 'vitola': 'Robusto', 'ring_gauge': 50,
+                'country': 'Nicaragua', 'date_smoked': '2024-02-03', 'rating': 4}
+        bad = dict(good, rating=9, date_smoked='2024-13-01')
+        path = self.write_file('reviews.jsonl', '\n'.join([json.dumps(good), json.dumps(bad), '{not json', json.dumps(good)]) + '\n')
+
+        report = importer.ImportReviews(path)
+
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(report['rejected'], 2)
+        self.assertEqual(report['errors'][0], (2, ['invalid date_smoked', 'invalid rating']))
+        self.assertEqual(report['errors'][1][0], 3)
+        self.assertIn('rows_per_second', report)
+
+    def test_failed_batch_is_rolled_back(self):
+        # rows handed straight to the db API skip validation, so the rating CHECK constraint fails the batch
+        rows = [('A', 'B', 'C', 50, 'D', None, None, None, '2023-01-01', 3, None, None, None, None),
+                ('A', 'B', 'C', 50, 'D', None, None, None, '2023-01-01', 9, None, None, None, None)]
+        with self.assertRaises(Exception):
+            db.BulkAddCigarReviews(rows, batch_size=2)
+
+        self.assertEqual(db.FetchAllCigarReviews(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import pstats
+import json
+import os
+
+import db
+import instrumentation
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patch_db_name = patch('db.DATABASE_NAME', os.path.join(self.tmp_dir.name, 'test.db'))
+        self.patch_db_name.start()
+        db.InitializeDatabase()
+
+        self.events = []
+        instrumentation.AddSink(self.events.append)
+
+    def tearDown(self):
+        instrumentation.RemoveSink(self.events.append)
+        self.patch_db_name.stop()
+        db.CloseDatabaseConnection()
+        self.tmp_dir.cleanup()
+
+    def add_review(self, brand='TestBrand'):
+        db.AddCigarReview(
+            brand=brand, line='TestLine', vitola='Toro', ring_gauge=50,
+            country='Nicaragua', wrapper=None, binder=None, filler=None,
+            date_smoked='2024-01-01', rating=4, notes='Cedar', price_cents=1500,
+            humidor=None, tags=None
+        )
+
+    def calls(self, function):
+        return [event for event in self.events if event['event'] == 'call' and event['function'] == function]
+
+    def test_call_events(self):
+        self.add_review()
+        db.FetchCigarReviewById(1)
+        db.FetchAllCigarReviews()
+
+        add = self.calls('AddCigarReview')[0]
+        self.assertTrue(any(statement.startswith('INSERT INTO cigar_reviews') for statement in add['statements']))
+        self.assertGreater(add['seconds'], 0)
+        self.assertIsNone(add['error'])
+
+        self.assertEqual(self.calls('FetchCigarReviewById')[0]['rows'], 1)
+        self.assertEqual(self.calls('FetchAllCigarReviews')[0]['rows'], 1)
+
+        transactions = [event for event in self.events if event['event'] == 'transaction']
+        self.assertTrue(all(event['committed'] for event in transactions))
+        self.assertIn('AddCigarReview', [event['function'] for event in transactions])
+
+    def test_generator_and_error_events(self):
+        for i in range(5):
+            self.add_review(f'Brand{i}')
+        pages = list(db.FetchCigarReviewPages(page_size=2))
+        self.assertEqual(len(pages), 3)
+        event = self.calls('FetchCigarReviewPages')[0]
+        self.assertEqual(event['rows'], 5)
+        self.assertEqual(event['statement_count'], 3)
+
+        with self.assertRaises(ValueError):
+            db.FetchReviewSummary('wrapper')
+        self.assertIn('ValueError', self.calls('FetchReviewSummary')[0]['error'])
+
+    def test_disabled_instrumentation_emits_nothing(self):
+        instrumentation.RemoveSink(self.events.append)
+        self.add_review()
+        self.assertFalse(instrumentation.Enabled())
+        self.assertEqual(self.events, [])
+        # tracing is only attached while enabled
+        connection = db.GetDatabaseConnection()
+        self.assertEqual(db.FetchAllCigarReviews()[0][1], 'TestBrand')
+        self.assertIs(db.GetDatabaseConnection(), connection)
+
+    def test_sinks(self):
+        metrics = instrumentation.MetricsSink()
+        path = os.path.join(self.tmp_dir.name, 'metrics.jsonl')
+        json_sink = instrumentation.JsonLinesSink(path)
+        instrumentation.AddSink(metrics)
+        instrumentation.AddSink(json_sink)
+        try:
+            self.add_review()
+            self.add_review()
+        finally:
+            instrumentation.RemoveSink(metrics)
+            instrumentation.RemoveSink(json_sink)
+            json_sink.close()
+
+        self.assertEqual(metrics.Summary()['AddCigarReview']['calls'], 2)
+        self.assertEqual(metrics.transactions['count'], 2)
+        with open(path, encoding='utf-8') as f:
+            logged = [json.loads(line) for line in f]
+        self.assertEqual([event['function'] for event in logged if event['event'] == 'call'], ['AddCigarReview', 'AddCigarReview'])
+
+    def test_profiling(self):
+        path = os.path.join(self.tmp_dir.name, 'db.prof')
+        instrumentation.StartProfiling(path)
+        try:
+            self.add_review()
+        finally:
+            instrumentation.StopProfiling()
+
+        stats = pstats.Stats(path)
+        self.assertTrue(any(function[2] == 'AddCigarReview' for function in stats.stats))
+
+    def test_configure_from_environment(self):
+        path = os.path.join(self.tmp_dir.name, 'env.jsonl')
+        with patch('atexit.register'):
+            instrumentation.ConfigureFromEnvironment({instrumentation.METRICS_ENVIRONMENT_VARIABLE: path})
+        sink = instrumentation._sinks[-1]
+        try:
+            self.add_review()
+        finally:
+            instrumentation.RemoveSink(sink)
+            sink.close()
+        with open(path, encoding='utf-8') as f:
+            self.assertIn('AddCigarReview', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
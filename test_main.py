@@ -1,6 +1,9 @@
 import unittest
 from unittest.mock import patch
 import io
+import json
+import os
+import subprocess
 import sys
 
 import main  # Assuming the file is named main.py
@@ -73,63 +76,69 @@ class TestMainMenu(unittest.TestCase):
 
     @patch('main.CloseDatabaseConnection')
     @patch('main.InitializeDatabase')
-    @patch('main.UpdateCigarReview')
+    @patch('main.PatchCigarReview')
     @patch('main.FetchCigarReviewById')
-    def test_edit_review(self, mock_fetch, mock_update, mock_init, mock_close):
+    def test_edit_review(self, mock_fetch, mock_patch, mock_init, mock_close):
         mock_fetch.return_value = (1, 'OldBrand', 'OldLine', 'OldVitola', 50, 'OldCountry',
-                                   'OldWrapper', 'OldBinder', 'OldFiller', '2023-01-01', 4.5,
-                                   'Old notes', 1500, 'OldHumidor', 'old,tag', '2023-01-01', '2023-01-01')
+                                   'OldWrapper', 'OldBinder', 'OldFiller', '2023-01-01', 4,
+                                   'Old notes', 1500, 'OldHumidor', 'old,tag', '2023-01-01', '2023-01-02')
         
         inputs = (
             '2\n'  # Choice
             '1\n'  # ID
+            '-\n'  # brand, required so it cannot be cleared
             'NewBrand\n'  # brand
-            'NewLine\n'  # line
-            'NewVitola\n'  # vitola
-            '52\n'  # ring_gauge
-            'NewCountry\n'  # country
-            'NewWrapper\n'  # wrapper
-            'NewBinder\n'  # binder
-            'NewFiller\n'  # filler
-            '2024-01-01\n'  # date_smoked
-            '5.0\n'  # rating
-            'New notes\n'  # notes
-            '2000\n'  # price_cents
-            'NewHumidor\n'  # humidor
-            'new,tag\n'  # tags
+            '\n'  # line, kept
+            '\n'  # vitola, kept
+            'big\n'  # ring_gauge, invalid
+            '50\n'  # ring_gauge, unchanged
+            '\n'  # country, kept
+            '-\n'  # wrapper, cleared
+            '\n'  # binder, kept
+            '\n'  # filler, kept
+            'not-a-date\n'  # date_smoked, invalid
+            '\n'  # date_smoked, kept
+            'abc\n'  # rating, invalid
+            '5\n'  # rating
+            '\n'  # notes, kept
+            '\n'  # price_cents, kept
+            '\n'  # humidor, kept
+            '\n'  # tags, kept
             '7\n'  # Exit
         )
         output = self.run_main_menu_with_inputs(inputs)
         
         mock_init.assert_called_once()
         mock_fetch.assert_called_once_with('1')
-        mock_update.assert_called_once_with(
-            '1', 'NewBrand', 'NewLine', 'NewVitola', '52', 'NewCountry',
-            'NewWrapper', 'NewBinder', 'NewFiller', '2024-01-01', '5.0',
-            'New notes', '2000', 'NewHumidor', 'new,tag'
+        mock_patch.assert_called_once_with(
+            '1', {'brand': 'NewBrand', 'wrapper': None, 'rating': 5}, expected_updated_at='2023-01-02'
         )
         mock_close.assert_called_once()
         
         self.assertIn('Current review details:', output)
+        self.assertIn('The brand is required and cannot be cleared.', output)
+        self.assertIn('Invalid ring gauge', output)
+        self.assertIn('Invalid date smoked', output)
+        self.assertIn('Invalid rating', output)
         self.assertIn('updated successfully!', output)
         self.assertIn('Exiting MyLeafLedger. Goodbye!', output)
 
     @patch('main.CloseDatabaseConnection')
     @patch('main.InitializeDatabase')
-    @patch('main.FetchAllCigarReviews')
-    def test_view_all_reviews(self, mock_fetch_all, mock_init, mock_close):
-        mock_fetch_all.return_value = [
+    @patch('main.FetchCigarReviewPages')
+    def test_view_all_reviews(self, mock_fetch_pages, mock_init, mock_close):
+        mock_fetch_pages.return_value = iter([[
             (1, 'TestBrand', 'TestLine', 'TestVitola', 50, 'TestCountry',
              'TestWrapper', 'TestBinder', 'TestFiller', '2023-01-01', 4.5,
              'Test notes that are a bit longer to test wrapping', 1500, 'TestHumidor', 'tag1,tag2',
              '2023-01-01 00:00:00', '2023-01-01 00:00:00')
-        ]
+        ]])
         
         inputs = '3\n7\n'  # View all, then exit
         output = self.run_main_menu_with_inputs(inputs)
         
         mock_init.assert_called_once()
-        mock_fetch_all.assert_called_once()
+        mock_fetch_pages.assert_called_once()
         mock_close.assert_called_once()
         
         self.assertIn('TestBrand', output)
@@ -139,32 +148,68 @@ class TestMainMenu(unittest.TestCase):
 
     @patch('main.CloseDatabaseConnection')
     @patch('main.InitializeDatabase')
-    def test_query_reviews(self, mock_init, mock_close):
-        inputs = '4\n7\n'  # Query, then exit
+    @patch('main.FetchCigarReviewPages')
+    def test_query_reviews(self, mock_fetch_pages, mock_init, mock_close):
+        mock_fetch_pages.return_value = iter([[
+            (1, 'Padron', 'TestLine', 'TestVitola', 50, 'Nicaragua',
+             'TestWrapper', 'TestBinder', 'TestFiller', '2024-03-01', 5,
+             'Test notes', 1500, 'TestHumidor', 'tag1,tag2',
+             '2024-03-01 00:00:00', '2024-03-01 00:00:00')
+        ]])
+
+        inputs = (
+            '4\n'  # Query
+            'Padron\n'  # brand
+            '\n'  # line
+            'Toro\n'  # vitola
+            '\n'  # country
+            '\n'  # wrapper
+            '\n'  # humidor
+            'four\n'  # invalid minimum rating, asked again
+            '6\n'  # out of range minimum rating, asked again
+            '4\n'  # minimum rating
+            '\n'  # maximum rating
+            '2024-01-01\n'  # date from
+            '\n'  # date to
+            '\n'  # minimum price
+            '2000\n'  # maximum price
+            'maduro, box-press\n'  # tags
+            'any\n'  # match any tag
+            '7\n'  # Exit
+        )
         output = self.run_main_menu_with_inputs(inputs)
         
         mock_init.assert_called_once()
         mock_close.assert_called_once()
+        filters = mock_fetch_pages.call_args.kwargs['filters']
+        self.assertEqual(filters['brand'], 'Padron')
+        self.assertEqual(filters['vitola'], 'Toro')
+        self.assertEqual(filters['rating_min'], 4)
+        self.assertEqual(filters['date_from'], '2024-01-01')
+        self.assertEqual(filters['price_max'], 2000)
+        self.assertEqual(filters['line'], '')
+        self.assertEqual(filters['tags_any'], 'maduro, box-press')
         
-        self.assertIn('Feature not implemented yet. Stay tuned!', output)
+        self.assertIn('Invalid value', output)
+        self.assertIn('Padron', output)
         self.assertIn('Exiting MyLeafLedger. Goodbye!', output)
 
     @patch('main.CloseDatabaseConnection')
     @patch('main.InitializeDatabase')
-    @patch('main.FetchAllCigarReviews')
-    def test_fancy_report(self, mock_fetch_all, mock_init, mock_close):
-        mock_fetch_all.return_value = [
+    @patch('main.FetchCigarReviewPages')
+    def test_fancy_report(self, mock_fetch_pages, mock_init, mock_close):
+        mock_fetch_pages.return_value = iter([[
             (1, 'TestBrand', 'TestLine', 'TestVitola', 50, 'TestCountry',
              'TestWrapper', 'TestBinder', 'TestFiller', '2023-01-01', 4.5,
              'Test notes that are a bit longer to test wrapping', 1500, 'TestHumidor', 'tag1,tag2',
              '2023-01-01 00:00:00', '2023-01-01 00:00:00')
-        ]
+        ]])
         
         inputs = '5\n7\n'  # Fancy report, then exit
         output = self.run_main_menu_with_inputs(inputs)
         
         mock_init.assert_called_once()
-        mock_fetch_all.assert_called_once()
+        mock_fetch_pages.assert_called_once()
         mock_close.assert_called_once()
         
         # Check for rich table elements (ANSI codes might be present, but check content)
@@ -229,7 +274,7 @@ class TestMainMenu(unittest.TestCase):
     @patch('main.CloseDatabaseConnection')
     @patch('main.InitializeDatabase')
     def test_invalid_choice(self, mock_init, mock_close):
-        inputs = '8\n7\n'  # Invalid, then exit
+        inputs = '99\n7\n'  # Invalid, then exit
         output = self.run_main_menu_with_inputs(inputs)
         
         mock_init.assert_called_once()
@@ -238,5 +283,81 @@ class TestMainMenu(unittest.TestCase):
         self.assertIn('Invalid choice. Please try again.', output)
         self.assertIn('Exiting MyLeafLedger. Goodbye!', output)
 
+    @patch('main.CloseDatabaseConnection')
+    @patch('main.InitializeDatabase')
+    @patch('main.SearchCigarReviews')
+    def test_search_reviews(self, mock_search, mock_init, mock_close):
+        mock_search.return_value = []
+
+        inputs = '8\ncedar leather\n7\n'  # Search, then exit
+        output = self.run_main_menu_with_inputs(inputs)
+
+        mock_search.assert_called_once_with('cedar leather')
+        self.assertIn('No reviews match that search.', output)
+        self.assertIn('Exiting MyLeafLedger. Goodbye!', output)
+
+    @patch('main.CloseDatabaseConnection')
+    @patch('main.InitializeDatabase')
+    @patch('main.FetchReviewSummary')
+    def test_summary_report(self, mock_summary, mock_init, mock_close):
+        mock_summary.side_effect = lambda dimension: [(f'Test{dimension}', 3, 4.33, 4500, 1500)]
+
+        inputs = '9\n7\n'  # Summary report, then exit
+        output = self.run_main_menu_with_inputs(inputs)
+
+        self.assertEqual([call.args[0] for call in mock_summary.call_args_list], ['brand', 'country', 'humidor'])
+        self.assertIn('Reviews by brand', output)
+        self.assertIn('Testhumidor', output)
+        self.assertIn('4.33', output)
+        self.assertIn('Exiting MyLeafLedger. Goodbye!', output)
+
+    @patch('main.CloseDatabaseConnection')
+    @patch('main.InitializeDatabase')
+    @patch('main.FetchReviewRollup')
+    def test_spending_report(self, mock_rollup, mock_init, mock_close):
+        mock_rollup.return_value = [('2024', 12, 18000, 4.25, 1500, 4.1, 30000, 45000)]
+
+        inputs = '10\nyearly\nYear\n7\n'  # Spending report, an invalid then a valid period, then exit
+        output = self.run_main_menu_with_inputs(inputs)
+
+        mock_rollup.assert_called_once_with('year')
+        self.assertIn('Invalid value', output)
+        self.assertIn('Spend and ratings by year', output)
+        self.assertIn('moving_avg_rating', output)
+        self.assertIn('45000', output)
+
+    @patch('main.CloseDatabaseConnection')
+    @patch('main.InitializeDatabase')
+    @patch('main.ApproximateStats')
+    def test_approximate_overview(self, mock_stats, mock_init, mock_close):
+        mock_stats.return_value = {
+            'reviews': 250000, 'sample_size': 500, 'rating_mean': (4.12, 0.05), 'price_mean': (1480.5, 31.2),
+            'rating_histogram': {4: (0.62, 0.04), 5: (0.38, 0.04)},
+            'rating_quantiles': {0.5: (4, (4, 4))}, 'price_quantiles': {0.5: (1400, (1350, 1450))},
+            'distinct': {'brand': (118, 4)}, 'seconds': 0.01,
+        }
+
+        inputs = '11\nlots\n500\n7\n'  # Approximate overview, an invalid then a valid sample size, then exit
+        output = self.run_main_menu_with_inputs(inputs)
+
+        mock_stats.assert_called_once_with(500)
+        self.assertIn('Invalid value', output)
+        self.assertIn('Estimated from 500 of 250000 reviews', output)
+        self.assertIn('distinct brand', output)
+        self.assertIn('62.0%', output)
+        self.assertIn('1350 - 1450', output)
+
+    def test_startup_does_not_import_report_libraries(self):
+        # Import main in a fresh interpreter so modules already loaded by this test process do not count
+        result = subprocess.run(
+            [sys.executable, '-c', 'import json, sys, main; print(json.dumps(sorted(sys.modules)))'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        )
+        imported = set(json.loads(result.stdout.splitlines()[-1]))
+
+        self.assertIn('main', imported)
+        for heavy_module in ('pandas', 'rich', 'tabulate', 'numpy', 'cProfile'):
+            self.assertNotIn(heavy_module, imported, f"{heavy_module} is imported at startup")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
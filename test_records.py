@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import tracemalloc
+import os
+
+import db
+from records import ReviewRecordType, RecordFactory
+from InsertTestData.generate import GenerateReviews
+
+class TestRecords(unittest.TestCase):
+    def test_record_factory(self):
+        make_record = RecordFactory(['id', 'brand', 'rating'], skip=1)
+        first = make_record(None, (99, 1, ''.join(['Pad', 'ron']), 5))
+        second = make_record(None, (99, 2, ''.join(['Pad', 'ron']), 4))
+
+        # records are the row tuples with names, and equal brands share one string
+        self.assertEqual(first, (1, 'Padron', 5))
+        self.assertEqual((first.id, first.brand, first.rating), (1, 'Padron', 5))
+        self.assertIs(first.brand, second.brand)
+        self.assertIs(type(first), ReviewRecordType(('id', 'brand', 'rating')))
+        self.assertFalse(hasattr(first, '__dict__'))
+
+class TestRecordFetches(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.patch_db_name = patch('db.DATABASE_NAME', os.path.join(self.tmp_dir.name, 'test.db'))
+        self.patch_db_name.start()
+        db.InitializeDatabase()
+        db.BulkAddCigarReviews(GenerateReviews(2000, seed=6))
+
+    def tearDown(self):
+        self.patch_db_name.stop()
+        db.CloseDatabaseConnection()
+        self.tmp_dir.cleanup()
+
+    def test_records_match_tuples(self):
+        self.assertEqual(db.FetchAllCigarReviews(as_records=True), db.FetchAllCigarReviews())
+        pages = list(db.FetchCigarReviewPages(page_size=300, columns=['brand', 'rating'], as_records=True))
+        self.assertEqual([record.brand for page in pages for record in page],
+                         [row[0] for row in db.FetchAllCigarReviews(columns=['brand'])])
+        self.assertEqual(db.QueryCigarReviews({'brand': 'Padron'}, columns=['id'], as_records=True),
+                         db.QueryCigarReviews({'brand': 'Padron'}, columns=['id']))
+
+        record = db.FetchCigarReviewById(7, columns=['rating', 'brand'], as_records=True)
+        full = db.FetchCigarReviewById(7)
+        self.assertEqual((record.rating, record.brand), (full[10], full[1]))
+        self.assertIsNone(db.FetchCigarReviewById(99999, columns=['brand']))
+        with self.assertRaises(ValueError):
+            db.FetchAllCigarReviews(columns=['brand', 'nope'])
+
+    def test_projected_records_use_less_memory(self):
+        def allocated(fetch):
+            tracemalloc.start()
+            try:
+                result = fetch()
+                return tracemalloc.get_traced_memory()[0], result
+            finally:
+                tracemalloc.stop()
+
+        full, _ = allocated(db.FetchAllCigarReviews)
+        compact, _ = allocated(lambda: db.FetchAllCigarReviews(columns=['id', 'brand', 'country', 'rating'], as_records=True))
+        self.assertLess(compact, full / 3)
+
+if __name__ == '__main__':
+    unittest.main()
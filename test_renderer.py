@@ -0,0 +1,49 @@
+import unittest
+import io
+
+import renderer
+
+ROW = (1, 'TestBrand', 'TestLine', 'TestVitola', 50, 'TestCountry',
+       None, None, None, '2023-01-01', 4,
+       'Test notes that are a bit longer to test wrapping ' * 3, 1500, 'TestHumidor', 'tag1,tag2',
+       '2023-01-01 00:00:00', '2023-01-01 00:00:00')
+
+class TestRenderer(unittest.TestCase):
+    def test_wrap_notes(self):
+        wrapped = renderer.WrapNotes(ROW[11], width=50)
+        self.assertTrue(all(len(line) <= 50 for line in wrapped.split('\n')))
+        self.assertEqual(renderer.WrapNotes(None), '')
+
+    def test_format_row(self):
+        cells = renderer.FormatRow(ROW)
+        self.assertEqual(cells[6], '')  # NULL wrapper
+        self.assertEqual(cells[10], '4')
+        self.assertIn('\n', cells[11])
+
+    def test_pages_are_printed_as_they_arrive(self):
+        out = io.StringIO()
+        seen_before_second_page = []
+
+        def pages():
+            yield [ROW]
+            # the first page must already be on screen before the second one is fetched
+            seen_before_second_page.append(out.getvalue())
+            yield [ROW, ROW]
+
+        printed = renderer.PrintReviewTable(pages(), file=out)
+
+        self.assertEqual(printed, 3)
+        self.assertIn('TestBrand', seen_before_second_page[0])
+        self.assertIn('Test notes that are a bit', out.getvalue())
+
+    def test_fancy_report(self):
+        out = io.StringIO()
+        printed = renderer.PrintFancyReport(iter([[ROW], [ROW]]), file=out)
+
+        self.assertEqual(printed, 2)
+        self.assertIn('Cigar Reviews', out.getvalue())
+        self.assertIn('Cigar Reviews (page 2)', out.getvalue())
+        self.assertIn('TestBrand', out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import tempfile
+import os
+import sqlite3
+
+import db
+import sync
+from InsertTestData.generate import GenerateReviews
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp_dir.name, 'source.db')
+        self.target = os.path.join(self.tmp_dir.name, 'target.db')
+        self.previous_database = db.DATABASE_NAME
+        db.UseDatabase(self.source)
+        db.InitializeDatabase()
+
+    def tearDown(self):
+        db.CloseDatabaseConnection()
+        db.UseDatabase(self.previous_database)
+        self.tmp_dir.cleanup()
+
+    def rows(self, path):
+        db.UseDatabase(path)
+        try:
+            return db.FetchAllCigarReviews()
+        finally:
+            db.UseDatabase(self.source)
+
+    def sync(self, batch_size=db.CHANGE_BATCH_SIZE):
+        # the target is the current database while it syncs, the source is only read on its own connection
+        db.UseDatabase(self.target)
+        try:
+            db.InitializeDatabase()
+            report = sync.SyncDatabases(self.source, batch_size=batch_size)
+            self.assertEqual(db.DATABASE_NAME, self.target)
+            return report
+        finally:
+            db.UseDatabase(self.source)
+
+    def test_incremental_sync(self):
+        db.BulkAddCigarReviews(GenerateReviews(120, seed=3))
+        first = self.sync(batch_size=50)
+        self.assertEqual((first['changes'], first['batches']), (120, 3))
+        self.assertEqual(self.rows(self.target), self.rows(self.source))
+
+        # the second run only carries what changed since the first
+        db.PatchCigarReview(5, {'rating': 1})
+        db.BulkDeleteCigarReviews({'rating_max': 2})
+        db.AddCigarReview('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, 'Desk', None)
+        second = self.sync(batch_size=50)
+        self.assertLess(second['changes'], 120)
+        self.assertEqual(self.rows(self.target), self.rows(self.source))
+
+        self.assertEqual(self.sync()['changes'], 0)
+
+    def test_source_without_change_log(self):
+        with self.assertRaises(FileNotFoundError):
+            sync.SyncDatabases(os.path.join(self.tmp_dir.name, 'missing.db'))
+        empty = os.path.join(self.tmp_dir.name, 'empty.db')
+        sqlite3.connect(empty).close()
+        with self.assertRaises(ValueError):
+            sync.SyncDatabases(empty)
+
+if __name__ == '__main__':
+    unittest.main()
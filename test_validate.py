@@ -0,0 +1,51 @@
+import unittest
+
+import validate
+
+GOOD = {'brand': 'Padron', 'line': '1964 Anniversary', 'vitola': 'Toro', 'ring_gauge': '50',
+        'country': 'Nicaragua', 'wrapper': 'Maduro', 'binder': '', 'filler': None,
+        'date_smoked': '2024-02-29', 'rating': 5, 'notes': "Cedar and cocoa can't complain",
+        'price_cents': '1500', 'humidor': 'Office', 'tags': 'maduro, box-press'}
+
+class TestValidate(unittest.TestCase):
+    def test_field_validators(self):
+        self.assertTrue(validate.is_valid_integer('-12'))
+        self.assertFalse(validate.is_valid_integer('4.5'))
+        self.assertTrue(validate.is_valid_string("Romeo y Julieta's No 2"))
+        self.assertFalse(validate.is_valid_string('Padron; DROP'))
+        self.assertTrue(validate.is_valid_date('2024-02-29'))
+        self.assertFalse(validate.is_valid_date('2023-02-29'))  # not a leap year
+        self.assertFalse(validate.is_valid_date('2023-2-01'))
+        self.assertTrue(validate.is_valid_date('01/02/2023', format='%d/%m/%Y'))
+        self.assertTrue(validate.is_valid_tags('maduro, box-press'))
+        self.assertFalse(validate.is_valid_tags('maduro,,box-press'))
+
+    def test_validate_record(self):
+        row, errors = validate.validate_record(GOOD)
+        self.assertEqual(errors, [])
+        self.assertEqual(row, ('Padron', '1964 Anniversary', 'Toro', 50, 'Nicaragua', 'Maduro', None, None,
+                               '2024-02-29', 5, "Cedar and cocoa can't complain", 1500, 'Office', 'maduro, box-press'))
+
+        row, errors = validate.validate_record(dict(GOOD, notes='ok', brand='', rating='6', price_cents='-1'))
+        self.assertIsNone(row)
+        self.assertEqual(errors, ['invalid brand', 'invalid rating', 'invalid price_cents'])
+
+    def test_validate_batch(self):
+        records = [dict(GOOD, notes='first'), dict(GOOD, notes='second, with a comma', date_smoked='2024-13-01'), dict(GOOD, ring_gauge='big')]
+        rows, report = validate.validate_batch(records)
+
+        self.assertEqual([row[10] for row in rows], ['first'])
+        self.assertEqual(report, [(1, ['invalid date_smoked', 'invalid notes']), (2, ['invalid ring_gauge'])])
+        self.assertEqual(validate.validate_column('rating', ['1', '5', '0', None]), [2, 3])
+
+    def test_validate_changes(self):
+        changes, errors = validate.validate_changes({'rating': '4', 'wrapper': '', 'price_cents': 900})
+        self.assertEqual(errors, [])
+        self.assertEqual(changes, {'rating': 4, 'wrapper': None, 'price_cents': 900})
+
+        changes, errors = validate.validate_changes({'brand': '', 'rating': '9', 'colour': 'brown'})
+        self.assertIsNone(changes)
+        self.assertEqual(errors, ['invalid brand', 'invalid rating', 'unknown column colour'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import threading
+import sqlite3
+import os
+
+import db
+import writer
+from InsertTestData.generate import GenerateReviews
+
+class TestWriteQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+        self.patch_db_name = patch('db.DATABASE_NAME', self.db_path)
+        self.patch_db_name.start()
+        db.InitializeDatabase()
+
+    def tearDown(self):
+        db.ConfigureBusyTimeout()
+        self.patch_db_name.stop()
+        db.CloseDatabaseConnection()
+        self.tmp_dir.cleanup()
+
+    def test_concurrent_producers_are_group_committed(self):
+        queue = writer.WriteQueue()
+        rows = list(GenerateReviews(400, seed=7))
+        futures = []
+        futures_lock = threading.Lock()
+        def producer(chunk):
+            for row in chunk:
+                future = queue.Add(*row)
+                with futures_lock:
+                    futures.append(future)
+        threads = [threading.Thread(target=producer, args=(rows[start::8],)) for start in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue.Close()
+
+        self.assertTrue(all(future.done() and future.exception() is None for future in futures))
+        self.assertEqual(len(db.FetchAllCigarReviews()), 400)
+        stats = queue.Stats()
+        self.assertEqual((stats['writes'], stats['failed']), (400, 0))
+        self.assertLessEqual(stats['batches'], 400)
+        with self.assertRaises(RuntimeError):
+            queue.Add(*rows[0])
+
+    def test_a_failing_write_does_not_sink_its_batch(self):
+        db.AddCigarReview('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, None, None)
+        stale = db.FetchCigarReviewById(1)[16]
+        db.PatchCigarReview(1, {'notes': 'cedar'})
+
+        queue = writer.WriteQueue()
+        # hold the writer up so all three writes land in one batch
+        gate = threading.Event()
+        queue.Submit(gate.wait)
+        conflict = queue.Patch(1, {'rating': 1}, expected_updated_at=stale)
+        added = queue.Add('Oliva', 'V', 'Robusto', 50, 'Nicaragua', None, None, None, '2023-01-02', 4, None, None, None, None)
+        patched = queue.Patch(1, {'rating': 3})
+        gate.set()
+        queue.Close()
+
+        self.assertIsInstance(conflict.exception(), db.UpdateConflict)
+        self.assertIsNone(added.exception())
+        self.assertEqual(patched.result()[10], 3)
+        self.assertEqual(len(db.FetchAllCigarReviews()), 2)
+
+    def test_busy_database_is_retried_with_backoff(self):
+        db.ConfigureBusyTimeout(0.01)
+        blocker = sqlite3.connect(self.db_path, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+        release = threading.Timer(0.2, blocker.commit)
+        release.start()
+        try:
+            queue = writer.WriteQueue(backoff=0.02)
+            future = queue.Add('Padron', '1964', 'Toro', 50, 'Nicaragua', None, None, None, '2023-01-01', 5, None, None, None, None)
+            self.assertIsNone(future.exception(timeout=10))
+            queue.Close()
+            self.assertGreater(queue.Stats()['retries'], 0)
+        finally:
+            release.join()
+            blocker.close()
+
+        blocker = sqlite3.connect(self.db_path)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            queue = writer.WriteQueue(retries=0)
+            future = queue.Delete(1)
+            self.assertTrue(db.IsBusyError(future.exception(timeout=10)))
+            queue.Close()
+        finally:
+            blocker.rollback()
+            blocker.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,54 +1,214 @@
 import datetime
 import re
+from constants import INSERT_COLUMNS
+
+# patterns are compiled once at import instead of on every call
+INTEGER_PATTERN = re.compile(r"^-?\d+$")
+STRING_PATTERN = re.compile(r"^[A-Za-z0-9\s\-\']+$")
+DATE_PATTERN = re.compile(r'^(\d{4})-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$')
 
 def is_valid_integer(input_string):
     """
     Validate if the input string is a valid integer.
-    
+
     Args:
         input_string (str): The string to validate
-    
+
     Returns:
         bool: True if valid, False otherwise
     """
-    pattern = r"^-?\d+$"
-    return bool(re.match(pattern, input_string))
+    return bool(INTEGER_PATTERN.match(input_string))
 
 def is_valid_string(input_string):
     """
     Validate if the input string contains only letters, numbers, spaces, hyphens, and apostrophes.
-    
+
     Args:
         input_string (str): The string to validate
-    
+
     Returns:
         bool: True if valid, False otherwise
     """
-
-    pattern = r"^[A-Za-z0-9\s\-\']+$"
-    return bool(re.match(pattern, input_string))
+    return bool(STRING_PATTERN.match(input_string))
 
 def is_valid_date(date_string, format="%Y-%m-%d"):
     """
     Validate if the input string is a valid date in the specified format.
     Default format is YYYY-MM-DD (e.g., 2025-09-09).
-    
+
     Args:
         date_string (str): The date string to validate
         format (str): The expected date format (default: %Y-%m-%d)
-    
+
     Returns:
         bool: True if valid, False otherwise
     """
-    # Check if the string matches the expected format using regex
+    # For the default format the regex already split out the parts, so building the date directly
+    # catches impossible days like 2025-02-30 without the cost of strptime
     if format == "%Y-%m-%d":
-        pattern = r'^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$'
-        if not re.match(pattern, date_string):
+        match = DATE_PATTERN.match(date_string)
+        if not match:
+            return False
+        try:
+            datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            return True
+        except ValueError:
             return False
-    
+
     # Try to parse the date
     try:
         datetime.datetime.strptime(date_string, format)
         return True
     except ValueError:
         return False
+
+def is_valid_tags(tags):
+    """
+    Validate a comma separated list of tags, each tag following the is_valid_string rules.
+
+    Args:
+        tags (str): e.g. "maduro,box-press"
+
+    Returns:
+        bool: True if every tag is valid, False otherwise
+    """
+    return all(STRING_PATTERN.match(tag.strip()) for tag in tags.split(','))
+
+def is_valid_rating(input_string):
+    """Validate if the input string is a whole number rating between 1 and 5."""
+    return bool(INTEGER_PATTERN.match(input_string)) and 1 <= int(input_string) <= 5
+
+def is_valid_price(input_string):
+    """Validate if the input string is a non-negative whole number of cents."""
+    return bool(INTEGER_PATTERN.match(input_string)) and int(input_string) >= 0
+
+# rules for the 14 insert fields, the same ones option 1 in main.py enforces:
+# column -> (check, optional, integer), optional fields may be blank and integer fields are converted to int
+FIELD_RULES = {
+    'brand': (is_valid_string, False, False),
+    'line': (is_valid_string, False, False),
+    'vitola': (is_valid_string, False, False),
+    'ring_gauge': (is_valid_integer, False, True),
+    'country': (is_valid_string, False, False),
+    'wrapper': (is_valid_string, True, False),
+    'binder': (is_valid_string, True, False),
+    'filler': (is_valid_string, True, False),
+    'date_smoked': (is_valid_date, False, False),
+    'rating': (is_valid_rating, False, True),
+    'notes': (is_valid_string, True, False),
+    'price_cents': (is_valid_price, True, True),
+    'humidor': (is_valid_string, True, False),
+    'tags': (is_valid_tags, True, False),
+}
+
+def _clean(value):
+    # missing and None values are treated as blank, numbers from JSON are checked as text like typed input
+    return "" if value is None else str(value).strip()
+
+def _to_row(record):
+    # convert an already validated record into an INSERT_QUERY row
+    row = []
+    for column in INSERT_COLUMNS:
+        value = _clean(record.get(column))
+        if value == "":
+            row.append(None)
+        elif FIELD_RULES[column][2]:
+            row.append(int(value))
+        else:
+            row.append(value)
+    return tuple(row)
+
+def validate_record(record):
+    """
+    Validate all 14 insert fields of one record in a single pass.
+
+    Args:
+        record (dict): column name to value, values may be strings or numbers
+
+    Returns:
+        tuple: (row, errors) where row is a tuple in INSERT_QUERY column order with integers converted
+               and blank optional fields set to None, or None when errors (a list of messages) is non-empty
+    """
+    errors = []
+    for column in INSERT_COLUMNS:
+        check, optional, _ = FIELD_RULES[column]
+        value = _clean(record.get(column))
+        if value == "" and optional:
+            continue
+        if value == "" or not check(value):
+            errors.append(f"invalid {column}")
+
+    if errors:
+        return None, errors
+    return _to_row(record), []
+
+def validate_column(column, values):
+    """
+    Validate a whole column of values at once.
+
+    Args:
+        column (str): one of the 14 insert columns
+        values (list): the column's value for every row
+
+    Returns:
+        list: the indexes of the rows whose value is invalid
+    """
+    check, optional, _ = FIELD_RULES[column]
+    invalid = []
+    for index, value in enumerate(values):
+        value = _clean(value)
+        if value == "" and optional:
+            continue
+        if value == "" or not check(value):
+            invalid.append(index)
+    return invalid
+
+def validate_batch(records):
+    """
+    Validate a batch of records column by column.
+
+    Args:
+        records (list): record dicts, column name to value
+
+    Returns:
+        tuple: (rows, report) where rows holds the converted row tuple of every valid record in order
+               and report is a list of (record index, [error messages]) for every invalid record
+    """
+    errors_by_index = {}
+    for column in INSERT_COLUMNS:
+        values = [record.get(column) for record in records]
+        for index in validate_column(column, values):
+            errors_by_index.setdefault(index, []).append(f"invalid {column}")
+
+    rows = [_to_row(record) for index, record in enumerate(records) if index not in errors_by_index]
+    return rows, sorted(errors_by_index.items())
+
+def validate_changes(changes):
+    """
+    Validate a partial record, e.g. the fields of an edit.
+
+    Args:
+        changes (dict): column name to new value for some of the 14 insert fields
+
+    Returns:
+        tuple: (converted, errors) where converted maps each column to its value with integers converted
+               and blank optional fields set to None, or is None when errors (a list of messages) is non-empty
+    """
+    errors = []
+    converted = {}
+    for column, value in changes.items():
+        if column not in FIELD_RULES:
+            errors.append(f"unknown column {column}")
+            continue
+        check, optional, integer = FIELD_RULES[column]
+        value = _clean(value)
+        if value == "" and optional:
+            converted[column] = None
+        elif value == "" or not check(value):
+            errors.append(f"invalid {column}")
+        else:
+            converted[column] = int(value) if integer else value
+
+    if errors:
+        return None, errors
+    return converted, []
@@ -0,0 +1,165 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+import db
+from constants import WRITE_BATCH_SIZE, WRITE_RETRIES, WRITE_RETRY_BACKOFF, WRITE_RETRY_MAX_BACKOFF
+
+# Single-writer queue for processes where many threads write to the ledger, e.g.
+#
+#   future = writer.GetWriter().Submit(db.AddCigarReview, 'Padron', ...)
+#   future.result()                        # wait for the commit, or raises what AddCigarReview raised
+#
+# SQLite allows one writer at a time, so threads that each write on their own connection just queue up on the
+# database lock (and fail with "database is locked" once BUSY_TIMEOUT runs out). Here every write is handed to
+# one dedicated thread instead. It takes whatever has queued up, up to batch_size writes, and runs them all in
+# one BEGIN IMMEDIATE transaction, so a burst of writes costs one commit (group commit). Each write runs inside
+# its own SAVEPOINT, so one that fails is rolled back on its own and the rest of the batch still commits.
+# If the lock is held by another process for longer than BUSY_TIMEOUT, the batch is retried with exponential
+# backoff before its writes are failed.
+
+
+class _Write:
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteQueue:
+    """One writer thread that drains a queue of db.py write calls and group-commits them."""
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, retries=WRITE_RETRIES, backoff=WRITE_RETRY_BACKOFF,
+                 max_backoff=WRITE_RETRY_MAX_BACKOFF, max_pending=0):
+        if batch_size < 1 or retries < 0:
+            raise ValueError("batch_size must be at least 1 and retries cannot be negative")
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # max_pending > 0 makes Submit block while that many writes are waiting, so producers cannot outrun the disk
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._lock = threading.Lock()
+        self.stats = {'writes': 0, 'failed': 0, 'batches': 0, 'retries': 0}
+        self._thread = threading.Thread(target=self._Run, name="myleafledger-writer", daemon=True)
+        self._thread.start()
+
+    def Submit(self, function, *args, **kwargs):
+        """Queue function(*args, **kwargs), normally a db.py write function, and return a Future for its result."""
+        write = _Write(function, args, kwargs)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The write queue has been closed")
+            self._queue.put(write)
+        return write.future
+
+    def Add(self, *row):
+        return self.Submit(db.AddCigarReview, *row)
+
+    def Patch(self, id, changes, expected_updated_at=None):
+        return self.Submit(db.PatchCigarReview, id, changes, expected_updated_at)
+
+    def Delete(self, id):
+        return self.Submit(db.DeleteCigarReview, id)
+
+    def Close(self):
+        """Stop accepting writes, commit everything already queued and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def Stats(self):
+        """Return the counters: writes, failed, batches, retries and the average batch size."""
+        stats = dict(self.stats)
+        stats['average_batch'] = round(stats['writes'] / stats['batches'], 2) if stats['batches'] else 0.0
+        return stats
+
+    def _Run(self):
+        try:
+            while True:
+                write = self._queue.get()
+                if write is None:
+                    return
+                batch = [write]
+                stop = False
+                # take whatever else is already waiting, never wait for more, so a lone write is committed at once
+                while len(batch) < self.batch_size:
+                    try:
+                        write = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if write is None:
+                        stop = True
+                        break
+                    batch.append(write)
+                self._Commit(batch)
+                if stop:
+                    return
+        finally:
+            db.CloseThreadConnection()
+
+    def _Commit(self, batch):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            outcomes = []
+            try:
+                with db.Transaction() as cursor:
+                    # take the write lock up front, a deferred transaction could otherwise fail half way through
+                    cursor.execute("BEGIN IMMEDIATE")
+                    for write in batch:
+                        cursor.execute("SAVEPOINT queued_write")
+                        try:
+                            outcomes.append((True, write.function(*write.args, **write.kwargs)))
+                        except Exception as e:
+                            if db.IsBusyError(e):
+                                raise
+                            cursor.execute("ROLLBACK TO queued_write")
+                            outcomes.append((False, e))
+                        cursor.execute("RELEASE queued_write")
+            except Exception as e:
+                if db.IsBusyError(e) and attempt < self.retries:
+                    self.stats['retries'] += 1
+                    # jitter so writers in other processes that backed off together do not retry together
+                    time.sleep(delay * random.uniform(0.5, 1.5))
+                    delay = min(delay * 2, self.max_backoff)
+                    continue
+                for write in batch:
+                    write.future.set_exception(e)
+                self.stats['failed'] += len(batch)
+                return
+
+            self.stats['batches'] += 1
+            for write, (ok, outcome) in zip(batch, outcomes):
+                if ok:
+                    write.future.set_result(outcome)
+                    self.stats['writes'] += 1
+                else:
+                    write.future.set_exception(outcome)
+                    self.stats['failed'] += 1
+            return
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def GetWriter():
+    """Return the shared write queue, starting it with the default settings on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteQueue()
+        return _writer
+
+def CloseWriter():
+    """Commit the queued writes and stop the shared writer thread (a later GetWriter starts a new one)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.Close()